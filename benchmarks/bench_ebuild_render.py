@@ -0,0 +1,81 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark rendering a distro's worth of ebuilds with Ebuild.get_ebuild_text.
+
+rosdep lookups are replaced with a constant resolution, so only the
+rendering itself is measured. Run from the repository root, with
+superflore installed, or with:
+    PYTHONPATH=. python benchmarks/bench_ebuild_render.py [count]
+"""
+
+import random
+import sys
+import time
+from unittest import mock
+
+from superflore.generators.ebuild.ebuild import Ebuild
+
+ros_pkgs = ['pkg_%d' % i for i in range(300)]
+system_pkgs = ['boost', 'eigen', 'libxml2', 'python-yaml', 'qt5', 'gtest']
+
+
+def make_ebuild(rng, i):
+    ebuild = Ebuild()
+    ebuild.name = 'pkg_%d' % i
+    ebuild.distro = 'melodic'
+    ebuild.description = 'The (%s) package: "does" [things] {quickly}' \
+        % ebuild.name * rng.randint(1, 4)
+    ebuild.src_uri = 'https://github.com/ros-gbp/%s-release/archive/' \
+        'release/melodic/%s/1.0.0-0.tar.gz' % (ebuild.name, ebuild.name)
+    ebuild.upstream_license = [rng.choice(['BSD', 'Apache 2.0', 'LGPL'])]
+    ebuild.add_keyword('amd64')
+    ebuild.add_keyword('x86')
+    for dep in rng.sample(ros_pkgs, rng.randint(0, 15)):
+        ebuild.add_build_depend(dep)
+        ebuild.add_run_depend(dep)
+    for dep in rng.sample(system_pkgs, rng.randint(0, 4)):
+        ebuild.add_build_depend(dep, False)
+        ebuild.add_run_depend(dep, False)
+    for dep in rng.sample(ros_pkgs, rng.randint(0, 3)):
+        ebuild.add_test_depend(dep)
+    return ebuild
+
+
+def resolve_dep(pkg, os, distro=None):
+    return ['dev-libs/' + pkg], 'portage', 'portage'
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    rng = random.Random(0)
+    ebuilds = [make_ebuild(rng, i) for i in range(count)]
+    with mock.patch(
+        'superflore.generators.ebuild.ebuild.resolve_dep', resolve_dep
+    ):
+        start = time.perf_counter()
+        size = 0
+        for ebuild in ebuilds:
+            size += len(ebuild.get_ebuild_text(
+                'Open Source Robotics Foundation', 'BSD'
+            ))
+        elapsed = time.perf_counter() - start
+    print('rendered {0} ebuilds ({1} bytes) in {2:.3f}s'.format(
+        count, size, elapsed
+    ))
+
+
+if __name__ == '__main__':
+    main()
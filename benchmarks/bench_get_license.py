@@ -0,0 +1,60 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Micro-benchmark for superflore.utils.get_license.
+
+Run from the repository root, with superflore installed, or with:
+    PYTHONPATH=. python benchmarks/bench_get_license.py
+"""
+
+import timeit
+
+from superflore.utils import _classify_license
+from superflore.utils import get_license
+
+# license strings as they show up in package.xml files, with the
+# common ones repeated the way they are across a distro
+licenses = [
+    'BSD', 'BSD', 'BSD', 'BSD', 'Apache 2.0', 'Apache License 2.0',
+    'LGPLv2.1', 'GPL', 'GNU GPLv3', 'MIT', 'Mozilla Public License',
+    'CC BY-NC-SA 4.0', 'BoostSoftwareLicense Version1.0',
+    'Public Domain', 'Creative Commons', 'BSD License 2.0',
+    'GNU Lesser Public License 2.1',
+]
+
+
+def classify_uncached():
+    for license_str in licenses:
+        _classify_license.__wrapped__(license_str)
+
+
+def classify_cached():
+    for license_str in licenses:
+        get_license(license_str)
+
+
+def main():
+    number = 2000
+    for name, func in [
+        ('uncached', classify_uncached), ('memoized', classify_cached)
+    ]:
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        print('{0:>10}: {1:.2f} us per license'.format(
+            name, best / (number * len(licenses)) * 1e6
+        ))
+
+
+if __name__ == '__main__':
+    main()
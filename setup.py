@@ -3,8 +3,8 @@
 import sys
 from setuptools import find_packages, setup
 
-if sys.version_info < (3, 0):
-    sys.exit('Sorry, Python < 3.0 is not supported')
+if sys.version_info < (3, 5):
+    sys.exit('Sorry, Python < 3.5 is not supported')
 
 install_requires = [
     'xmltodict',
@@ -19,7 +19,9 @@ install_requires = [
     'pyyaml',
     'pygithub',
     'catkin_pkg >= 0.4.0',
-    'bs4'
+    'bs4',
+    # hashlib only has blake2b from Python 3.6 on
+    'pyblake2; python_version < "3.6"',
 ]
 
 setup(
@@ -31,7 +33,7 @@ setup(
     url='https://github.com/ros-infrastructure/superflore',
     keywords=['ROS'],
     install_requires=install_requires,
-    python_requires='>=3',
+    python_requires='>=3.5',
     classifiers=['Programming Language :: Python',
                  'License :: OSI Approved :: Apache Software License'],
     description='Super Bloom',
@@ -42,6 +44,8 @@ setup(
             'superflore-gen-ebuilds = superflore.generators.ebuild:main',
             'superflore-gen-oe-recipes = superflore.generators.bitbake:main',
             'superflore-check-ebuilds = superflore.test_integration.gentoo:main',
+            'superflore-oe-layer-index = '
+            'superflore.generators.bitbake.layer_index:main',
         ]
     }
 )
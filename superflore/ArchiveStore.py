@@ -0,0 +1,388 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import threading
+
+from superflore.CacheManager import SqliteCache
+from superflore.DigestService import get_digest_service
+from superflore.DownloadManager import get_download_manager
+from superflore.FileLock import FileLock
+from superflore.utils import info
+
+
+def scan_files(directory):
+    """
+    Return (name, size) for each file in the directory, least recently
+    used (modified) first.
+    """
+    entries = list()
+    for entry in os.scandir(directory):
+        try:
+            st = entry.stat()
+        except FileNotFoundError:
+            # evicted by another process
+            continue
+        if entry.is_file():
+            entries.append((st.st_mtime, entry.name, st.st_size))
+    entries.sort()
+    return [(name, size) for _, name, size in entries]
+
+
+def evict_files(directory, max_size, keep=()):
+    """
+    Remove the least recently used files of the directory, except those
+    named in keep, until they take at most max_size bytes.
+    Returns the number of files removed.
+    """
+    files = scan_files(directory)
+    size = sum(size for _, size in files)
+    evictions = 0
+    for name, file_size in files:
+        if size <= max_size:
+            break
+        if name in keep:
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+            evictions += 1
+        except FileNotFoundError:
+            # another process evicted it first
+            pass
+        size -= file_size
+    return evictions
+
+
+class ArchiveStore(object):
+    """
+    Content-addressed store of source archives.
+
+    Archives are kept in objects/, named after their sha256, and an
+    index maps each url to the digest of what it served. Identical
+    tarballs (such as a release shipped by several distros) are stored
+    once, and a url seen before is not downloaded again as long as its
+    archive, or its digests, are still around. When max_size (in bytes)
+    is set, the least recently used archives are evicted to stay within
+    it; their urls stay in the index.
+
+    Several processes can share a store: the index is a sqlite database,
+    each url is stored under a lease (a lock file), and the modification
+    time of an archive records when it was last used.
+
+    Older versions kept the archives directly in the root, under names
+    like <pkg>-<version>-<distro>.tar.gz; see migrate.
+    """
+    index_name = 'archive_index.sqlite'
+    legacy_suffix = '.tar.gz'
+    # index key of the migrated archives whose url is not known yet:
+    # legacy name -> (sha256, size)
+    legacy_key = ('legacy',)
+
+    def __init__(self, root, max_size=None, jobs=None):
+        self.root = root
+        self.max_size = max_size
+        self.jobs = jobs
+        self.objects_dir = os.path.join(root, 'objects')
+        self.incoming_dir = os.path.join(root, 'incoming')
+        self.pool = ThreadPoolExecutor(max_workers=jobs or 4)
+        self.lock = threading.Lock()
+        self.url_locks = dict()
+        # url -> (sha256, size)
+        self.urls = None
+        # sha256 -> size, least recently used first
+        self.archives = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.duplicates = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+        self.load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        self.report()
+
+    def load(self):
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        self.urls = SqliteCache(os.path.join(self.root, self.index_name))
+        self.scan()
+        with self.lock:
+            self.evict()
+
+    def scan(self):
+        """List the archives in the store, least recently used first."""
+        archives = OrderedDict(scan_files(self.objects_dir))
+        with self.lock:
+            self.archives = archives
+            self.size = sum(self.archives.values())
+
+    def close(self):
+        self.pool.shutdown()
+        # account for what other processes stored in the meantime
+        self.scan()
+        with self.lock:
+            self.evict()
+        self.urls.close()
+
+    def migrate(self, caches, get_legacy_urls):
+        """
+        Move the archives stored under their legacy names into objects/,
+        and rekey their digests in caches (a dict mapping hashlib names
+        to dicts keyed by path) from the old paths to the new ones.
+
+        get_legacy_urls returns a dict mapping legacy names to the urls
+        the archives came from. It is only called if some migrated
+        archive is still waiting for its url; archives of distros it
+        does not cover wait for a later run.
+        """
+        # only one process migrates the archives
+        with FileLock(os.path.join(self.incoming_dir, 'legacy.lease')):
+            legacy = self.urls.get(self.legacy_key, dict())
+            names = self._get_legacy_names(caches)
+            for name in names:
+                entry = self._migrate_archive(name, caches)
+                if entry:
+                    legacy[name] = entry
+            if names:
+                info('Migrated %d archives into the archive store' % len(
+                    names
+                ))
+                # the moved archives keep their modification times
+                self.scan()
+            if legacy:
+                for name, url in get_legacy_urls().items():
+                    entry = legacy.pop(name, None)
+                    if entry and url not in self.urls:
+                        self.urls[url] = entry
+            if legacy:
+                self.urls[self.legacy_key] = legacy
+            elif self.legacy_key in self.urls:
+                del self.urls[self.legacy_key]
+            self.urls.flush()
+        with self.lock:
+            self.evict()
+
+    def _get_legacy_path(self, name):
+        # as older versions named them
+        return self.root + '/' + name
+
+    def _get_legacy_names(self, caches):
+        """
+        Return the legacy names of the archives in the root, and of
+        those which are only left in caches.
+        """
+        names = set(
+            name for name in os.listdir(self.root)
+            if name.endswith(self.legacy_suffix) and
+            os.path.isfile(os.path.join(self.root, name))
+        )
+        prefix = self._get_legacy_path('')
+        for cache in caches.values():
+            for key in cache:
+                if isinstance(key, str) and key.startswith(prefix) and \
+                        key.endswith(self.legacy_suffix) and \
+                        '/' not in key[len(prefix):]:
+                    names.add(key[len(prefix):])
+        return sorted(names)
+
+    def _migrate_archive(self, name, caches):
+        """
+        Move the archive into objects/, and return its sha256 and size,
+        or None if neither it nor its sha256 is around anymore. The size
+        of an archive only left in caches is unknown (0).
+        """
+        old_path = self._get_legacy_path(name)
+        old_digests = {
+            algorithm: cache.pop(old_path)
+            for algorithm, cache in caches.items() if old_path in cache
+        }
+        if os.path.isfile(old_path):
+            size, digests = get_digest_service().digest(
+                old_path, set(caches) | {'sha256'}
+            )
+            digest = digests['sha256']
+            path = self.get_path(digest)
+            if os.path.isfile(path):
+                os.remove(old_path)
+            else:
+                os.replace(old_path, path)
+        elif 'sha256' in old_digests:
+            size, digests = 0, old_digests
+            digest = digests['sha256']
+            path = self.get_path(digest)
+        else:
+            return None
+        for algorithm, cache in caches.items():
+            if algorithm in digests:
+                cache[path] = digests[algorithm]
+        return digest, size
+
+    def report(self):
+        info(
+            'Archive store: %d hits, %d downloads (%d duplicates), '
+            '%.1f MiB saved, %d evictions, %.1f MiB in use' % (
+                self.hits, self.misses, self.duplicates,
+                self.bytes_saved / (1 << 20), self.evictions,
+                self.size / (1 << 20)
+            )
+        )
+
+    def get_path(self, digest):
+        return os.path.join(self.objects_dir, digest)
+
+    def lookup(self, url):
+        """Return the path for the archive at url, if the url is known."""
+        known = self.urls.get(url)
+        return self.get_path(known[0]) if known else None
+
+    def get(self, url, caches=None):
+        """
+        Return the path for the archive at url, filling caches (a dict
+        mapping hashlib names to dicts keyed by path) with its digests.
+        The archive itself may have been evicted, if its digests were
+        already cached.
+        """
+        return self._get(url, caches or dict(), False)
+
+    def fetch(self, url, caches=None):
+        """Like get, but make sure the archive is in the store."""
+        return self._get(url, caches or dict(), True)
+
+    def prefetch(self, urls, caches=None):
+        """
+        Start getting the archives in the background, under the same
+        leases as get, so no archive is downloaded twice.
+        """
+        for url in urls:
+            self.pool.submit(self.get, url, caches)
+
+    def evict(self, keep=None):
+        """
+        Evict the least recently used archives, down to max_size.
+        The caller holds the lock.
+        """
+        if self.max_size is None:
+            return
+        for digest, size in list(self.archives.items()):
+            if self.size <= self.max_size:
+                break
+            if digest == keep:
+                continue
+            try:
+                os.remove(self.get_path(digest))
+                self.evictions += 1
+            except FileNotFoundError:
+                # another process evicted it first
+                pass
+            del self.archives[digest]
+            self.size -= size
+
+    def _cached(self, path, caches):
+        return all(path in cache for cache in caches.values())
+
+    def _get_incoming(self, url):
+        return os.path.join(
+            self.incoming_dir, hashlib.sha256(url.encode()).hexdigest()
+        )
+
+    def _get_url_lock(self, url):
+        with self.lock:
+            return self.url_locks.setdefault(url, threading.Lock())
+
+    def _get(self, url, caches, need_file):
+        # only one thread stores a given url
+        with self._get_url_lock(url):
+            path = self._get_stored(url, caches, need_file)
+            if path:
+                return path
+            # and only one process
+            with FileLock(self._get_incoming(url) + '.lease'):
+                # which may have stored it while we waited
+                path = self._get_stored(url, caches, need_file)
+                if path:
+                    return path
+                return self._store(url, caches)
+
+    def _get_stored(self, url, caches, need_file):
+        path = self.lookup(url)
+        if not path:
+            return None
+        if not os.path.isfile(path):
+            if need_file or not self._cached(path, caches):
+                return None
+        missing = {
+            name: cache for name, cache in caches.items() if path not in cache
+        }
+        if missing:
+            try:
+                get_digest_service().update_caches(path, missing)
+            except FileNotFoundError:
+                # evicted by another process
+                return None
+        self._touch(path)
+        digest, size = self.urls[url]
+        with self.lock:
+            self.hits += 1
+            self.bytes_saved += size
+            if digest in self.archives:
+                self.archives.move_to_end(digest)
+        return path
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def _store(self, url, caches):
+        incoming = self._get_incoming(url)
+        info("downloading archive from %s..." % url)
+        get_download_manager(self.jobs).download(url, incoming)
+        size, digests = get_digest_service().digest(
+            incoming, set(caches) | {'sha256'}
+        )
+        digest = digests['sha256']
+        path = self.get_path(digest)
+        # another url may have served the very same archive
+        duplicate = os.path.isfile(path)
+        if duplicate:
+            os.remove(incoming)
+        else:
+            os.replace(incoming, path)
+        self._touch(path)
+        self.urls[url] = (digest, size)
+        # let the other processes know right away
+        self.urls.flush()
+        with self.lock:
+            self.misses += 1
+            if duplicate:
+                self.duplicates += 1
+                self.bytes_saved += size
+            if digest in self.archives:
+                self.archives.move_to_end(digest)
+            else:
+                self.archives[digest] = size
+                self.size += size
+            self.evict(keep=digest)
+        for name, cache in caches.items():
+            cache[path] = digests[name]
+        return path
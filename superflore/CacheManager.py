@@ -12,30 +12,191 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections.abc import MutableMapping
 import os
 import pickle
+import sqlite3
+import threading
 
+from superflore.FileLock import FileLock
 from superflore.utils import info
 
+_sqlite_header = b'SQLite format 3\x00'
+
+
+def _dumps(obj):
+    return pickle.dumps(obj, protocol=4)
+
+
+class SqliteCache(MutableMapping):
+    """
+    A dict backed by a sqlite database. Entries are read on demand,
+    and new ones are written in batches of batch_size, each in its own
+    transaction. A batch is also written once it is flush_interval
+    seconds old (unless that is None), so a crash only loses the last,
+    incomplete batch of the last few seconds.
+    Keys and values are pickled.
+    """
+    def __init__(self, filename, batch_size=256, flush_interval=5):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        self.loaded = dict()
+        self.pending = dict()
+        self.timer = None
+        # wait for other processes writing to the same database
+        self.conn = sqlite3.connect(
+            filename, timeout=60, check_same_thread=False
+        )
+        with self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache '
+                '(key BLOB PRIMARY KEY, value BLOB)'
+            )
+
+    def __getitem__(self, key):
+        with self.lock:
+            if key in self.pending:
+                return self.pending[key]
+            if key in self.loaded:
+                return self.loaded[key]
+            row = self.conn.execute(
+                'SELECT value FROM cache WHERE key = ?', (_dumps(key),)
+            ).fetchone()
+            if row is None:
+                raise KeyError(key)
+            value = self.loaded[key] = pickle.loads(row[0])
+            return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.pending[key] = value
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+            elif self.timer is None and self.flush_interval is not None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def __delitem__(self, key):
+        with self.lock:
+            self.flush()
+            cursor = self.conn.execute(
+                'DELETE FROM cache WHERE key = ?', (_dumps(key),)
+            )
+            self.conn.commit()
+            self.loaded.pop(key, None)
+            if not cursor.rowcount:
+                raise KeyError(key)
+
+    def __iter__(self):
+        with self.lock:
+            self.flush()
+            keys = [
+                pickle.loads(row[0])
+                for row in self.conn.execute('SELECT key FROM cache')
+            ]
+        return iter(keys)
+
+    def __len__(self):
+        with self.lock:
+            self.flush()
+            row = self.conn.execute('SELECT COUNT(*) FROM cache').fetchone()
+            return row[0]
+
+    def clear(self):
+        """Remove every entry at once."""
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM cache')
+            self.loaded = dict()
+            self.pending = dict()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+    def update_many(self, items):
+        """Write the (key, value) pairs in a single transaction."""
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?)',
+                ((_dumps(key), _dumps(value)) for key, value in items)
+            )
+
+    def flush(self):
+        """Write the pending entries."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.pending:
+                return
+            self.update_many(self.pending.items())
+            self.loaded.update(self.pending)
+            self.pending = dict()
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.conn.close()
+
+
+def _is_sqlite(filename):
+    with open(filename, 'rb') as cache_file:
+        return cache_file.read(len(_sqlite_header)) == _sqlite_header
+
+
+def _load_legacy(filename):
+    """
+    Return the dict pickled in a cache written by older versions, or an
+    empty dict if the file is not one (such as an empty or truncated
+    file left behind by a crash).
+    """
+    try:
+        with open(filename, 'rb') as cache_file:
+            legacy = pickle.load(cache_file)
+    except Exception:
+        # unpickling garbage can raise about anything
+        return dict()
+    return legacy if isinstance(legacy, dict) else dict()
+
 
 class CacheManager:
-    def __init__(self, filename):
+    """
+    Opens a SqliteCache at filename, importing (then removing) the
+    pickled dict an older version left at legacy_filename, if any.
+    Without a filename, the cache is a dict that only lasts for the run.
+    """
+    def __init__(self, filename, legacy_filename=None):
         self.filename = filename
+        self.legacy_filename = legacy_filename
         self.cache = dict()
 
     def __enter__(self):
-        # load the initial cache, if it exists
-        if self.filename and os.path.isfile(self.filename):
+        if self.filename:
             info("Loading cached file '%s'" % self.filename)
-            self.cache_file = open(self.filename, 'rb')
-            self.cache = pickle.load(self.cache_file)
-            self.cache_file.close()
+            # one process at a time converts or creates the database
+            with FileLock(self.filename + '.lock'):
+                self.cache = self._open()
         return self.cache
 
     def __exit__(self, *args):
-        # save the cache, if it exists
+        # save the rest of the cache
         if self.filename:
             info("Saving cached file '%s'" % self.filename)
-            self.cache_file = open(self.filename, 'wb')
-            pickle.dump(self.cache, self.cache_file)
-            self.cache_file.close()
+            self.cache.close()
+
+    def _open(self):
+        legacy = dict()
+        if os.path.isfile(self.filename) and not _is_sqlite(self.filename):
+            # truncated by a crash, or a pickle written under this name
+            legacy.update(_load_legacy(self.filename))
+            os.remove(self.filename)
+        if self.legacy_filename and os.path.isfile(self.legacy_filename):
+            info("Converting cached file '%s'" % self.legacy_filename)
+            legacy.update(_load_legacy(self.legacy_filename))
+            os.remove(self.legacy_filename)
+        cache = SqliteCache(self.filename)
+        if legacy:
+            cache.update_many(legacy.items())
+        return cache
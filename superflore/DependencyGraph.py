@@ -0,0 +1,81 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from catkin_pkg.package import InvalidPackage
+from catkin_pkg.package import parse_package_string
+
+depend_types = [
+    'buildtool', 'build', 'build_export', 'buildtool_export',
+    'exec', 'run', 'test', 'doc',
+]
+
+_dependency_graphs = dict()
+_dependency_graphs_lock = threading.Lock()
+
+
+def get_dependency_graph(distro):
+    """
+    Return the DependencyGraph for the distro, building it only once,
+    so the ebuild and bitbake generators can share it.
+    """
+    with _dependency_graphs_lock:
+        graph = _dependency_graphs.get(distro.name)
+        if graph is None or graph.distro is not distro:
+            graph = DependencyGraph(distro)
+            _dependency_graphs[distro.name] = graph
+        return graph
+
+
+class DependencyGraph(object):
+    """
+    Dependencies of every type for the packages of a ROS distro.
+    Each package.xml is parsed once, extracting all dependency types
+    in the same pass, so lookups afterwards are dictionary accesses.
+    """
+    def __init__(self, distro):
+        self.distro = distro
+        self.depends = dict()
+
+    def _parse_package(self, pkg_name):
+        pkg_xml = self.distro.get_release_package_xml(pkg_name)
+        try:
+            pkg = parse_package_string(pkg_xml)
+        except InvalidPackage as e:
+            raise InvalidPackage(pkg_name + ': %s' % str(e))
+        return {
+            depend_type: frozenset(
+                d.name for d in getattr(pkg, depend_type + '_depends')
+                if d.evaluated_condition is not False
+            ) for depend_type in depend_types
+        }
+
+    def build(self, pkg_names=None):
+        """Extract the dependencies for the packages in one go."""
+        for pkg_name in pkg_names or self.distro.release_packages.keys():
+            self.get_all_depends(pkg_name)
+        return self
+
+    def get_all_depends(self, pkg_name):
+        """Return a dict mapping each dependency type to its packages."""
+        if pkg_name not in self.depends:
+            if pkg_name not in self.distro.release_packages:
+                raise KeyError("Package '%s' not found" % pkg_name)
+            self.depends[pkg_name] = self._parse_package(pkg_name)
+        return self.depends[pkg_name]
+
+    def get_depends(self, pkg_name, depend_type):
+        """Return the set of package names the package depends on."""
+        return self.get_all_depends(pkg_name)[depend_type]
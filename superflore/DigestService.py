@@ -0,0 +1,118 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import hashlib
+import os
+import threading
+
+_chunk_size = 1 << 20
+
+_digest_service = None
+_digest_service_lock = threading.Lock()
+
+
+def get_digest_service():
+    """Return the digest service shared by the generators."""
+    global _digest_service
+    with _digest_service_lock:
+        if _digest_service is None:
+            _digest_service = DigestService()
+        return _digest_service
+
+
+def new_hash(name):
+    """
+    Return a new hash object for the algorithm, like hashlib.new, but
+    taking blake2b from pyblake2 where hashlib lacks it (Python 3.5).
+    """
+    try:
+        return hashlib.new(name)
+    except ValueError:
+        if name != 'blake2b':
+            raise
+    import pyblake2
+    return pyblake2.blake2b()
+
+
+def hash_file(path, algorithms):
+    """
+    Read the file once, in chunks, updating a hash for each of the
+    algorithms (hashlib names). Returns the size of the file and a
+    dict mapping each algorithm to its hex digest.
+    """
+    hashes = [(name, new_hash(name)) for name in algorithms]
+    size = 0
+    buf = bytearray(_chunk_size)
+    view = memoryview(buf)
+    with open(path, 'rb') as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            size += n
+            for _, h in hashes:
+                h.update(view[:n])
+    return size, {name: h.hexdigest() for name, h in hashes}
+
+
+class DigestService(object):
+    """
+    Hashes archives on a thread pool (hashlib releases the GIL while
+    hashing). Each archive is read once for all the requested digests,
+    and requests for an archive that is already being hashed share the
+    result, as long as the file did not change since. Once hashed, the
+    archive is forgotten: its digests belong in the callers' caches.
+    """
+    def __init__(self, jobs=None):
+        self.pool = ThreadPoolExecutor(max_workers=jobs or os.cpu_count())
+        self.lock = threading.Lock()
+        # (path, algorithms) -> (mtime, size, future), until resolved
+        self.futures = dict()
+
+    def submit(self, path, algorithms):
+        """Return a future for the size and digests of the file."""
+        algorithms = tuple(sorted(algorithms))
+        st = os.stat(path)
+        key = (path, algorithms)
+        with self.lock:
+            known = self.futures.get(key)
+            if known and known[:2] == (st.st_mtime_ns, st.st_size):
+                return known[2]
+            future = self.pool.submit(hash_file, path, algorithms)
+            self.futures[key] = (st.st_mtime_ns, st.st_size, future)
+        # outside of the lock, as a resolved future calls back right away
+        future.add_done_callback(partial(self._forget, key))
+        return future
+
+    def _forget(self, key, future):
+        with self.lock:
+            known = self.futures.get(key)
+            if known and known[2] is future:
+                del self.futures[key]
+
+    def digest(self, path, algorithms):
+        """Return the size and digests of the file."""
+        return self.submit(path, algorithms).result()
+
+    def update_caches(self, path, caches):
+        """
+        Fill the caches, a dict mapping hashlib names to dicts keyed by
+        path (such as the md5 and sha256 caches of the bitbake generator).
+        """
+        _, digests = self.digest(path, caches.keys())
+        for name, cache in caches.items():
+            cache[path] = digests[name]
+        return digests
@@ -0,0 +1,79 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from rosinstall_generator.distro import get_package_names
+
+_distro_indices = dict()
+_distro_indices_lock = threading.Lock()
+
+
+def get_distro_index(distro):
+    """Return the DistroIndex for the distro, building it only once."""
+    with _distro_indices_lock:
+        index = _distro_indices.get(distro.name)
+        if index is None or index.distro is not distro:
+            index = DistroIndex(distro)
+            _distro_indices[distro.name] = index
+        return index
+
+
+class DistroIndex(object):
+    """
+    Package names, versions and repositories of a ROS distro,
+    computed once instead of for every package.
+    """
+    def __init__(self, distro):
+        self.distro = distro
+        self.name = distro.name
+        released, unreleased = get_package_names(distro)
+        self.package_names = frozenset(released)
+        self.unreleased_package_names = frozenset(unreleased)
+        self.repositories = dict()
+        self.versions = dict()
+        self.oe_versions = dict()
+        for pkg_name in released:
+            repo_name = distro.release_packages[pkg_name].repository_name
+            repo = distro.repositories[repo_name].release_repository
+            self.repositories[pkg_name] = repo_name
+            self.versions[pkg_name] = self.split_version(repo.version)
+            self.oe_versions[pkg_name] =\
+                self.split_version(repo.version, is_oe=True)
+
+    def __contains__(self, pkg_name):
+        return pkg_name in self.package_names
+
+    @staticmethod
+    def split_version(version, is_oe=False):
+        maj_min_patch, deb_inc = version.split('-')
+        if deb_inc != '0':
+            return '{0}-{1}{2}'.format(
+                maj_min_patch, '' if is_oe else 'r', deb_inc
+            )
+        return maj_min_patch
+
+    def get_version(self, pkg_name, is_oe=False):
+        versions = self.oe_versions if is_oe else self.versions
+        if pkg_name in versions:
+            return versions[pkg_name]
+        # not released, so ask the distro directly
+        pkg = self.distro.release_packages[pkg_name]
+        repo = self.distro.repositories[pkg.repository_name].release_repository
+        return self.split_version(repo.version, is_oe)
+
+    def get_repository_name(self, pkg_name):
+        if pkg_name in self.repositories:
+            return self.repositories[pkg_name]
+        return self.distro.release_packages[pkg_name].repository_name
@@ -0,0 +1,200 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from superflore.cache_dir import get_cache_dir
+from superflore.exceptions import DownloadFailed
+from superflore.FileLock import FileLock
+from superflore.utils import info
+from superflore.utils import warn
+import urllib3
+
+_content_range_re = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+# server errors worth retrying
+_retry_statuses = (500, 502, 503, 504)
+
+_download_manager = None
+_download_manager_lock = threading.Lock()
+
+
+def get_download_manager(jobs=None):
+    """
+    Return the download manager shared by the generators, creating it
+    with jobs concurrent downloads on the first call.
+    """
+    global _download_manager
+    with _download_manager_lock:
+        if _download_manager is None:
+            _download_manager = DownloadManager(jobs or 4)
+        return _download_manager
+
+
+class DownloadManager(object):
+    """
+    Downloads archives concurrently over a pooled HTTP session.
+    Each archive is written to '<path>.part' and renamed into place only
+    once its size matches what the server announced, so a partial
+    download never looks like a valid archive. Interrupted downloads
+    are resumed with Range requests; failed connections and server
+    errors are retried up to retries times, backing off exponentially
+    from backoff seconds. Each download holds a lease (a lock
+    file in lock_dir, by default in the cache directory), so processes
+    sharing a directory download each archive only once.
+    """
+    def __init__(
+        self, jobs=4, timeout=(10, 60), retries=3, backoff=0.5, lock_dir=None
+    ):
+        self.jobs = max(jobs, 1)
+        self.lock_dir = lock_dir
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        # the retries are left to _download_part, which resumes
+        adapter = HTTPAdapter(
+            pool_connections=self.jobs, pool_maxsize=self.jobs
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.pool = ThreadPoolExecutor(max_workers=self.jobs)
+        self.lock = threading.Lock()
+        # path -> future
+        self.futures = dict()
+        self.downloaded = 0
+        self.resumed = 0
+
+    def submit(self, url, path):
+        """
+        Start downloading url to path, unless it is already there (or on
+        its way). Returns a future for the path.
+        """
+        with self.lock:
+            future = self.futures.get(path)
+            if future and not future.done():
+                return future
+            if future and not future.exception() and os.path.isfile(path):
+                return future
+            if os.path.isfile(path):
+                future = Future()
+                future.set_result(path)
+            else:
+                future = self.pool.submit(self._download, url, path)
+            self.futures[path] = future
+            return future
+
+    def prefetch(self, downloads):
+        """Start downloading all of the (url, path) pairs."""
+        for url, path in downloads:
+            self.submit(url, path)
+
+    def download(self, url, path):
+        """Download url to path, and return the path."""
+        return self.submit(url, path).result()
+
+    def _download(self, url, path):
+        # other processes downloading to the same path wait for our lease
+        with self._get_lease(path):
+            if os.path.isfile(path):
+                return path
+            self._download_part(url, path)
+        with self.lock:
+            self.downloaded += 1
+        return path
+
+    def _get_lease(self, path):
+        # kept out of the archive's directory, which may be mounted
+        # into containers or listed by other tools
+        lock_dir = self.lock_dir or get_cache_dir('locks')
+        name = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()
+        return FileLock(os.path.join(lock_dir, name + '.lock'))
+
+    def _download_part(self, url, path):
+        part = path + '.part'
+        for attempt in range(self.retries + 1):
+            try:
+                self._fetch(url, part)
+                break
+            except requests.HTTPError as e:
+                if e.response.status_code not in _retry_statuses:
+                    # the archive is missing, retrying will not bring it
+                    # back
+                    raise DownloadFailed(
+                        "Failed to download '%s': %s" % (url, e)
+                    )
+                error = e
+            except (
+                requests.RequestException, urllib3.exceptions.HTTPError,
+                DownloadFailed
+            ) as e:
+                error = e
+            if attempt == self.retries:
+                raise DownloadFailed(
+                    "Failed to download '%s': %s" % (url, error)
+                )
+            warn("Download of '%s' interrupted (%s), retrying..." % (
+                url, error
+            ))
+            time.sleep(self.backoff * (1 << attempt))
+        os.replace(part, path)
+
+    def _fetch(self, url, part):
+        offset = os.path.getsize(part) if os.path.isfile(part) else 0
+        headers = {'Range': 'bytes=%d-' % offset} if offset else {}
+        with self.session.get(
+            url, headers=headers, stream=True, timeout=self.timeout
+        ) as r:
+            if r.status_code == 416:
+                # the partial file is not a prefix of the archive anymore
+                os.remove(part)
+                raise DownloadFailed('range not satisfiable')
+            r.raise_for_status()
+            expected = None
+            match = _content_range_re.match(
+                r.headers.get('Content-Range', '')
+            )
+            if r.status_code == 206:
+                if not match or int(match.group(1)) != offset:
+                    os.remove(part)
+                    raise DownloadFailed('unexpected range in response')
+                mode = 'ab'
+                if match.group(3) != '*':
+                    expected = int(match.group(3))
+                info("Resuming download of '%s' at %d bytes..." % (
+                    url, offset
+                ))
+                with self.lock:
+                    self.resumed += 1
+            else:
+                # the server sent the whole archive
+                mode = 'wb'
+                if 'Content-Length' in r.headers:
+                    expected = int(r.headers['Content-Length'])
+            with open(part, mode) as f:
+                # raw bytes, so the size matches what was announced
+                for chunk in r.raw.stream(1 << 16, decode_content=False):
+                    f.write(chunk)
+        size = os.path.getsize(part)
+        if expected is not None and size != expected:
+            raise DownloadFailed(
+                'got %d of %d bytes' % (size, expected)
+            )
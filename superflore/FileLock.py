@@ -0,0 +1,37 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fcntl
+
+
+class FileLock(object):
+    """
+    An exclusive lock shared by every process using the same lock file.
+    The lock belongs to the open file, so threads of one process exclude
+    each other as well, as long as each uses its own FileLock. Lock files
+    are left in place, since removing them would race with other holders.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock_file = None
+
+    def __enter__(self):
+        self.lock_file = open(self.path, 'a')
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+        self.lock_file = None
@@ -0,0 +1,95 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+
+
+class OverlayIndex(object):
+    """
+    Snapshot of the files in an overlay (or meta layer), taken with a
+    single walk of the tree, so the generators can look up existing
+    installers and patches without scanning directories per package.
+    It is kept up to date as files are written or removed.
+
+    Only top level directories starting with one of the prefixes are
+    walked, down to depth levels (counting the top level one).
+    """
+    def __init__(self, repo_dir, prefixes, depth=3):
+        self.repo_dir = repo_dir
+        self.depth = depth
+        # relative directory path -> set of file names in it
+        self.dirs = dict()
+        self.lock = threading.Lock()
+        try:
+            entries = list(os.scandir(repo_dir))
+        except FileNotFoundError:
+            entries = list()
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False) and \
+                    entry.name.startswith(tuple(prefixes)):
+                self._walk(entry.name, depth)
+
+    def _walk(self, rel_dir, depth):
+        files = set()
+        # listed up front, so the directory is closed before recursing
+        for entry in list(os.scandir(os.path.join(self.repo_dir, rel_dir))):
+            if entry.is_dir(follow_symlinks=False):
+                if depth > 1:
+                    sub_dir = os.path.join(rel_dir, entry.name)
+                    self._walk(sub_dir, depth - 1)
+            else:
+                files.add(entry.name)
+        self.dirs[rel_dir] = files
+
+    def _rel(self, path):
+        return os.path.relpath(path, self.repo_dir)
+
+    def isdir(self, path):
+        with self.lock:
+            return self._rel(path) in self.dirs
+
+    def isfile(self, path):
+        dirname, name = os.path.split(self._rel(path))
+        with self.lock:
+            return name in self.dirs.get(dirname, ())
+
+    def find(self, dirname, prefix='', suffix=''):
+        """
+        Return the sorted paths of the files in the directory whose names
+        start with prefix and end with suffix.
+        """
+        with self.lock:
+            names = self.dirs.get(self._rel(dirname), ())
+            return [
+                os.path.join(dirname, name) for name in sorted(names)
+                if name.startswith(prefix) and name.endswith(suffix)
+            ]
+
+    def add_file(self, path):
+        """Record a file that was written."""
+        dirname, name = os.path.split(self._rel(path))
+        with self.lock:
+            self.dirs.setdefault(dirname, set()).add(name)
+            # make its parent directories known, too
+            while dirname:
+                dirname, name = os.path.split(dirname)
+                if dirname:
+                    self.dirs.setdefault(dirname, set())
+
+    def remove_file(self, path):
+        """Forget a file that was removed."""
+        dirname, name = os.path.split(self._rel(path))
+        with self.lock:
+            self.dirs.get(dirname, set()).discard(name)
@@ -0,0 +1,124 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from rosdistro.rosdistro import RosPackage
+from superflore.exceptions import NoPkgXml
+
+_package_xml_stores = dict()
+_package_xml_stores_lock = threading.Lock()
+
+
+def get_package_xml_store(distro):
+    """Return the PackageXmlStore for the distro, loading it only once."""
+    with _package_xml_stores_lock:
+        store = _package_xml_stores.get(distro.name)
+        if store is None or store.distro is not distro:
+            store = PackageXmlStore(distro)
+            _package_xml_stores[distro.name] = store
+        return store
+
+
+class PackageXmlStore(object):
+    """
+    The package.xml of every released package of a ROS distro, loaded
+    in bulk from the distribution cache the distro was read from.
+    Packages missing from the cache are fetched from their release
+    repository, at most once per run. Every package.xml is a str.
+
+    The cached copies are sanitized by rosdistro (comments removed and
+    whitespace squashed), which is fine for reading the fields of the
+    package, but not for anything pointing into the file as released:
+    get_raw returns the package.xml exactly as it is in the release
+    repository, fetching it at most once.
+    """
+    def __init__(self, distro):
+        self.distro = distro
+        self.lock = threading.Lock()
+        self.fetch_locks = dict()
+        # package name -> package.xml, or None if it could not be fetched
+        self.package_xmls = dict()
+        # package name -> released package.xml, or None likewise
+        self.raw_package_xmls = dict()
+        self.fetched = 0
+        self.load()
+
+    def load(self):
+        """Take every package.xml the distribution cache holds."""
+        for pkg_name in self.distro.release_packages:
+            try:
+                pkg_xml = self.distro.get_release_package_xml(pkg_name)
+            except Exception:
+                # left for the fallback
+                continue
+            if pkg_xml:
+                self.package_xmls[pkg_name] = _to_str(pkg_xml)
+
+    def get(self, pkg_name):
+        """
+        Return the package.xml of the package.
+
+        :raises: :exc:`NoPkgXml` if it could not be fetched
+        """
+        if pkg_name not in self.package_xmls:
+            self.package_xmls[pkg_name] = self._get_raw(pkg_name)
+        return self._checked(pkg_name, self.package_xmls[pkg_name])
+
+    def get_raw(self, pkg_name):
+        """
+        Return the package.xml of the package as released.
+
+        :raises: :exc:`NoPkgXml` if it could not be fetched
+        """
+        return self._checked(pkg_name, self._get_raw(pkg_name))
+
+    def _checked(self, pkg_name, pkg_xml):
+        if pkg_xml is None:
+            raise NoPkgXml(
+                "Failed to fetch the package.xml of '%s'" % pkg_name
+            )
+        return pkg_xml
+
+    def _get_raw(self, pkg_name):
+        if pkg_name not in self.raw_package_xmls:
+            # only one thread fetches a given package
+            with self._get_fetch_lock(pkg_name):
+                if pkg_name not in self.raw_package_xmls:
+                    self.raw_package_xmls[pkg_name] = self._fetch(pkg_name)
+        return self.raw_package_xmls[pkg_name]
+
+    def _get_fetch_lock(self, pkg_name):
+        with self.lock:
+            return self.fetch_locks.setdefault(pkg_name, threading.Lock())
+
+    def _fetch(self, pkg_name):
+        pkg = self.distro.release_packages[pkg_name]
+        repo = self.distro.repositories[pkg.repository_name]
+        with self.lock:
+            self.fetched += 1
+        try:
+            return _to_str(
+                RosPackage(pkg_name, repo.release_repository)
+                .get_package_xml(self.distro.name)
+            )
+        except Exception:
+            return None
+
+
+def _to_str(pkg_xml):
+    # RosPackage hands out the bytes it downloaded
+    if isinstance(pkg_xml, bytes):
+        return pkg_xml.decode('utf-8')
+    return pkg_xml
@@ -0,0 +1,31 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+
+def get_cache_dir(*subdirs):
+    """
+    Return the directory where superflore keeps data between runs,
+    creating it if needed. This is $SUPERFLORE_CACHE_DIR if it is set,
+    and $XDG_CACHE_HOME/superflore (~/.cache/superflore) otherwise.
+    """
+    base = os.environ.get('SUPERFLORE_CACHE_DIR')
+    if not base:
+        xdg_cache = os.environ.get('XDG_CACHE_HOME') or \
+            os.path.join(os.path.expanduser('~'), '.cache')
+        base = os.path.join(xdg_cache, 'superflore')
+    path = os.path.join(base, *subdirs)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -42,3 +42,16 @@ class UnknownBuildType(Exception):
     """Raised when we don't know what to inherit to build the package"""
     def __init__(self, msg):
         self.message = msg
+
+
+class ShardsFailed(Exception):
+    """Raised when some of the shards of a sharded run failed"""
+    def __init__(self, message, failed=None):
+        self.message = message
+        self.failed = failed or []
+
+
+class DownloadFailed(Exception):
+    """Raised when an archive could not be downloaded completely"""
+    def __init__(self, message):
+        self.message = message
@@ -12,17 +12,51 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from rosinstall_generator.distro import get_distro
-from rosinstall_generator.distro import get_package_names
+from functools import partial
+
+from superflore.DistroIndex import get_distro_index
 from superflore.exceptions import UnknownBuildType
 from superflore.exceptions import UnknownLicense
+from superflore.pipeline import Pipeline
+from superflore.pipeline import Stage
+from superflore.rosdep_support import resolvers
+from superflore.rosdistro_snapshot import get_distro
 from superflore.utils import err
-from superflore.utils import get_pkg_version
 from superflore.utils import info
 from superflore.utils import ok
 from superflore.utils import warn
 
 
+def _gen_pkg_results(jobs, gen_pkg_func, stages, overlay, pkgs, *args):
+    """
+    Yield one callable per package, in order, returning the result of
+    gen_pkg_func for that package (or raising what it raised).
+    When jobs > 1, the packages are pushed through a pipeline of the
+    stages ahead of the consumer, so the results still come back in order.
+    """
+    if jobs <= 1:
+        for pkg in pkgs:
+            yield partial(gen_pkg_func, overlay, pkg, *args)
+        return
+
+    def first_stage(pkg):
+        return stages[0].func(overlay, pkg, *args)
+
+    pipeline = Pipeline(
+        [Stage(stages[0].name, first_stage, stages[0].io_bound)] +
+        stages[1:],
+        jobs
+    )
+    futures = pipeline.start(pkgs)
+    try:
+        for future in futures:
+            yield future.result
+    finally:
+        # don't keep generating if the consumer bailed out early
+        for future in futures:
+            future.cancel()
+
+
 def generate_installers(
     distro_name,             # ros distro name
     overlay,                 # repo instance
@@ -32,23 +66,39 @@ def generate_installers(
     **kwargs                 # any additional keyword arguments
 ):
     distro = get_distro(distro_name)
-    pkg_names = get_package_names(distro)
-    total = float(len(pkg_names[0]))
+    distro_index = get_distro_index(distro)
+    pkgs = sorted(distro_index.package_names)
+    jobs = kwargs.get('jobs', 1) or 1
+    # generators may split gen_pkg_func into stages, so that a pipeline
+    # can overlap fetching, rendering and writing of different packages.
+    stages = kwargs.get('stages') or [
+        Stage('generate', gen_pkg_func, io_bound=True)
+    ]
+    total = float(len(pkgs))
     borkd_pkgs = dict()
     changes = []
     installers = []
+    # callers can pass a list to learn which installers were up to date
+    unchanged = kwargs.get('unchanged', [])
     bad_installers = []
     succeeded = 0
     failed = 0
 
     info("Generating installers for distro '%s'" % distro_name)
-    for i, pkg in enumerate(sorted(pkg_names[0])):
-        version = get_pkg_version(distro, pkg, kwargs.get('is_oe', False))
+    if kwargs.get('prefetch'):
+        # let the generator start fetching what it will need
+        kwargs['prefetch'](distro)
+    if jobs > 1:
+        info("Using %d jobs" % jobs)
+    results = _gen_pkg_results(
+        jobs, gen_pkg_func, stages, overlay, pkgs,
+        distro, preserve_existing, *args
+    )
+    for i, (pkg, result) in enumerate(zip(pkgs, results)):
+        version = distro_index.get_version(pkg, kwargs.get('is_oe', False))
         percent = '%.1f' % (100 * (float(i) / total))
         try:
-            current, current_info = gen_pkg_func(
-                overlay, pkg, distro, preserve_existing, *args
-            )
+            current, current_info = result()
             if not current and current_info:
                 # we are missing dependencies
                 failed_msg = "{0}%: Failed to generate".format(percent)
@@ -61,6 +111,14 @@ def generate_installers(
                 # don't replace the installer
                 succeeded = succeeded + 1
                 continue
+            elif getattr(current, 'unchanged', False):
+                # the installer on disk is already up to date
+                ok("{0}%: Installer for package '{1}' is unchanged.".format(
+                    percent, pkg
+                ))
+                unchanged.append(pkg)
+                succeeded = succeeded + 1
+                continue
             success_msg = 'Successfully generated installer for package'
             ok('{0}%: {1} \'{2}\'.'.format(percent, success_msg, pkg))
             succeeded = succeeded + 1
@@ -92,6 +150,16 @@ def generate_installers(
     results = 'Generated {0} / {1}'.format(succeeded, failed + succeeded)
     results += ' for distro {0}'.format(distro_name)
     info("------ {0} ------\n".format(results))
+    if unchanged:
+        info("{0} installers unchanged, {1} written".format(
+            len(unchanged), len(installers)
+        ))
+    for resolver in resolvers.values():
+        info("rosdep {0} {1}: {2} cache hits, {3} from previous runs,"
+             " {4} misses".format(
+                 resolver.os_name, resolver.ros_distro, resolver.hits,
+                 resolver.stored_hits, resolver.misses
+             ))
 
     if len(borkd_pkgs) > 0:
         warn("Unresolved:")
@@ -12,20 +12,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import glob
-import os
+from types import SimpleNamespace
 
-from rosdistro.dependency_walker import DependencyWalker
 from rosdistro.manifest_provider import get_release_tag
 from rosdistro.rosdistro import RosPackage
 from rosinstall_generator.distro import _generate_rosinstall
-from rosinstall_generator.distro import get_package_names
+from superflore.DependencyGraph import get_dependency_graph
+from superflore.DistroIndex import get_distro_index
 from superflore.exceptions import NoPkgXml
 from superflore.exceptions import UnresolvedDependency
 from superflore.generators.bitbake.yocto_recipe import yoctoRecipe
 from superflore.PackageMetadata import PackageMetadata
+from superflore.PackageXmlStore import get_package_xml_store
+from superflore.pipeline import Done
+from superflore.pipeline import run_stages
+from superflore.pipeline import Stage
 from superflore.utils import err
-from superflore.utils import get_pkg_version
+from superflore.utils import file_has_text
 from superflore.utils import make_dir
 from superflore.utils import ok
 from superflore.utils import warn
@@ -35,101 +38,178 @@ org_license = "BSD"
 
 
 def regenerate_installer(
-    overlay, pkg, distro, preserve_existing, tar_dir, md5_cache, sha256_cache, skip_keys
+    overlay, pkg, distro, preserve_existing, archive_store, md5_cache,
+    sha256_cache, skip_keys
+):
+    return run_stages(
+        regenerate_installer_stages, overlay, pkg, distro, preserve_existing,
+        archive_store, md5_cache, sha256_cache, skip_keys
+    )
+
+
+def _fetch_installer(
+    overlay, pkg, distro, preserve_existing,
+    archive_store, md5_cache, sha256_cache, skip_keys
 ):
     if pkg in skip_keys:
         warn("package '%s' is on skip-keys, skipping..." % pkg)
-        return None, []
+        return Done((None, []))
 
     make_dir("{0}/generated-recipes-{1}".format(overlay.repo.repo_dir, distro.name))
-    version = get_pkg_version(distro, pkg, is_oe=True)
-    pkg_names = get_package_names(distro)[0]
+    distro_index = get_distro_index(distro)
+    version = distro_index.get_version(pkg, is_oe=True)
 
-    if pkg not in pkg_names:
+    if pkg not in distro_index.package_names:
         raise RuntimeError("Unknown package '%s'" % pkg)
-    component = yoctoRecipe.convert_to_oe_name(distro.release_packages[pkg].repository_name)
+    component = yoctoRecipe.convert_to_oe_name(
+        distro_index.get_repository_name(pkg)
+    )
     pkg_name = yoctoRecipe.convert_to_oe_name(pkg)
     # check for an existing recipe
-    glob_pattern = '{0}/generated-recipes-{1}/{2}/{3}*.bb'.format(
+    recipe_dir = '{0}/generated-recipes-{1}/{2}'.format(
         overlay.repo.repo_dir,
         distro.name,
-        component,
-        pkg_name
+        component
     )
-    existing = glob.glob(glob_pattern)
+    existing = overlay.index.find(recipe_dir, pkg_name + '_', '.bb')
     if preserve_existing and existing:
         ok("recipe for package '%s' up to date, skipping..." % pkg)
-        return None, []
-    elif existing:
-        overlay.repo.remove_file(existing[0], True)
+        return Done((None, []))
+    # an existing recipe is only removed once we know it changed.
     try:
         current = oe_installer(
-            distro, pkg, tar_dir, md5_cache, sha256_cache, skip_keys
+            distro, pkg, archive_store, md5_cache, sha256_cache, skip_keys
         )
     except Exception as e:
         err('Failed to generate installer for package {}!'.format(pkg))
         raise e
+    return SimpleNamespace(
+        overlay=overlay, pkg=pkg, distro=distro, version=version,
+        component=component, pkg_name=pkg_name, current=current,
+        existing=existing, recipe_dir=recipe_dir
+    )
+
+
+def _remove_existing(job):
+    """Remove the previous recipe of the package."""
+    if job.existing:
+        job.overlay.repo.remove_file(job.existing[0], True)
+        job.overlay.index.remove_file(job.existing[0])
+
+
+def _render_installer(job):
+    current = job.current
     try:
-        recipe_text = current.recipe_text()
+        job.recipe_text = current.recipe_text()
     except UnresolvedDependency:
         dep_err = 'Failed to resolve required dependencies for'
-        err("{0} package {1}!".format(dep_err, pkg))
+        err("{0} package {1}!".format(dep_err, job.pkg))
         unresolved = current.recipe.get_unresolved_cache()
         for dep in unresolved:
             err(" unresolved: \"{}\"".format(dep))
-        return None, unresolved
+        # don't leave the stale recipe behind
+        _remove_existing(job)
+        return Done((None, unresolved))
     except NoPkgXml:
         err("Could not fetch pkg!")
-        return None, []
+        _remove_existing(job)
+        return Done((None, []))
     except KeyError as ke:
-        err("Failed to parse data for package {}!".format(pkg))
+        err("Failed to parse data for package {}!".format(job.pkg))
+        _remove_existing(job)
         raise ke
-    make_dir(
-        "{0}/generated-recipes-{1}/{2}".format(
-            overlay.repo.repo_dir,
-            distro.name,
-            component
-        )
+    return job
+
+
+def _write_installer(job):
+    recipe_file_name = '{0}/{1}_{2}.bb'.format(
+        job.recipe_dir, job.pkg_name, job.version
     )
+    # the recipe is listed as generated whether or not it changed
+    job.current.recipe.get_generated_recipes().append(job.pkg_name)
+    if job.overlay.index.isfile(recipe_file_name) and \
+            file_has_text(recipe_file_name, job.recipe_text):
+        ok('Installer for package \'{0}\' is unchanged.'.format(job.pkg))
+        job.current.unchanged = True
+        return job.current, []
+    _remove_existing(job)
+    make_dir(job.recipe_dir)
     success_msg = 'Successfully generated installer for package'
-    ok('{0} \'{1}\'.'.format(success_msg, pkg))
-    recipe_file_name = '{0}/generated-recipes-{1}/{2}/{3}_{4}.bb'.format(
-        overlay.repo.repo_dir,
-        distro.name,
-        component,
-        pkg_name,
-        version
-    )
+    ok('{0} \'{1}\'.'.format(success_msg, job.pkg))
     try:
-        with open('{0}'.format(recipe_file_name), "w") as recipe_file:
+        with open(recipe_file_name, 'w', encoding='utf-8') as recipe_file:
             ok('Writing recipe {0}'.format(recipe_file_name))
-            recipe_file.write(recipe_text)
-            current.recipe.get_generated_recipes().append(pkg_name)
-
+            recipe_file.write(job.recipe_text)
+        job.overlay.index.add_file(recipe_file_name)
     except Exception as e:
         err("Failed to write recipe to disk!")
         raise e
-    return current, []
+    return job.current, []
+
+
+# fetching package data and archives dominates, so that stage gets one
+# worker per job; rendering and writing happen on a single worker.
+regenerate_installer_stages = [
+    Stage('fetch', _fetch_installer, io_bound=True),
+    Stage('render', _render_installer),
+    Stage('write', _write_installer),
+]
+
+
+def _get_source_urls(distro, skip_keys):
+    """Yield each package of the distro with the url of its archive."""
+    for pkg_name in sorted(get_distro_index(distro).package_names):
+        if pkg_name in skip_keys:
+            continue
+        pkg = distro.release_packages[pkg_name]
+        repo = distro.repositories[pkg.repository_name].release_repository
+        pkg_rosinstall = _generate_rosinstall(
+            pkg_name, repo.url, get_release_tag(repo, pkg_name), True
+        )
+        yield pkg_name, pkg_rosinstall[0]['tar']['uri']
+
+
+def get_source_urls(distro, skip_keys=()):
+    """
+    Return the urls of the source archives of every package in the
+    distro, so they can be downloaded up front.
+    """
+    return [url for _, url in _get_source_urls(distro, skip_keys)]
+
+
+def get_legacy_archive_urls(distro, skip_keys=()):
+    """
+    Return the urls of the source archives of every package in the
+    distro, keyed by the names older versions stored the archives under.
+    """
+    distro_index = get_distro_index(distro)
+    return {
+        yoctoRecipe.get_legacy_archive_name(
+            pkg_name, distro_index.get_version(pkg_name, is_oe=True),
+            distro.name
+        ): url
+        for pkg_name, url in _get_source_urls(distro, skip_keys)
+    }
 
 
 def _gen_recipe_for_package(
     distro, pkg_name, pkg, repo, ros_pkg,
-    pkg_rosinstall, tar_dir, md5_cache, sha256_cache, skip_keys
+    pkg_rosinstall, archive_store, md5_cache, sha256_cache, skip_keys
 ):
-    pkg_names = get_package_names(distro)
-    pkg_dep_walker = DependencyWalker(distro)
-    pkg_buildtool_deps = pkg_dep_walker.get_depends(pkg_name, "buildtool")
-    pkg_build_deps = pkg_dep_walker.get_depends(pkg_name, "build")
-    pkg_build_export_deps = pkg_dep_walker.get_depends(pkg_name, "build_export")
-    pkg_buildtool_export_deps = pkg_dep_walker.get_depends(pkg_name, "buildtool_export")
-    pkg_exec_deps = pkg_dep_walker.get_depends(pkg_name, "exec")
-    pkg_test_deps = pkg_dep_walker.get_depends(pkg_name, "test")
+    pkg_names = get_distro_index(distro).package_names
+    pkg_depends = get_dependency_graph(distro).get_all_depends(pkg_name)
+    pkg_buildtool_deps = pkg_depends['buildtool']
+    pkg_build_deps = pkg_depends['build']
+    pkg_build_export_deps = pkg_depends['build_export']
+    pkg_buildtool_export_deps = pkg_depends['buildtool_export']
+    pkg_exec_deps = pkg_depends['exec']
+    pkg_test_deps = pkg_depends['test']
     src_uri = pkg_rosinstall[0]['tar']['uri']
 
     # parse through package xml
     pkg_xml = None
     try:
-        pkg_xml = ros_pkg.get_package_xml(distro.name)
+        pkg_xml = get_package_xml_store(distro).get(pkg_name)
     except Exception:
         warn("fetch metadata for package {}".format(pkg_name))
 
@@ -140,41 +220,42 @@ def _gen_recipe_for_package(
         pkg_xml,
         distro,
         src_uri,
-        tar_dir,
+        archive_store,
         md5_cache,
         sha256_cache,
         skip_keys,
     )
     # add build dependencies
     for bdep in pkg_build_deps:
-        pkg_recipe.add_build_depend(bdep, bdep in pkg_names[0])
+        pkg_recipe.add_build_depend(bdep, bdep in pkg_names)
 
     # add build tool dependencies
     for tdep in pkg_buildtool_deps:
-        pkg_recipe.add_buildtool_depend(tdep, tdep in pkg_names[0])
+        pkg_recipe.add_buildtool_depend(tdep, tdep in pkg_names)
 
     # add export dependencies
     for edep in pkg_build_export_deps:
-        pkg_recipe.add_export_depend(edep, edep in pkg_names[0])
+        pkg_recipe.add_export_depend(edep, edep in pkg_names)
 
     # add buildtool export dependencies
     for tedep in pkg_buildtool_export_deps:
-        pkg_recipe.add_buildtool_export_depend(tedep, tedep in pkg_names[0])
+        pkg_recipe.add_buildtool_export_depend(tedep, tedep in pkg_names)
 
     # add exec dependencies
     for xdep in pkg_exec_deps:
-        pkg_recipe.add_run_depend(xdep, xdep in pkg_names[0])
+        pkg_recipe.add_run_depend(xdep, xdep in pkg_names)
 
     # add test dependencies
     for test_dep in pkg_test_deps:
-        pkg_recipe.add_test_depend(test_dep, test_dep in pkg_names[0])
+        pkg_recipe.add_test_depend(test_dep, test_dep in pkg_names)
 
     return pkg_recipe
 
 
 class oe_installer(object):
     def __init__(
-        self, distro, pkg_name, tar_dir, md5_cache, sha256_cache, skip_keys
+        self, distro, pkg_name, archive_store, md5_cache, sha256_cache,
+        skip_keys
     ):
         pkg = distro.release_packages[pkg_name]
         repo = distro.repositories[pkg.repository_name].release_repository
@@ -186,8 +267,10 @@ class oe_installer(object):
 
         self.recipe = _gen_recipe_for_package(
             distro, pkg_name, pkg, repo, ros_pkg, pkg_rosinstall,
-            tar_dir, md5_cache, sha256_cache, skip_keys
+            archive_store, md5_cache, sha256_cache, skip_keys
         )
+        # set when the recipe on disk is up to date
+        self.unchanged = False
 
     def recipe_text(self):
         return self.recipe.get_recipe_text(org, org_license)
@@ -0,0 +1,315 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import atexit
+import json
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+
+from superflore.cache_dir import get_cache_dir
+from superflore.CacheManager import CacheManager
+from superflore.generators.bitbake.oe_query import OpenEmbeddedLayersDB
+from superflore.generators.bitbake.oe_query import VALID_LAYERS
+from superflore.utils import info
+from superflore.utils import ok
+from superflore.utils import warn
+
+# seconds in a day
+DAY = 24 * 60 * 60
+# how long the result of a query is trusted by default
+DEFAULT_TTL = 7 * DAY
+
+_layer_index = None
+_layer_index_lock = threading.Lock()
+
+
+def get_layer_index(ttl=None, online=True):
+    """
+    Return the layer index cache shared by the recipes, opening it on
+    the first call. It is saved when the process exits.
+    """
+    global _layer_index
+    with _layer_index_lock:
+        if _layer_index is None:
+            _layer_index = LayerIndexCache(ttl=ttl, online=online)
+            _layer_index.open()
+            atexit.register(_layer_index.close)
+        return _layer_index
+
+
+class LocalLayerIndex(object):
+    """
+    The recipes of a layer index export, keyed by recipe name and layer,
+    so they can be looked up without any request.
+
+    The export is a JSON object holding what the branches, layerItems,
+    layerBranches and recipes endpoints of the layer index REST API
+    serve, ingested once with 'superflore-oe-layer-index ingest'.
+    """
+    file_name = 'layer_index_export.pickle'
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        # recipe name -> layer -> fields
+        self.recipes = None
+
+    def get_filename(self):
+        cache_dir = self.cache_dir or get_cache_dir('oe')
+        return os.path.join(cache_dir, self.file_name)
+
+    def load(self):
+        """Load the ingested export, returning whether there is one."""
+        try:
+            with open(self.get_filename(), 'rb') as index_file:
+                self.recipes = pickle.load(index_file)
+        except FileNotFoundError:
+            self.recipes = None
+        except Exception as e:
+            warn("Ignoring unreadable layer index '%s': %s" % (
+                self.get_filename(), e
+            ))
+            self.recipes = None
+        return self.recipes is not None
+
+    def ingest(self, export, branch='master'):
+        """
+        Index the recipes of the parsed export on branch, and save them.
+        Returns the number of recipes indexed.
+        """
+        branches = [
+            b['id'] for b in export.get('branches', []) if b['name'] == branch
+        ]
+        layers = {
+            layer['id']: layer['name'] for layer in export['layerItems']
+        }
+        layer_branches = {
+            lb['id']: layers.get(lb['layer'])
+            for lb in export['layerBranches']
+            if not branches or lb['branch'] in branches
+        }
+        recipes = dict()
+        count = 0
+        for recipe in export['recipes']:
+            layer = layer_branches.get(recipe['layerbranch'])
+            if not layer:
+                continue
+            recipes.setdefault(recipe['pn'], dict())[layer] = {
+                'name': recipe['pn'],
+                'version': recipe.get('pv') or '',
+                'summary': recipe.get('summary') or '',
+                'description': recipe.get('description') or '',
+                'section': recipe.get('section') or '',
+                'license': recipe.get('license') or '',
+                'homepage': recipe.get('homepage') or '',
+                'recipe': recipe['pn'],
+                'layer': layer,
+                'inherits': recipe.get('inherits') or '',
+                'dependencies': recipe.get('depends') or '',
+            }
+            count += 1
+        self.recipes = recipes
+        self.save()
+        return count
+
+    def save(self):
+        filename = self.get_filename()
+        # write to a temporary file first, so runs reading the index
+        # never see a partial one.
+        fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(filename))
+        try:
+            with os.fdopen(fd, 'wb') as index_file:
+                pickle.dump(self.recipes, index_file, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_name, filename)
+        except Exception:
+            os.remove(tmp_name)
+            raise
+
+    def remove(self):
+        """Forget the ingested export."""
+        self.recipes = None
+        try:
+            os.remove(self.get_filename())
+        except FileNotFoundError:
+            pass
+
+    def lookup(self, recipe):
+        """
+        Return the fields of recipe in the first valid layer that has
+        it, or None.
+        """
+        layers = self.recipes.get(recipe)
+        if layers:
+            for layer in VALID_LAYERS:
+                if layer in layers:
+                    return layers[layer]
+        return None
+
+
+class LayerIndexCache(object):
+    """
+    Results of the OpenEmbedded layer index queries, kept between runs.
+    Recipes are looked up in the ingested export first, if there is one,
+    and the layer index is only queried for the others (unless online is
+    False). Whether a recipe was found there (and then its name, layer,
+    version and so on) is remembered for ttl seconds, after which the
+    recipe is queried again. Queries that could not reach the layer
+    index are not remembered.
+    """
+    store_name = 'layer_index.sqlite'
+
+    def __init__(self, cache_dir=None, ttl=None, online=True):
+        self.cache_dir = cache_dir
+        self.ttl = DEFAULT_TTL if ttl is None else ttl
+        self.online = online
+        self.local = LocalLayerIndex(cache_dir)
+        # recipe -> (time of the query, fields or None)
+        self.store = None
+        self._store_manager = None
+        self.local_hits = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_filename(self):
+        cache_dir = self.cache_dir or get_cache_dir('oe')
+        return os.path.join(cache_dir, self.store_name)
+
+    def open(self):
+        if self._store_manager is None:
+            self.local.load()
+            self._store_manager = CacheManager(self.get_filename())
+            self.store = self._store_manager.__enter__()
+
+    def close(self):
+        if self._store_manager is not None:
+            info('Layer index: %d ingested, %d cached, %d queried' % (
+                self.local_hits, self.hits, self.misses
+            ))
+            self._store_manager.__exit__(None, None, None)
+            self._store_manager = None
+            self.store = None
+
+    def query(self, recipe):
+        """
+        Return the OpenEmbeddedLayersDB for recipe, querying the layer
+        index only if the recipe is not in the ingested export, and the
+        cached result is missing or too old.
+        """
+        oe_query = OpenEmbeddedLayersDB()
+        if self.local.recipes is not None:
+            fields = self.local.lookup(recipe)
+            if fields:
+                self.local_hits += 1
+                oe_query.set_fields(fields)
+                return oe_query
+        entry = self.store.get(recipe)
+        if entry and time.time() - entry[0] < self.ttl:
+            self.hits += 1
+            if entry[1] is not None:
+                oe_query.set_fields(entry[1])
+            return oe_query
+        if not self.online:
+            return oe_query
+        self.misses += 1
+        return self._query(recipe)
+
+    def refresh(self, max_age=0):
+        """
+        Query the cached recipes whose result is older than max_age
+        seconds again. Returns the number of recipes queried.
+        """
+        now = time.time()
+        stale = [
+            recipe for recipe, (queried, _) in self.store.items()
+            if now - queried >= max_age
+        ]
+        for recipe in sorted(stale):
+            info("Querying '%s'..." % recipe)
+            self._query(recipe)
+        return len(stale)
+
+    def clear(self):
+        """Forget every result."""
+        self.store.clear()
+
+    def _query(self, recipe):
+        oe_query = OpenEmbeddedLayersDB()
+        oe_query.query_recipe(recipe)
+        if oe_query.exists():
+            self.store[recipe] = (time.time(), oe_query.get_fields())
+        elif not oe_query.failed():
+            self.store[recipe] = (time.time(), None)
+        return oe_query
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        'Manage the cached OpenEmbedded layer index queries'
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    refresh = subparsers.add_parser(
+        'refresh', help='query the cached recipes again'
+    )
+    refresh.add_argument(
+        '--older-than',
+        help='only query the recipes cached more than this many days ago',
+        type=float,
+        default=0
+    )
+    clear = subparsers.add_parser('clear', help='forget the cached results')
+    clear.add_argument(
+        '--ingested',
+        help='forget the ingested export as well',
+        action='store_true'
+    )
+    ingest = subparsers.add_parser(
+        'ingest', help='index a layer index export (a JSON file)'
+    )
+    ingest.add_argument('export', help='the layer index export', type=str)
+    ingest.add_argument(
+        '--branch',
+        help='branch of the layers to index',
+        type=str,
+        default='master'
+    )
+    args = parser.parse_args(sys.argv[1:])
+    if not args.command:
+        parser.error('a command is required')
+    if args.command == 'ingest':
+        info("Reading '%s'..." % args.export)
+        with open(args.export, 'r') as export_file:
+            export = json.load(export_file)
+        count = LocalLayerIndex().ingest(export, args.branch)
+        ok('Indexed %d recipes.' % count)
+        return
+    with LayerIndexCache() as layer_index:
+        if args.command == 'refresh':
+            count = layer_index.refresh(args.older_than * DAY)
+            ok('Refreshed %d recipes.' % count)
+        elif args.command == 'clear':
+            layer_index.clear()
+            if args.ingested:
+                layer_index.local.remove()
+            ok('Cleared the layer index cache.')
@@ -12,19 +12,44 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import urllib.parse
+import urllib.request
+
 import bs4
-import urllib
 
-from collections import OrderedDict
+# Layers a recipe may come from, in priority order
+VALID_LAYERS = [
+    'openembedded-core', 'meta-oe', 'meta-python', 'meta-multimedia',
+    'meta-ros', 'meta-intel-realsense', 'meta-qt5', 'meta-clang', 'meta-sca',
+    'meta-openstack', 'meta-virtualization'
+]
+
+# Layer index queries in flight at once, across all recipes
+MAX_QUERIES = 4
+
+_query_pool = None
+_query_pool_lock = threading.Lock()
+
+
+def _get_query_pool():
+    global _query_pool
+    with _query_pool_lock:
+        if _query_pool is None:
+            _query_pool = ThreadPoolExecutor(max_workers=MAX_QUERIES)
+        return _query_pool
 
 
 class OpenEmbeddedLayersDB(object):
     def __init__(self):
         # Tells if we could read recipe information
         self._exists = False
+        # Tells if the layer index could not be reached
+        self._failed = False
         # Valid layers in priority order to filter when searching for a recipe
-        self._prio_valid_layers = OrderedDict.fromkeys(['openembedded-core', 'meta-oe', 'meta-python', 'meta-multimedia',
-                                                        'meta-ros', 'meta-intel-realsense', 'meta-qt5', 'meta-clang', 'meta-sca', 'meta-openstack', 'meta-virtualization'])
+        self._prio_valid_layers = OrderedDict.fromkeys(VALID_LAYERS)
         # All fields below come straight from OpenEmbedded Layer query table results
         self.name = ''
         self.version = ''
@@ -91,6 +116,12 @@ class OpenEmbeddedLayersDB(object):
         try:
             req = urllib.request.urlopen(query_url)
             read_str = req.read()
+        except OSError:
+            # Says nothing about the recipe, so it must not be remembered
+            self._failed = True
+            self._exists = False
+            return
+        try:
             bs = bs4.BeautifulSoup(read_str, "html.parser")
             th = bs.table.find('th', text='Name')
             while th:
@@ -115,14 +146,52 @@ class OpenEmbeddedLayersDB(object):
     def exists(self):
         return self._exists
 
+    def failed(self):
+        return self._failed
+
+    def get_fields(self):
+        """Return the fields read from the layer index, by name."""
+        return {
+            key: value for key, value in vars(self).items()
+            if not key.startswith('_')
+        }
+
+    def set_fields(self, fields):
+        """Fill in the fields of a recipe found earlier."""
+        for key, value in fields.items():
+            setattr(self, key, value)
+        self._exists = True
+
+    def _query_layer(self, recipe, layer):
+        # A fresh instance per layer, so that concurrent queries of the
+        # layers never fill in the fields of the same object
+        url_prefix = ('https://layers.openembedded.org/layerindex/branch/'
+                      'master/recipes/?q={}')
+        query_url = url_prefix.format(
+            recipe + urllib.parse.quote(' layer:') + layer)
+        layer_query = OpenEmbeddedLayersDB()
+        layer_query._query_url(query_url)
+        return layer_query
+
     def query_recipe(self, recipe):
+        """
+        Query all of the valid layers at once, and take the recipe from
+        the first layer in priority order that has it. The queries of
+        the lower priority layers that did not start yet are cancelled.
+        """
         if recipe:
-            url_prefix = 'https://layers.openembedded.org/layerindex/branch/master/recipes/?q={}'
-            for layer in self._prio_valid_layers:
-                query_url = url_prefix.format(
-                    recipe + urllib.parse.quote(' layer:') + layer)
-                self._query_url(query_url)
-                if self.exists():
+            pool = _get_query_pool()
+            futures = [
+                pool.submit(self._query_layer, recipe, layer)
+                for layer in self._prio_valid_layers
+            ]
+            for i, future in enumerate(futures):
+                layer_query = future.result()
+                self._failed |= layer_query.failed()
+                if layer_query.exists():
+                    for lower in futures[i + 1:]:
+                        lower.cancel()
+                    self.set_fields(layer_query.get_fields())
                     return
 
 
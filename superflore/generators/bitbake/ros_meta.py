@@ -14,6 +14,7 @@
 
 import time
 
+from superflore.OverlayIndex import OverlayIndex
 from superflore.repo_instance import RepoInstance
 from superflore.utils import info
 from superflore.utils import rand_ascii_str
@@ -22,10 +23,17 @@ from superflore.utils import rand_ascii_str
 class RosMeta(object):
     def __init__(self, repo_dir, do_clone, org='allenh1', repo='meta-ros', from_branch=''):
         self.repo = RepoInstance(org, repo, repo_dir, do_clone, from_branch=from_branch)
+        self.index_recipes()
         self.branch_name = 'yocto-bot-%s' % rand_ascii_str()
         info('Creating new branch {0}...'.format(self.branch_name))
         self.repo.create_branch(self.branch_name)
 
+    def index_recipes(self):
+        # generated-recipes-<distro>/<component>
+        self.index = OverlayIndex(
+            self.repo.repo_dir, ['generated-recipes-'], depth=2
+        )
+
     def clean_ros_recipe_dirs(self, distro=None):
         if distro:
             info('Cleaning up generated-recipes-{0} directory...'.format(distro))
@@ -33,6 +41,7 @@ class RosMeta(object):
         else:
             info('Cleaning up generated-recipes-* directories...')
             self.repo.git.rm('-rf', 'generated-recipes-*')
+        self.index_recipes()
 
     def commit_changes(self, distro):
         info('Adding changes...')
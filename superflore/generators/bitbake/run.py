@@ -15,14 +15,25 @@
 import os
 import sys
 
-from rosinstall_generator.distro import get_distro
+from superflore.ArchiveStore import ArchiveStore
 from superflore.CacheManager import CacheManager
 from superflore.generate_installers import generate_installers
+from superflore.generators.bitbake.gen_packages import (
+    get_legacy_archive_urls
+)
+from superflore.generators.bitbake.gen_packages import get_source_urls
 from superflore.generators.bitbake.gen_packages import regenerate_installer
+from superflore.generators.bitbake.gen_packages import (
+    regenerate_installer_stages
+)
+from superflore.generators.bitbake.layer_index import DAY
+from superflore.generators.bitbake.layer_index import DEFAULT_TTL
+from superflore.generators.bitbake.layer_index import get_layer_index
 from superflore.generators.bitbake.ros_meta import RosMeta
 from superflore.generators.bitbake.yocto_recipe import yoctoRecipe
 from superflore.parser import get_parser
 from superflore.repo_instance import RepoInstance
+from superflore.rosdistro_snapshot import get_distro
 from superflore.TempfileManager import TempfileManager
 from superflore.utils import active_distros
 from superflore.utils import clean_up
@@ -53,6 +64,25 @@ def main():
         help='location to store archived packages',
         type=str
     )
+    parser.add_argument(
+        '--tar-archive-max-size',
+        help='size (in MiB) above which the least recently used archives '
+             'are evicted from the archive directory',
+        type=int
+    )
+    parser.add_argument(
+        '--layer-index-ttl',
+        help='days for which the OpenEmbedded layer index queries are '
+             'cached (see superflore-oe-layer-index)',
+        type=float,
+        default=DEFAULT_TTL / DAY
+    )
+    parser.add_argument(
+        '--layer-index-offline',
+        help='do not query the OpenEmbedded layer index for the recipes '
+             'missing from the ingested export',
+        action='store_true'
+    )
     args = parser.parse_args(sys.argv[1:])
     pr_comment = args.pr_comment
     skip_keys = args.skip_keys or []
@@ -121,15 +151,42 @@ def main():
         total_installers = dict()
         total_broken = set()
         total_changes = dict()
+        total_unchanged = dict()
+        sha256_cache_files = md5_cache_files = (None,)
         if args.tar_archive_dir:
-            sha256_filename = '%s/sha256_cache.pickle' % args.tar_archive_dir
-            md5_filename = '%s/md5_cache.pickle' % args.tar_archive_dir
-        else:
-            sha256_filename = None
-            md5_filename = None
+            # the caches, and where older versions pickled them
+            sha256_cache_files = (
+                '%s/sha256_cache.sqlite' % args.tar_archive_dir,
+                '%s/sha256_cache.pickle' % args.tar_archive_dir,
+            )
+            md5_cache_files = (
+                '%s/md5_cache.sqlite' % args.tar_archive_dir,
+                '%s/md5_cache.pickle' % args.tar_archive_dir,
+            )
+        # open the layer index cache with the requested settings
+        get_layer_index(
+            args.layer_index_ttl * DAY, not args.layer_index_offline
+        )
+        max_size = None
+        if args.tar_archive_max_size is not None:
+            max_size = args.tar_archive_max_size << 20
+        # the archive store is closed first, once its prefetches are done
         with TempfileManager(args.tar_archive_dir) as tar_dir,\
-            CacheManager(sha256_filename) as sha256_cache,\
-            CacheManager(md5_filename) as md5_cache:  # noqa
+            CacheManager(*sha256_cache_files) as sha256_cache,\
+            CacheManager(*md5_cache_files) as md5_cache,\
+            ArchiveStore(tar_dir, max_size, args.jobs) as archive_store:  # noqa
+            def get_legacy_urls():
+                legacy_urls = dict()
+                for distro in selected_targets:
+                    legacy_urls.update(get_legacy_archive_urls(
+                        get_distro(distro), skip_keys
+                    ))
+                return legacy_urls
+
+            # take over the archives stored by older versions
+            archive_store.migrate(
+                {'md5': md5_cache, 'sha256': sha256_cache}, get_legacy_urls
+            )
             if args.only:
                 for pkg in args.only:
                     info("Regenerating package '%s'..." % pkg)
@@ -139,7 +196,7 @@ def main():
                             pkg,
                             get_distro(args.ros_distro),
                             preserve_existing,
-                            tar_dir,
+                            archive_store,
                             md5_cache,
                             sha256_cache,
                             skip_keys,
@@ -162,23 +219,36 @@ def main():
                 ok('Successfully synchronized repositories!')
                 sys.exit(0)
 
+            def prefetch(distro):
+                # start fetching the archives that aren't hashed yet
+                archive_store.prefetch(
+                    get_source_urls(distro, skip_keys),
+                    {'md5': md5_cache, 'sha256': sha256_cache}
+                )
+
             for distro in selected_targets:
+                distro_unchanged = list()
                 distro_installers, distro_broken, distro_changes =\
                     generate_installers(
                         distro,
                         overlay,
                         regenerate_installer,
                         preserve_existing,
-                        tar_dir,
+                        archive_store,
                         md5_cache,
                         sha256_cache,
                         skip_keys,
                         is_oe=True,
+                        jobs=args.jobs,
+                        stages=regenerate_installer_stages,
+                        prefetch=prefetch,
+                        unchanged=distro_unchanged,
                     )
                 for key in distro_broken.keys():
                     for pkg in distro_broken[key]:
                         total_broken.add(pkg)
                 total_changes[distro] = distro_changes
+                total_unchanged[distro] = distro_unchanged
                 total_installers[distro] = distro_installers
                 yoctoRecipe.generate_rosdistro_conf(_repo, args.ros_distro, skip_keys)
                 yoctoRecipe.generate_packagegroup_ros_world(_repo, args.ros_distro)
@@ -195,7 +265,7 @@ def main():
             sys.exit(0)
 
         # remove duplicates
-        delta = gen_delta_msg(total_changes)
+        delta = gen_delta_msg(total_changes, total_unchanged)
         missing_deps = gen_missing_deps_msg(total_broken)
         # Commit changes and file pull request
         overlay.commit_changes(args.ros_distro)
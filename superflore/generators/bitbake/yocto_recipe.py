@@ -24,20 +24,23 @@
 #
 
 import hashlib
-import os.path
+import os
 import tarfile
 from datetime import datetime
 from time import gmtime, strftime
-from urllib.request import urlretrieve
+import zlib
 
+from superflore.DigestService import hash_file
 from superflore.exceptions import NoPkgXml
 from superflore.exceptions import UnresolvedDependency
-from superflore.generators.bitbake.oe_query import OpenEmbeddedLayersDB
+from superflore.generators.bitbake.layer_index import get_layer_index
 from superflore.PackageMetadata import PackageMetadata
+from superflore.PackageXmlStore import get_package_xml_store
+from superflore.rosdistro_snapshot import download
+from superflore.rosdistro_snapshot import get_index
 from superflore.utils import err
 from superflore.utils import get_license
 from superflore.utils import get_pkg_version
-from superflore.utils import info
 from superflore.utils import make_dir
 from superflore.utils import ok
 from superflore.utils import resolve_dep
@@ -50,13 +53,14 @@ class yoctoRecipe(object):
     generated_recipes = []
 
     def __init__(
-        self, component_name, num_pkgs, pkg_name, pkg_xml, distro, src_uri, tar_dir,
-        md5_cache, sha256_cache, skip_keys
+        self, component_name, num_pkgs, pkg_name, pkg_xml, distro, src_uri,
+        archive_store, md5_cache, sha256_cache, skip_keys
     ):
         self.component = yoctoRecipe.convert_to_oe_name(component_name)
         self.num_pkgs = num_pkgs
         self.name = pkg_name
         self.distro = distro.name
+        self.ros_distro = distro
         self.version = get_pkg_version(distro, pkg_name, is_oe=True)
         self.src_uri = src_uri
         self.pkg_xml = pkg_xml
@@ -86,34 +90,34 @@ class yoctoRecipe(object):
         self.tdepends = set()
         self.tdepends_external = set()
         self.license_line = None
-        self.archive_name = None
         self.license_md5 = None
-        self.tar_dir = tar_dir
-        if self.getArchiveName() not in md5_cache or \
-           self.getArchiveName() not in sha256_cache:
-            self.downloadArchive()
-            md5_cache[self.getArchiveName()] = hashlib.md5(
-                open(self.getArchiveName(), 'rb').read()).hexdigest()
-            sha256_cache[self.getArchiveName()] = hashlib.sha256(
-                open(self.getArchiveName(), 'rb').read()).hexdigest()
-        self.src_sha256 = sha256_cache[self.getArchiveName()]
-        self.src_md5 = md5_cache[self.getArchiveName()]
+        self.archive_store = archive_store
+        self.archive_name = archive_store.get(
+            self.src_uri, {'md5': md5_cache, 'sha256': sha256_cache}
+        )
+        self.src_sha256 = sha256_cache[self.archive_name]
+        self.src_md5 = md5_cache[self.archive_name]
         self.skip_keys = skip_keys
 
     def getArchiveName(self):
-        if not self.archive_name:
-            self.archive_name = self.tar_dir + "/" \
-                + self.name.replace('-', '_') + '-' + str(self.version) \
-                + '-' + self.distro + '.tar.gz'
         return self.archive_name
 
+    @staticmethod
+    def get_legacy_archive_name(pkg_name, version, distro_name):
+        """The name older versions stored the source archive under."""
+        return '%s-%s-%s.tar.gz' % (
+            pkg_name.replace('-', '_'), version, distro_name
+        )
+
     def get_license_line(self):
         self.license_line = ''
         self.license_md5 = ''
         i = 0
         if not self.pkg_xml:
             raise NoPkgXml('No package xml file!')
-        for line in str(self.pkg_xml, 'utf-8').split('\n'):
+        # point into the package.xml as released, not the sanitized copy
+        # of the distribution cache
+        for line in self.get_released_pkg_xml().split('\n'):
             i += 1
             if 'license' in line:
                 self.license_line = str(i)
@@ -122,15 +126,29 @@ class yoctoRecipe(object):
                 self.license_md5 = md5.hexdigest()
                 break
 
+    def get_released_pkg_xml(self):
+        """
+        Return the package.xml of the package as released: read from the
+        source archive if it is there, else from the release repository.
+        """
+        if os.path.isfile(self.archive_name):
+            try:
+                with tarfile.open(self.archive_name, 'r:gz') as tar:
+                    for member in tar:
+                        parts = member.name.split('/')
+                        if parts[-1] == 'package.xml' and len(parts) == 2:
+                            return tar.extractfile(member).read().decode(
+                                'utf-8'
+                            )
+            except (OSError, tarfile.TarError):
+                pass
+        return get_package_xml_store(self.ros_distro).get_raw(self.name)
+
     def downloadArchive(self):
-        if os.path.exists(self.getArchiveName()):
-            info("using cached archive for package '%s'..." % self.name)
-        else:
-            info("downloading archive version for package '%s' from %s..." %
-                 (self.name, self.src_uri))
-            urlretrieve(self.src_uri, self.getArchiveName())
+        self.archive_name = self.archive_store.fetch(self.src_uri)
 
     def extractArchive(self):
+        self.downloadArchive()
         tar = tarfile.open(self.getArchiveName(), "r:gz")
         tar.extractall()
         tar.close()
@@ -252,8 +270,7 @@ class yoctoRecipe(object):
                         ret += yoctoRecipe.get_spacing_prefix() + dep + get_spacing_suffix(is_native)
                         print('Resolved in OE (cached): ' + dep)
                         continue
-                    oe_query = OpenEmbeddedLayersDB()
-                    oe_query.query_recipe(dep)
+                    oe_query = get_layer_index().query(dep)
                     if oe_query.exists():
                         ret += yoctoRecipe.get_spacing_prefix() + oe_query.name + get_spacing_suffix(is_native)
                         yoctoRecipe.resolved_deps_cache.add(dep)
@@ -415,40 +432,60 @@ class yoctoRecipe(object):
 
     @staticmethod
     def generate_distro_cache(basepath, distro, skip_keys=[]):
+        distro_cache_path = "{0}/files/".format(basepath)
+        distro_cache_file_path = '{0}{1}-cache.yaml'.format(
+            distro_cache_path, distro
+        )
         try:
-            distro_cache_path = "{0}/files/".format(basepath)
-            distro_cache_file_path = '{0}{1}-cache.yaml'.format(distro_cache_path, distro)
             make_dir(distro_cache_path)
-            from rosdistro import get_index, get_index_url, _get_dist_file_data
-            import gzip
-            try:
-                from urllib.request import urlopen
-            except ImportError:
-                from urllib2 import urlopen
-            try:
-                from cStringIO import StringIO
-            except ImportError:
-                from io import BytesIO as StringIO
-            index = get_index(get_index_url())
-            dist = index.distributions[distro]
-            url = dist['distribution_cache']
-            if url.endswith('.yaml'):
-                yaml_str = urlopen(url, timeout=10).read().decode('utf-8')
-            elif url.endswith('.yaml.gz'):
-                yaml_gz_str = urlopen(url, timeout=10).read()
-                yaml_gz_stream = StringIO(yaml_gz_str)
-                f = gzip.GzipFile(fileobj=yaml_gz_stream, mode='rb')
-                yaml_str = f.read()
-                if not isinstance(yaml_str, str):
-                    yaml_str = yaml_str.decode('utf-8')
-                f.close()
-            with open(distro_cache_file_path, "w") as distro_cache_file:
-                distro_cache_file.write(yaml_str)
+            url = get_index().distributions[distro]['distribution_cache']
+            if yoctoRecipe.download_distro_cache(url, distro_cache_file_path):
                 ok('Wrote {0}'.format(distro_cache_file_path))
+            else:
+                ok('{0} is up to date'.format(distro_cache_file_path))
         except Exception as e:
             err("Failed to write distro cache {0} to disk!".format(distro_cache_file_path))
             raise e
 
+    @staticmethod
+    def download_distro_cache(url, path):
+        """
+        Write the distribution cache at url to path, decompressing it if
+        it is gzipped. The download is shared with the one the distro was
+        read from (see rosdistro_snapshot.download), and the file is only
+        rewritten if its content changed. Returns whether it was.
+        """
+        local_path, _ = download(url)
+        current = None
+        if os.path.isfile(path):
+            current = hash_file(path, ['sha256'])[1]['sha256']
+        decompressor = None
+        if url.endswith('.gz'):
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        sha256 = hashlib.sha256()
+        part = path + '.part'
+        try:
+            with open(local_path, 'rb') as src, open(part, 'wb') as f:
+                for chunk in iter(lambda: src.read(1 << 16), b''):
+                    if decompressor:
+                        chunk = decompressor.decompress(chunk)
+                    sha256.update(chunk)
+                    f.write(chunk)
+                if decompressor:
+                    chunk = decompressor.flush()
+                    sha256.update(chunk)
+                    f.write(chunk)
+            changed = sha256.hexdigest() != current
+            if changed:
+                os.replace(part, path)
+            else:
+                os.remove(part)
+        except Exception:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+        return changed
+
     @staticmethod
     def get_unresolved_cache():
         return yoctoRecipe.unresolved_deps_cache
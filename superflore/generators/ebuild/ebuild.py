@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import OrderedDict
 from time import gmtime, strftime
 
 from superflore.exceptions import UnknownBuildType
@@ -28,6 +29,82 @@ depend_only_pkgs = [
     'virtual/pkgconfig'
 ]
 
+# Sections of the ebuild, indented with tabs as in the output.
+_license_template = \
+    '# Copyright {year} {distributor}\n' \
+    '# Distributed under the terms of the {license_text} license\n\n'
+
+_header_template = \
+    'DESCRIPTION="{description}"\n' \
+    'HOMEPAGE="{homepage}"\n' \
+    'SRC_URI="{src_uri} -> ${{PN}}-{distro}-release-${{PV}}.tar.gz"\n\n'
+
+_ros_distro_template = \
+    'ROS_DISTRO="{distro}"\n' \
+    'ROS_PREFIX="opt/ros/${{ROS_DISTRO}}"\n'
+
+_src_prepare_template = \
+    '\nsrc_prepare() {{\n' \
+    '\tcd ${{P}}\n' \
+    '\tEPATCH_SOURCE="${{FILESDIR}}" EPATCH_SUFFIX="patch" \\\n' \
+    '\tEPATCH_FORCE="yes" epatch\n' \
+    '{ros_cmake}' \
+    '}}\n'
+
+_src_configure = {
+    'opencv3':
+        '\nsrc_configure() {\n'
+        '\tfilter-flags \'-march=*\' \'-mcpu=*\' \'-mtune=*\'\n'
+        '\tif [[ $(gcc-major-version) -gt 4 ]]; then\n'
+        '\t\tlocal mycmakeargs=(\n'
+        '\t\t\t-DWITH_CUDA=OFF\n'
+        '\t\t)\n'
+        '\t\tewarn "Cuda does not support GCC > 4, so cuda'
+        ' has been disabled."\n'
+        '\tfi\n'
+        '\tros-cmake_src_configure\n'
+        '}\n',
+    'stage':
+        '\nsrc_configure() {\n'
+        '\tfilter-flags \'-std=*\'\n'
+        '\tros-cmake_src_configure\n'
+        '}\n',
+}
+
+
+class DependencySet(object):
+    """
+    Insertion-ordered set of dependencies. Duplicates are dropped on
+    insert, and the sorted view is cached until the next change.
+    """
+    def __init__(self, items=()):
+        self._items = OrderedDict()
+        self._sorted = None
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if item not in self._items:
+            self._items[item] = None
+            self._sorted = None
+
+    def sorted(self):
+        if self._sorted is None:
+            self._sorted = tuple(sorted(self._items))
+        return self._sorted
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return 'DependencySet(%r)' % list(self._items)
+
 
 class ebuild_keyword(object):
     def __init__(self, arch, stable):
@@ -56,12 +133,12 @@ class Ebuild(object):
         self.src_uri = None
         self.upstream_license = ["LGPL-2"]
         self.keys = list()
-        self.rdepends = list()
-        self.rdepends_external = list()
-        self.depends = list()
-        self.depends_external = list()
-        self.tdepends = list()
-        self.tdepends_external = list()
+        self.rdepends = DependencySet()
+        self.rdepends_external = DependencySet()
+        self.depends = DependencySet()
+        self.depends_external = DependencySet()
+        self.tdepends = DependencySet()
+        self.tdepends_external = DependencySet()
         self.distro = None
         self.cmake_package = True
         self.base_yml = None
@@ -80,33 +157,33 @@ class Ebuild(object):
         elif depend in self.rdepends_external:
             return
         elif internal:
-            self.depends.append(depend)
+            self.depends.add(depend)
         else:
-            self.depends_external.append(depend)
+            self.depends_external.add(depend)
 
     def add_run_depend(self, rdepend, internal=True):
         if rdepend in depend_only_pkgs and not internal:
-            self.depends_external.append(rdepend)
+            self.depends_external.add(rdepend)
         elif internal:
-            self.rdepends.append(rdepend)
+            self.rdepends.add(rdepend)
         else:
-            self.rdepends_external.append(rdepend)
+            self.rdepends_external.add(rdepend)
 
     def add_test_depend(self, tdepend, internal=True):
         if not internal:
-            self.tdepends_external.append(tdepend)
+            self.tdepends_external.add(tdepend)
         else:
-            self.tdepends.append(tdepend)
+            self.tdepends.add(tdepend)
 
     def add_keyword(self, keyword, stable=False):
         self.keys.append(ebuild_keyword(keyword, stable))
 
     def get_license_line(self, distributor, license_text):
-        ret = "# Copyright " + strftime("%Y", gmtime()) + " "
-        ret += distributor + "\n"
-        ret += "# Distributed under the terms of the " + license_text
-        ret += " license\n\n"
-        return ret
+        return _license_template.format(
+            year=strftime("%Y", gmtime()),
+            distributor=distributor,
+            license_text=license_text,
+        )
 
     def get_eapi_line(self):
         return 'EAPI=%s\n' % self.eapi
@@ -130,140 +207,127 @@ class Ebuild(object):
         else:
             raise UnknownBuildType(self.build_type)
 
+    def get_license_lines(self):
+        # license -- only add if valid
+        if len(self.upstream_license) == 1:
+            self.upstream_license = [
+                lic.replace(', ', ' ') for lic in self.upstream_license
+            ]
+            split = self.upstream_license[0].split(',')
+            if len(split) > 1:
+                # they did something like "BSD,GPL,blah"
+                return 'LICENSE="( %s )"\n' % ' '.join(
+                    [get_license(lic.strip()) for lic in split]
+                )
+            return 'LICENSE="%s"\n\n' % get_license(
+                self.upstream_license[0]
+            )
+        return 'LICENSE="( %s )"\n' % ' '.join(
+            [get_license(ul) for ul in self.upstream_license]
+        )
+
     def get_ebuild_text(self, distributor, license_text):
         """
         Generate the ebuild in text, given the distributor line
         and the license text.
         """
+        ret = list()
+        add = ret.append
         # EAPI=<eapi>
-        ret = self.get_license_line(distributor, license_text)
-        ret += self.get_eapi_line()
+        add(self.get_license_line(distributor, license_text))
+        add(self.get_eapi_line())
         if self.python_3 and not self.is_ros2:
             # enable python 2.7 and python 3.5
-            ret += self.get_python_compat(['2_7', '3_5', '3_6'])
+            add(self.get_python_compat(['2_7', '3_5', '3_6']))
         elif self.python_3:
             # only use 3.5, 3.6 for ROS 2
-            ret += self.get_python_compat(['3_5', '3_6'])
+            add(self.get_python_compat(['3_5', '3_6']))
         else:
             # fallback to python 2.7
-            ret += self.get_python_compat(['2_7'])
+            add(self.get_python_compat(['2_7']))
         # inherits
-        ret += self.get_inherit_line()
+        add(self.get_inherit_line())
         # description, homepage, src_uri
         self.description =\
             sanitize_string(self.description, self.illegal_desc_chars)
         self.description = trim_string(self.description)
-        ret += "DESCRIPTION=\"" + self.description + "\"\n"
-        ret += "HOMEPAGE=\"" + self.homepage + "\"\n"
         self.src_uri = self.src_uri.replace(self.name, '${PN}')
-        ret += "SRC_URI=\"" + self.src_uri
-        ret += " -> ${PN}-" + self.distro + "-release-${PV}.tar.gz\"\n\n"
-        # license -- only add if valid
-        if len(self.upstream_license) == 1:
-            self.upstream_license = [
-                l.replace(', ', ' ') for l in self.upstream_license
-            ]
-            split = self.upstream_license[0].split(',')
-            if len(split) > 1:
-                # they did something like "BSD,GPL,blah"
-                ret += 'LICENSE="( '
-                ret += ' '.join([get_license(l.strip()) for l in split])
-                ret += ' )"\n'
-            else:
-                ret += "LICENSE=\""
-                ret += get_license(self.upstream_license[0]) + "\"\n\n"
-        else:
-            ret += "LICENSE=\"( "
-            ret += ' '.join(
-                [get_license(ul) for ul in self.upstream_license]
-            )
-            ret += " )\"\n"
+        add(_header_template.format(
+            description=self.description,
+            homepage=self.homepage,
+            src_uri=self.src_uri,
+            distro=self.distro,
+        ))
+        add(self.get_license_lines())
         # iterate through the keywords, adding to the KEYWORDS line.
-        ret += "KEYWORDS=\""
-        ret += ' '.join([key.to_string() for key in self.keys])
-        ret += "\"\n"
+        add('KEYWORDS="%s"\n' % ' '.join(
+            [key.to_string() for key in self.keys]
+        ))
         if len(self.tdepends) or len(self.tdepends_external):
-            ret += 'IUSE="test"\n'
+            add('IUSE="test"\n')
         # RDEPEND
-        ret += "RDEPEND=\"\n"
-        for rdep in sorted(self.rdepends):
-            ret += "    " + "ros-" + self.distro + "/" + rdep + "\n"
+        add('RDEPEND="\n')
+        ros_prefix = '\tros-%s/' % self.distro
+        for rdep in self.rdepends.sorted():
+            add(ros_prefix + rdep + '\n')
         # internal test dependencies
-        for tdep in sorted(self.tdepends):
-            ret += "    " + "test? ( ros-" + self.distro + "/" + tdep + " )\n"
-        for rdep in sorted(self.rdepends_external):
+        for tdep in self.tdepends.sorted():
+            add('\ttest? ( ros-%s/%s )\n' % (self.distro, tdep))
+        for rdep in self.rdepends_external.sorted():
             try:
                 for res in resolve_dep(rdep, 'gentoo', self.distro)[0]:
                     if res in depend_only_pkgs:
-                        self.depends_external.append(rdep)
+                        self.depends_external.add(rdep)
                         break
                     else:
-                        ret += "    " + res + "\n"
+                        add('\t' + res + '\n')
             except UnresolvedDependency:
                 self.unresolved_deps.append(rdep)
         # external test dependencies
-        for tdep in sorted(self.tdepends_external):
+        for tdep in self.tdepends_external.sorted():
             try:
                 for res in resolve_dep(tdep, 'gentoo', self.distro)[0]:
-                    ret += "    test? ( " + res + " )\n"
+                    add('\ttest? ( ' + res + ' )\n')
             except UnresolvedDependency:
                 self.unresolved_deps.append(tdep)
-        ret += "\"\n"
+        add('"\n')
         # DEPEND
-        ret += "DEPEND=\"${RDEPEND}\n"
-        for bdep in sorted(self.depends):
-            ret += "    " + 'ros-{0}/{1}\n'.format(self.distro, bdep)
-        for bdep in sorted(self.depends_external):
+        add('DEPEND="${RDEPEND}\n')
+        for bdep in self.depends.sorted():
+            add(ros_prefix + bdep + '\n')
+        for bdep in self.depends_external.sorted():
             try:
                 for res in resolve_dep(bdep, 'gentoo', self.distro)[0]:
-                    ret += "    " + res + "\n"
+                    add('\t' + res + '\n')
             except UnresolvedDependency:
                 self.unresolved_deps.append(bdep)
-        ret += "\"\n\n"
+        add('"\n\n')
 
         # SLOT
-        ret += "SLOT=\"0\"\n"
+        add('SLOT="0"\n')
         # CMAKE_BUILD_TYPE
         if self.name == "catkin":
-            ret += "BUILD_BINARY=\"0\"\n"
-        ret += "ROS_DISTRO=\"{0}\"\n".format(self.distro)
-        ret += "ROS_PREFIX=\"opt/ros/${ROS_DISTRO}\"\n"
+            add('BUILD_BINARY="0"\n')
+        add(_ros_distro_template.format(distro=self.distro))
 
         # Patch source if needed.
         if self.has_patches:
             # TODO(allenh1): explicitly list patches
-            ret += "\nsrc_prepare() {\n"
-            ret += "    cd ${P}\n"
-            ret += "    EPATCH_SOURCE=\"${FILESDIR}\""
-            ret += " EPATCH_SUFFIX=\"patch\" \\\n"
-            ret += "    EPATCH_FORCE=\"yes\" epatch\n"
-            if self.build_type in ['catkin', 'cmake']:
-                ret += "    ros-cmake_src_prepare\n"
-            ret += "}\n"
+            add(_src_prepare_template.format(
+                ros_cmake='\tros-cmake_src_prepare\n'
+                if self.build_type in ['catkin', 'cmake'] else ''
+            ))
 
         # source configuration
-        if self.name == 'opencv3':
-            ret += "\nsrc_configure() {\n"
-            ret += "    filter-flags '-march=*' '-mcpu=*' '-mtune=*'\n"
-            ret += "    if [[ $(gcc-major-version) -gt 4 ]]; then\n"
-            ret += "        local mycmakeargs=(\n"
-            ret += "            -DWITH_CUDA=OFF\n"
-            ret += "        )\n"
-            ret += '        ewarn "Cuda does not support GCC > 4, so cuda'
-            ret += ' has been disabled."\n'
-            ret += "    fi\n"
-            ret += "    ros-cmake_src_configure\n"
-            ret += "}\n"
-        elif self.name == 'stage':
-            ret += "\nsrc_configure() {\n"
-            ret += "    filter-flags '-std=*'\n"
-            ret += "    ros-cmake_src_configure\n"
-            ret += "}\n"
+        if self.name in _src_configure:
+            add(_src_configure[self.name])
 
         if len(self.unresolved_deps) > 0:
             raise UnresolvedDependency("failed to satisfy dependencies!")
 
-        return ret.replace('    ', '\t')
+        # the fields above may contain indentation of their own, which
+        # is converted to tabs like the rest of the ebuild.
+        return ''.join(ret).replace('    ', '\t')
 
     def get_unresolved(self):
         return self.unresolved_deps
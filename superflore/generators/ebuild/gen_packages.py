@@ -12,24 +12,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import glob
 import os
+from types import SimpleNamespace
 
-from rosdistro.dependency_walker import DependencyWalker
 from rosdistro.manifest_provider import get_release_tag
-from rosdistro.rosdistro import RosPackage
 from rosinstall_generator.distro import _generate_rosinstall
-from rosinstall_generator.distro import get_package_names
+from superflore.DependencyGraph import get_dependency_graph
+from superflore.DistroIndex import get_distro_index
 from superflore.exceptions import UnresolvedDependency
 from superflore.generators.ebuild.ebuild import Ebuild
 from superflore.generators.ebuild.metadata_xml import metadata_xml
 from superflore.PackageMetadata import PackageMetadata
+from superflore.PackageXmlStore import get_package_xml_store
+from superflore.pipeline import Done
+from superflore.pipeline import run_stages
+from superflore.pipeline import Stage
 from superflore.utils import err
-from superflore.utils import get_pkg_version
+from superflore.utils import file_has_text
 from superflore.utils import make_dir
 from superflore.utils import ok
 from superflore.utils import ros2_distros
 from superflore.utils import warn
+from superflore.utils import write_if_changed
 
 # TODO(allenh1): This is a blacklist of things that
 # do not yet support Python 3. This will be updated
@@ -43,36 +47,36 @@ org_license = "BSD"
 
 
 def regenerate_pkg(overlay, pkg, distro, preserve_existing=False):
-    version = get_pkg_version(distro, pkg)
+    return run_stages(
+        regenerate_pkg_stages, overlay, pkg, distro, preserve_existing
+    )
+
+
+def _fetch_pkg(overlay, pkg, distro, preserve_existing=False):
+    distro_index = get_distro_index(distro)
+    version = distro_index.get_version(pkg)
     ebuild_name =\
         '/ros-{0}/{1}/{1}-{2}.ebuild'.format(distro.name, pkg, version)
     ebuild_name = overlay.repo.repo_dir + ebuild_name
-    patch_path = '/ros-{}/{}/files'.format(distro.name, pkg)
-    patch_path = overlay.repo.repo_dir + patch_path
+    pkg_dir = '{0}/ros-{1}/{2}'.format(
+        overlay.repo.repo_dir, distro.name, pkg
+    )
+    patch_path = pkg_dir + '/files'
     is_ros2 = distro.name in ros2_distros
-    has_patches = os.path.exists(patch_path)
-    pkg_names = get_package_names(distro)[0]
+    has_patches = overlay.index.isdir(patch_path)
     patches = None
-    if os.path.exists(patch_path):
-        patches = [
-            f for f in glob.glob('%s/*.patch' % patch_path)
-        ]
-    if pkg not in pkg_names:
+    if has_patches:
+        patches = overlay.index.find(patch_path, suffix='.patch')
+    if pkg not in distro_index.package_names:
         raise RuntimeError("Unknown package '%s'" % (pkg))
-    # otherwise, remove a (potentially) existing ebuild.
-    prefix = '{0}/ros-{1}/{2}/'.format(overlay.repo.repo_dir, distro.name, pkg)
-    existing = glob.glob('%s*.ebuild' % prefix)
+    # an existing ebuild is only removed once we know it changed.
+    existing = overlay.index.find(pkg_dir, pkg + '-', '.ebuild')
     previous_version = None
-    if preserve_existing and os.path.isfile(ebuild_name):
+    if preserve_existing and overlay.index.isfile(ebuild_name):
         ok("ebuild for package '%s' up to date, skipping..." % pkg)
-        return None, []
+        return Done((None, []))
     elif existing:
-        overlay.repo.remove_file(existing[0])
-        previous_version = existing[0].lstrip(prefix).rstrip('.ebuild')
-        manifest_file = '{0}/ros-{1}/{2}/Manifest'.format(
-            overlay.repo.repo_dir, distro.name, pkg
-        )
-        overlay.repo.remove_file(manifest_file)
+        previous_version = get_ebuild_version(pkg, existing[0])
     try:
         current = gentoo_installer(distro, pkg, has_patches)
         current.ebuild.name = pkg
@@ -81,50 +85,99 @@ def regenerate_pkg(overlay, pkg, distro, preserve_existing=False):
     except Exception as e:
         err('Failed to generate installer for package {}!'.format(pkg))
         raise e
+    return SimpleNamespace(
+        overlay=overlay, pkg=pkg, distro=distro, version=version,
+        current=current, previous_version=previous_version,
+        existing=existing, ebuild_name=ebuild_name, pkg_dir=pkg_dir
+    )
+
+
+def get_ebuild_version(pkg, ebuild_file):
+    """Get the version from the file name of the package's ebuild."""
+    name = os.path.basename(ebuild_file)
+    return name[len(pkg) + 1:-len('.ebuild')]
+
+
+def _remove_existing(job):
+    """Remove the previous ebuild of the package and its Manifest."""
+    if not job.existing:
+        return
+    index = job.overlay.index
+    job.overlay.repo.remove_file(job.existing[0])
+    index.remove_file(job.existing[0])
+    manifest_file = job.pkg_dir + '/Manifest'
+    if index.isfile(manifest_file):
+        job.overlay.repo.remove_file(manifest_file)
+        index.remove_file(manifest_file)
+
+
+def _render_pkg(job):
+    current = job.current
     try:
-        ebuild_text = current.ebuild_text()
-        metadata_text = current.metadata_text()
+        job.ebuild_text = current.ebuild_text()
+        job.metadata_text = current.metadata_text()
     except UnresolvedDependency:
         dep_err = 'Failed to resolve required dependencies for'
-        err("{0} package {1}!".format(dep_err, pkg))
+        err("{0} package {1}!".format(dep_err, job.pkg))
         unresolved = current.ebuild.get_unresolved()
         for dep in unresolved:
             err(" unresolved: \"{}\"".format(dep))
-        return None, current.ebuild.get_unresolved()
+        # don't leave the stale ebuild behind
+        _remove_existing(job)
+        return Done((None, current.ebuild.get_unresolved()))
     except KeyError as ke:
-        err("Failed to parse data for package {}!".format(pkg))
+        err("Failed to parse data for package {}!".format(job.pkg))
+        _remove_existing(job)
         raise ke
-    make_dir(
-        "{}/ros-{}/{}".format(overlay.repo.repo_dir, distro.name, pkg)
+    return job
+
+
+def _write_pkg(job):
+    overlay, pkg = job.overlay, job.pkg
+    metadata_file = job.pkg_dir + '/metadata.xml'
+    ebuild_changed = not (
+        overlay.index.isfile(job.ebuild_name) and
+        file_has_text(job.ebuild_name, job.ebuild_text)
     )
+    if not ebuild_changed and overlay.index.isfile(metadata_file) and \
+            file_has_text(metadata_file, job.metadata_text):
+        ok('Installer for package \'{0}\' is unchanged.'.format(pkg))
+        job.current.unchanged = True
+        return job.current, job.previous_version
+    if ebuild_changed:
+        _remove_existing(job)
+    make_dir(job.pkg_dir)
     success_msg = 'Successfully generated installer for package'
     ok('{0} \'{1}\'.'.format(success_msg, pkg))
 
     try:
-        ebuild_file = '{0}/ros-{1}/{2}/{2}-{3}.ebuild'.format(
-            overlay.repo.repo_dir,
-            distro.name, pkg, version
-        )
-        ebuild_file = open(ebuild_file, "w")
-        metadata_file = '{0}/ros-{1}/{2}/metadata.xml'.format(
-            overlay.repo.repo_dir,
-            distro.name, pkg
-        )
-        metadata_file = open(metadata_file, "w")
-        ebuild_file.write(ebuild_text)
-        metadata_file.write(metadata_text)
+        if ebuild_changed:
+            with open(job.ebuild_name, 'w', encoding='utf-8') as ebuild_file:
+                ebuild_file.write(job.ebuild_text)
+            overlay.index.add_file(job.ebuild_name)
+        if write_if_changed(metadata_file, job.metadata_text):
+            overlay.index.add_file(metadata_file)
     except Exception as e:
         err("Failed to write ebuild/metadata to disk!")
         raise e
-    return current, previous_version
+    return job.current, job.previous_version
+
+
+# fetching package data from the network dominates, so that stage gets
+# one worker per job; rendering and writing happen on a single worker.
+regenerate_pkg_stages = [
+    Stage('fetch', _fetch_pkg, io_bound=True),
+    Stage('render', _render_pkg),
+    Stage('write', _write_pkg),
+]
 
 
 def _gen_metadata_for_package(
-    distro, pkg_name, pkg, repo, ros_pkg, pkg_rosinstall
+    distro, pkg_name, pkg, repo, pkg_rosinstall
 ):
     pkg_metadata_xml = metadata_xml()
     try:
-        pkg_xml = ros_pkg.get_package_xml(distro.name)
+        pkg_xml = get_package_xml_store(distro).get(pkg_name)
     except Exception:
         warn("fetch metadata for package {}".format(pkg_name))
         return pkg_metadata_xml
@@ -138,37 +191,37 @@ def _gen_metadata_for_package(
 
 
 def _gen_ebuild_for_package(
-    distro, pkg_name, pkg, repo, ros_pkg, pkg_rosinstall
+    distro, pkg_name, pkg, repo, pkg_rosinstall
 ):
     pkg_ebuild = Ebuild()
 
     pkg_ebuild.distro = distro.name
     pkg_ebuild.src_uri = pkg_rosinstall[0]['tar']['uri']
-    pkg_names = get_package_names(distro)
-    pkg_dep_walker = DependencyWalker(distro)
+    pkg_names = get_distro_index(distro).package_names
+    pkg_depends = get_dependency_graph(distro).get_all_depends(pkg_name)
 
-    pkg_buildtool_deps = pkg_dep_walker.get_depends(pkg_name, "buildtool")
-    pkg_build_deps = pkg_dep_walker.get_depends(pkg_name, "build")
-    pkg_run_deps = pkg_dep_walker.get_depends(pkg_name, "run")
-    pkg_test_deps = pkg_dep_walker.get_depends(pkg_name, "test")
+    pkg_buildtool_deps = pkg_depends['buildtool']
+    pkg_build_deps = pkg_depends['build']
+    pkg_run_deps = pkg_depends['run']
+    pkg_test_deps = pkg_depends['test']
 
     pkg_keywords = ['x86', 'amd64', 'arm', 'arm64']
 
     # add run dependencies
     for rdep in pkg_run_deps:
-        pkg_ebuild.add_run_depend(rdep, rdep in pkg_names[0])
+        pkg_ebuild.add_run_depend(rdep, rdep in pkg_names)
 
     # add build dependencies
     for bdep in pkg_build_deps:
-        pkg_ebuild.add_build_depend(bdep, bdep in pkg_names[0])
+        pkg_ebuild.add_build_depend(bdep, bdep in pkg_names)
 
     # add build tool dependencies
     for tdep in pkg_buildtool_deps:
-        pkg_ebuild.add_build_depend(tdep, tdep in pkg_names[0])
+        pkg_ebuild.add_build_depend(tdep, tdep in pkg_names)
 
     # add test dependencies
     for test_dep in pkg_test_deps:
-        pkg_ebuild.add_test_depend(test_dep, test_dep in pkg_names[0])
+        pkg_ebuild.add_test_depend(test_dep, test_dep in pkg_names)
 
     # add keywords
     for key in pkg_keywords:
@@ -176,7 +229,7 @@ def _gen_ebuild_for_package(
 
     # parse through package xml
     try:
-        pkg_xml = ros_pkg.get_package_xml(distro.name)
+        pkg_xml = get_package_xml_store(distro).get(pkg_name)
     except Exception:
         warn("fetch metadata for package {}".format(pkg_name))
         return pkg_ebuild
@@ -192,7 +245,6 @@ class gentoo_installer(object):
     def __init__(self, distro, pkg_name, has_patches=False):
         pkg = distro.release_packages[pkg_name]
         repo = distro.repositories[pkg.repository_name].release_repository
-        ros_pkg = RosPackage(pkg_name, repo)
 
         pkg_rosinstall =\
             _generate_rosinstall(pkg_name, repo.url,
@@ -200,11 +252,13 @@ class gentoo_installer(object):
 
         self.metadata_xml =\
             _gen_metadata_for_package(distro, pkg_name,
-                                      pkg, repo, ros_pkg, pkg_rosinstall)
+                                      pkg, repo, pkg_rosinstall)
         self.ebuild =\
             _gen_ebuild_for_package(distro, pkg_name,
-                                    pkg, repo, ros_pkg, pkg_rosinstall)
+                                    pkg, repo, pkg_rosinstall)
         self.ebuild.has_patches = has_patches
+        # set when the ebuild and metadata.xml on disk are up to date
+        self.unchanged = False
 
         if pkg_name in no_python3:
             self.ebuild.python_3 = False
@@ -0,0 +1,167 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Write thin Gentoo Manifests (DIST entries only), as `repoman manifest`
+would, without needing a Gentoo container.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import os
+import re
+
+from superflore.ArchiveStore import evict_files
+from superflore.DigestService import get_digest_service
+from superflore.DownloadManager import get_download_manager
+from superflore.utils import err
+from superflore.utils import info
+from superflore.utils import make_dir
+from superflore.utils import write_if_changed
+
+_src_uri_re = re.compile(r'^SRC_URI="([^"]*)"', re.MULTILINE)
+_revision_re = re.compile(r'-r[0-9]+$')
+_manifest_hashes = ('blake2b', 'sha512')
+
+
+def get_ebuild_vars(pkg, ebuild_file):
+    """Get the variables the ebuild's SRC_URI may refer to."""
+    name = os.path.basename(ebuild_file)
+    version = _revision_re.sub('', name[len(pkg) + 1:-len('.ebuild')])
+    return {'PN': pkg, 'PV': version, 'P': '%s-%s' % (pkg, version)}
+
+
+def expand_vars(text, ebuild_vars):
+    for var, value in ebuild_vars.items():
+        text = text.replace('${%s}' % var, value)
+    return text
+
+
+def parse_src_uri(ebuild_text, ebuild_vars):
+    """
+    Return the (url, distfile) pairs in the SRC_URI of the ebuild,
+    with the variables expanded.
+    """
+    match = _src_uri_re.search(ebuild_text)
+    if not match:
+        return []
+    ret = list()
+    tokens = iter(match.group(1).split())
+    for token in tokens:
+        if token in ('(', ')') or token.endswith('?'):
+            # USE conditional groups
+            continue
+        if token == '->':
+            distfile = expand_vars(next(tokens), ebuild_vars)
+            ret[-1] = (ret[-1][0], distfile)
+            continue
+        url = expand_vars(token, ebuild_vars)
+        ret.append((url, url.rsplit('/', 1)[-1]))
+    return ret
+
+
+def get_distfiles(pkg_dir):
+    """Map each distfile of the package's ebuilds to its url."""
+    pkg = os.path.basename(pkg_dir)
+    distfiles = dict()
+    for ebuild_file in sorted(glob.glob('%s/*.ebuild' % pkg_dir)):
+        with open(ebuild_file, 'r') as ebuild:
+            ebuild_text = ebuild.read()
+        ebuild_vars = get_ebuild_vars(pkg, ebuild_file)
+        for url, distfile in parse_src_uri(ebuild_text, ebuild_vars):
+            distfiles.setdefault(distfile, url)
+    return distfiles
+
+
+def fetch_distfile(url, distfile_dir, distfile):
+    """Download the distfile, unless it is already in the directory."""
+    path = os.path.join(distfile_dir, distfile)
+    if os.path.isfile(path):
+        # its modification time records when it was last used
+        os.utime(path)
+    else:
+        info("downloading '%s' from %s..." % (distfile, url))
+        get_download_manager().download(url, path)
+    return path
+
+
+def get_manifest_text(pkg_dir, distfile_dir, distfiles=None):
+    if distfiles is None:
+        distfiles = get_distfiles(pkg_dir)
+    digest_service = get_digest_service()
+    # hash all of the package's distfiles at once
+    futures = [
+        (distfile, digest_service.submit(
+            fetch_distfile(url, distfile_dir, distfile), _manifest_hashes
+        )) for distfile, url in sorted(distfiles.items())
+    ]
+    lines = list()
+    for distfile, future in futures:
+        size, digests = future.result()
+        lines.append('DIST {0} {1} BLAKE2B {2} SHA512 {3}\n'.format(
+            distfile, size, digests['blake2b'], digests['sha512']
+        ))
+    return ''.join(lines)
+
+
+def write_manifest(pkg_dir, distfile_dir, distfiles=None):
+    """
+    Write the Manifest for the package directory, downloading its
+    distfiles (as found by get_distfiles, unless given) into
+    distfile_dir when they are not there yet.
+    Returns True if the Manifest was written.
+    """
+    manifest_text = get_manifest_text(pkg_dir, distfile_dir, distfiles)
+    if not manifest_text:
+        # like repoman, don't write a Manifest without entries
+        return False
+    return write_if_changed(
+        os.path.join(pkg_dir, 'Manifest'), manifest_text
+    )
+
+
+def write_manifests(pkg_dirs, distfile_dir, jobs=1, max_size=None):
+    """
+    Write the Manifests for the package directories, jobs at a time.
+    When max_size (in bytes) is set, the least recently used distfiles
+    are evicted afterwards to stay within it, except those of these
+    packages.
+    Returns the package directories whose Manifest could not be written.
+    """
+    make_dir(distfile_dir)
+    failed = list()
+    distfiles = {pkg_dir: get_distfiles(pkg_dir) for pkg_dir in pkg_dirs}
+    # hand every distfile to the download manager up front
+    get_download_manager(jobs).prefetch(
+        (url, os.path.join(distfile_dir, distfile))
+        for pkg_distfiles in distfiles.values()
+        for distfile, url in pkg_distfiles.items()
+    )
+
+    def write(pkg_dir):
+        try:
+            write_manifest(pkg_dir, distfile_dir, distfiles[pkg_dir])
+        except Exception as e:
+            err("Failed to write Manifest for '%s': %s" % (pkg_dir, e))
+            failed.append(pkg_dir)
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        list(executor.map(write, pkg_dirs))
+    if max_size is not None:
+        evictions = evict_files(distfile_dir, max_size, keep=set(
+            distfile for pkg_distfiles in distfiles.values()
+            for distfile in pkg_distfiles
+        ))
+        if evictions:
+            info('Evicted {0} distfiles'.format(evictions))
+    return sorted(failed)
@@ -12,14 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent.futures import ThreadPoolExecutor
 import os
 import time
 
 import docker
+from superflore.cache_dir import get_cache_dir
 from superflore.docker import Docker
+from superflore.exceptions import ShardsFailed
+from superflore.generators.ebuild.manifest import write_manifests
+from superflore.OverlayIndex import OverlayIndex
 from superflore.repo_instance import RepoInstance
+from superflore.utils import err
 from superflore.utils import info
+from superflore.utils import ok
 from superflore.utils import rand_ascii_str
+from superflore.utils import split_shards
 
 
 class RosOverlay(object):
@@ -27,6 +35,8 @@ class RosOverlay(object):
         self.repo = RepoInstance(
             org, repo, repo_dir=repo_dir, do_clone=do_clone, from_branch=from_branch
         )
+        # ros-<distro>/<package>/files
+        self.index = OverlayIndex(self.repo.repo_dir, ['ros-'], depth=3)
         self.branch_name = 'gentoo-bot-%s' % rand_ascii_str()
         info('Creating new branch {0}...'.format(self.branch_name))
         self.repo.create_branch(self.branch_name)
@@ -49,8 +59,46 @@ class RosOverlay(object):
         self.repo.git.commit(m='{0}'.format(commit_msg))
 
     def regenerate_manifests(
-        self, regen_dict, image_owner='allenh1', image_name='ros_gentoo_base'
+        self, regen_dict, distfile_dir=None, jobs=1, verify=False,
+        max_size=None
     ):
+        """
+        Write the Manifests of the regenerated packages natively.
+        The distfiles are downloaded into (or reused from) distfile_dir,
+        which is then kept within max_size bytes, if set.
+        With verify, repoman checks the result in a Gentoo container.
+        Returns the package directories whose Manifest is missing.
+        """
+        distfile_dir = distfile_dir or get_cache_dir('distfiles')
+        pkg_dirs = [
+            '{0}/ros-{1}/{2}'.format(self.repo.repo_dir, key, pkg)
+            for key in regen_dict.keys() for pkg in regen_dict[key]
+        ]
+        info('Generating manifests...')
+        failed = write_manifests(pkg_dirs, distfile_dir, jobs, max_size)
+        for pkg_dir in pkg_dirs:
+            manifest_file = os.path.join(pkg_dir, 'Manifest')
+            if os.path.isfile(manifest_file):
+                self.index.add_file(manifest_file)
+        if failed:
+            err('Failed to generate {0} manifests:'.format(len(failed)))
+            for pkg_dir in failed:
+                err('  {0}'.format(pkg_dir))
+        if verify:
+            self.run_repoman(
+                regen_dict, 'manifest-check', jobs, distfile_dir
+            )
+        return failed
+
+    def run_repoman(
+        self, regen_dict, mode='manifest', shards=1, distfile_dir=None,
+        image_owner='allenh1', image_name='ros_gentoo_base'
+    ):
+        """
+        Run repoman in the directories of the packages, split into shards
+        running in parallel containers. Every shard runs to completion,
+        and ShardsFailed is raised afterwards if any of them failed.
+        """
         info(
             "Pulling docker image '%s/%s:latest'..." % (
                 image_owner, image_name
@@ -58,23 +106,55 @@ class RosOverlay(object):
         )
         dock = Docker()
         dock.pull(image_owner, image_name)
-        info('Running docker image...')
-        info('Generating manifests...')
-        dock.map_directory(
-            '/home/%s/.gnupg' % os.getenv('USER'),
-            '/root/.gnupg'
-        )
-        dock.map_directory(self.repo.repo_dir, '/tmp/ros-overlay')
-        for key in regen_dict.keys():
-            for pkg in regen_dict[key]:
-                pkg_dir = '/tmp/ros-overlay/ros-{0}/{1}'.format(key, pkg)
-                dock.add_bash_command('cd {0}'.format(pkg_dir))
-                dock.add_bash_command('repoman manifest')
-        try:
-            dock.run(show_cmd=True)
-        except docker.errors.ContainerError:
-            print(dock.log)
-            raise
+        pkg_dirs = [
+            '/tmp/ros-overlay/ros-{0}/{1}'.format(key, pkg)
+            for key in regen_dict.keys() for pkg in regen_dict[key]
+        ]
+        pkg_shards = split_shards(pkg_dirs, shards)
+        info("Running 'repoman {0}' in {1} containers...".format(
+            mode, len(pkg_shards)
+        ))
+
+        def run_shard(pkg_dirs):
+            shard = Docker()
+            shard.image = dock.image
+            shard.map_directory(
+                '/home/%s/.gnupg' % os.getenv('USER'),
+                '/root/.gnupg'
+            )
+            shard.map_directory(self.repo.repo_dir, '/tmp/ros-overlay')
+            if distfile_dir:
+                shard.map_directory(distfile_dir, '/usr/portage/distfiles')
+            for pkg_dir in pkg_dirs:
+                shard.add_bash_command('cd {0}'.format(pkg_dir))
+                shard.add_bash_command('repoman {0}'.format(mode))
+            try:
+                shard.run()
+            except docker.errors.ContainerError as e:
+                return e.exit_status, shard.log
+            except docker.errors.APIError as e:
+                # the container could not run at all
+                return -1, str(e)
+            return 0, shard.log
+
+        with ThreadPoolExecutor(max_workers=len(pkg_shards) or 1) as pool:
+            results = list(pool.map(run_shard, pkg_shards))
+        failed = list()
+        for i, (status, log) in enumerate(results):
+            msg = 'Shard {0}/{1} ({2} packages) exited with status {3}.'
+            msg = msg.format(i + 1, len(results), len(pkg_shards[i]), status)
+            if status:
+                err(msg)
+                print(log)
+                failed.append(i)
+            else:
+                ok(msg)
+        if failed:
+            raise ShardsFailed(
+                '{0} of {1} repoman shards failed'.format(
+                    len(failed), len(results)
+                ), failed
+            )
 
     def pull_request(self, message, overlay=None):
         pr_title = 'rosdistro sync, {0}'.format(time.ctime())
@@ -15,12 +15,14 @@
 import os
 import sys
 
-from rosinstall_generator.distro import get_distro
+from superflore.exceptions import ShardsFailed
 from superflore.generate_installers import generate_installers
 from superflore.generators.ebuild.gen_packages import regenerate_pkg
+from superflore.generators.ebuild.gen_packages import regenerate_pkg_stages
 from superflore.generators.ebuild.overlay_instance import RosOverlay
 from superflore.parser import get_parser
 from superflore.repo_instance import RepoInstance
+from superflore.rosdistro_snapshot import get_distro
 from superflore.TempfileManager import TempfileManager
 from superflore.utils import active_distros
 from superflore.utils import clean_up
@@ -37,10 +39,55 @@ from superflore.utils import url_to_repo_org
 from superflore.utils import warn
 
 
+def regenerate_manifests(overlay, regen_dict, args):
+    """
+    Regenerate the Manifests of the packages, cleaning up and exiting
+    if any of them is missing or failed verification.
+    """
+    max_size = None
+    if args.tar_archive_max_size is not None:
+        max_size = args.tar_archive_max_size << 20
+    try:
+        failed = overlay.regenerate_manifests(
+            regen_dict,
+            distfile_dir=args.tar_archive_dir,
+            jobs=args.jobs,
+            verify=args.verify_manifests,
+            max_size=max_size
+        )
+    except ShardsFailed as e:
+        err(e.message)
+        err('Failed shards: {0}'.format(
+            ', '.join(str(shard + 1) for shard in e.failed)
+        ))
+        failed = True
+    if failed:
+        # an ebuild without a valid Manifest cannot be merged
+        err('Not committing, manifests are missing or invalid.')
+        clean_up()
+        sys.exit(1)
+
+
 def main():
     overlay = None
     preserve_existing = True
     parser = get_parser('Deploy ROS packages into Gentoo Linux')
+    parser.add_argument(
+        '--tar-archive-dir',
+        help='location to store the distfiles for the Manifests',
+        type=str
+    )
+    parser.add_argument(
+        '--tar-archive-max-size',
+        help='size (in MiB) above which the least recently used distfiles '
+             'are evicted from the distfile directory',
+        type=int
+    )
+    parser.add_argument(
+        '--verify-manifests',
+        help='check the generated Manifests with repoman in docker',
+        action='store_true'
+    )
     args = parser.parse_args(sys.argv[1:])
     pr_comment = args.pr_comment
     selected_targets = None
@@ -102,6 +149,7 @@ def main():
         total_installers = dict()
         total_broken = set()
         total_changes = dict()
+        total_unchanged = dict()
         if args.only:
             pr_comment = pr_comment or (
                 'Superflore ebuild generator began regeneration of ' +
@@ -125,7 +173,7 @@ def main():
             # Commit changes and file pull request
             regen_dict = dict()
             regen_dict[args.ros_distro] = args.only
-            overlay.regenerate_manifests(regen_dict)
+            regenerate_manifests(overlay, regen_dict, args)
             overlay.commit_changes(args.ros_distro)
             if args.dry_run:
                 save_pr(
@@ -138,18 +186,23 @@ def main():
             sys.exit(0)
 
         for distro in selected_targets:
+            distro_unchanged = list()
             distro_installers, distro_broken, distro_changes =\
                 generate_installers(
                     distro_name=distro,
                     overlay=overlay,
                     gen_pkg_func=regenerate_pkg,
-                    preserve_existing=preserve_existing
+                    preserve_existing=preserve_existing,
+                    jobs=args.jobs,
+                    stages=regenerate_pkg_stages,
+                    unchanged=distro_unchanged
                 )
             for key in distro_broken.keys():
                 for pkg in distro_broken[key]:
                     total_broken.add(pkg)
 
             total_changes[distro] = distro_changes
+            total_unchanged[distro] = distro_unchanged
             total_installers[distro] = distro_installers
 
         num_changes = 0
@@ -163,11 +216,11 @@ def main():
             sys.exit(0)
 
         # remove duplicates
-        delta = gen_delta_msg(total_changes)
+        delta = gen_delta_msg(total_changes, total_unchanged)
         missing_deps = gen_missing_deps_msg(total_broken)
 
         # Commit changes and file pull request
-        overlay.regenerate_manifests(total_installers)
+        regenerate_manifests(overlay, total_installers, args)
         overlay.commit_changes(args.ros_distro)
 
         if args.dry_run:
@@ -59,4 +59,10 @@ def get_parser(tool_tip, is_generator=True):
             help='location of the upstream repository as in https://github.com/<username>/<repository>/tree/<branch>',
             type=str
         )
+        parser.add_argument(
+            '--jobs',
+            help='number of packages to generate in parallel',
+            type=int,
+            default=1
+        )
     return parser
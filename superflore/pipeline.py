@@ -0,0 +1,164 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+
+class Done(object):
+    """
+    Returned by a stage to skip the remaining stages for an item.
+    The wrapped value becomes the result for that item.
+    """
+    def __init__(self, value):
+        self.value = value
+
+
+class Stage(object):
+    """
+    A single step of a pipeline.
+
+    :param name: name of the stage, for logging
+    :param func: callable taking the output of the previous stage
+    :param io_bound: if the stage mostly waits on the network or disk,
+                     it gets one worker per job; otherwise it gets a
+                     single worker.
+    """
+    def __init__(self, name, func, io_bound=False):
+        self.name = name
+        self.func = func
+        self.io_bound = io_bound
+
+    def get_workers(self, jobs):
+        if self.io_bound:
+            return max(jobs, 1)
+        return 1
+
+
+def run_stages(stages, *args):
+    """Run the stages in order in the calling thread."""
+    value = stages[0].func(*args)
+    for stage in stages[1:]:
+        if isinstance(value, Done):
+            break
+        value = stage.func(value)
+    if isinstance(value, Done):
+        return value.value
+    return value
+
+
+class Pipeline(object):
+    """
+    Run items through a list of stages, where each stage has its own
+    workers and bounded queues sit between the stages.
+    This keeps the network-bound stages busy while the CPU-bound ones work.
+    """
+    def __init__(self, stages, jobs=1, queue_size=None):
+        self.stages = stages
+        self.jobs = jobs
+        self.queue_size = queue_size or 2 * max(jobs, 1)
+
+    def start(self, items):
+        """
+        Start processing the items in a background thread.
+        Returns one concurrent.futures.Future per item, in item order.
+        """
+        futures = [Future() for _ in items]
+        thread = threading.Thread(
+            target=self._run, args=(list(items), futures), daemon=True
+        )
+        thread.start()
+        return futures
+
+    def _run(self, items, futures):
+        loop = asyncio.new_event_loop()
+        # the queues pick up the loop of the thread they are made in
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._main(loop, items, futures))
+        except BaseException as e:
+            # fail the remaining items, so no consumer waits for them;
+            # the exception reaches the consumers through them.
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            loop.close()
+
+    async def _main(self, loop, items, futures):
+        queues = [
+            asyncio.Queue(maxsize=self.queue_size) for _ in self.stages
+        ]
+        executors = []
+        workers = []
+        for i, stage in enumerate(self.stages):
+            num_workers = stage.get_workers(self.jobs)
+            executor = ThreadPoolExecutor(max_workers=num_workers)
+            executors.append(executor)
+            outbox = queues[i + 1] if i + 1 < len(queues) else None
+            for _ in range(num_workers):
+                workers.append(loop.create_task(self._worker(
+                    loop, stage, executor, queues[i], outbox, futures
+                )))
+        feeder = loop.create_task(self._feed(items, futures, queues))
+        try:
+            # the workers only return to stop the pipeline
+            done, _ = await asyncio.wait(
+                [feeder] + workers, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                error = task.result()
+                if error is not None:
+                    raise error
+        finally:
+            for task in [feeder] + workers:
+                task.cancel()
+            await asyncio.gather(feeder, *workers, return_exceptions=True)
+            for executor in executors:
+                executor.shutdown()
+
+    @staticmethod
+    async def _feed(items, futures, queues):
+        for idx, item in enumerate(items):
+            if futures[idx].set_running_or_notify_cancel():
+                await queues[0].put((idx, item))
+        # items move on before they are marked done, so joining the
+        # queues in order waits for everything to drain.
+        for queue in queues:
+            await queue.join()
+
+    @staticmethod
+    async def _worker(loop, stage, executor, inbox, outbox, futures):
+        while True:
+            idx, value = await inbox.get()
+            try:
+                value = await loop.run_in_executor(executor, stage.func, value)
+                if isinstance(value, Done):
+                    futures[idx].set_result(value.value)
+                elif outbox is None:
+                    futures[idx].set_result(value)
+                else:
+                    await outbox.put((idx, value))
+            except asyncio.CancelledError:
+                raise
+            except BaseException as e:
+                futures[idx].set_exception(e)
+                if not isinstance(e, Exception):
+                    # such as KeyboardInterrupt: stop the pipeline, which
+                    # raises it once the stages are shut down
+                    return e
+            finally:
+                inbox.task_done()
@@ -14,6 +14,7 @@
 
 import os
 import shutil
+import threading
 
 from git import Repo
 from git.exc import GitCommandError as GitGotGot
@@ -40,6 +41,8 @@ class RepoInstance(object):
         else:
             self.repo = Repo(repo_dir)
         self.git = self.repo.git
+        # the git index can only be modified by one job at a time
+        self.git_lock = threading.Lock()
         if 'SUPERFLORE_GITHUB_TOKEN' not in os.environ:
             raise NoGitHubAuthToken(
                 'Please create an OAuth token for Superflore, and place '
@@ -68,7 +71,8 @@ class RepoInstance(object):
 
     def remove_file(self, filename, ignore_fail=False):
         try:
-            self.git.rm('-f', filename)
+            with self.git_lock:
+                self.git.rm('-f', filename)
         except GitGotGot as g:
             if ignore_fail:
                 return
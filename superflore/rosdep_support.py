@@ -30,36 +30,138 @@
 # ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import atexit
+import glob
+import hashlib
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+
+import rosdep2
 from rosdep2 import create_default_installer_context
 from rosdep2.catkin_support import get_catkin_view
 from rosdep2.lookup import ResolutionError
+from rosdep2.sources_list import get_sources_cache_dir
+from rosdep2.sources_list import get_sources_list_dir
+from superflore.cache_dir import get_cache_dir
 from superflore.exceptions import UnresolvedDependency
 
 DEFAULT_ROS_DISTRO = 'indigo'
 view_cache = {}
+resolvers = {}
+_resolvers_lock = threading.Lock()
+_sources_fingerprint = None
+
+
+def get_sources_fingerprint():
+    """
+    Hash of the rosdep sources lists and the downloaded sources cache,
+    which changes whenever 'rosdep update' brings in new data.
+    Returns None if rosdep has not been initialized.
+    """
+    global _sources_fingerprint
+    if _sources_fingerprint is None:
+        sha = hashlib.sha256(rosdep2.__version__.encode())
+        found = False
+        for directory in [get_sources_list_dir(), get_sources_cache_dir()]:
+            if not os.path.isdir(directory):
+                continue
+            for root, dirs, files in os.walk(directory):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    sha.update(os.path.relpath(path, directory).encode())
+                    with open(path, 'rb') as source_file:
+                        sha.update(source_file.read())
+                    found = True
+        if found:
+            _sources_fingerprint = sha.hexdigest()
+    return _sources_fingerprint
+
+
+def _get_cache_prefix(kind, os_name, os_version, ros_distro):
+    name = '{0}-{1}-{2}-{3}-'.format(
+        kind, os_name, os_version or 'any', ros_distro
+    )
+    return os.path.join(get_cache_dir('rosdep'), name)
+
+
+def _remove_stale(prefix, current):
+    """Remove the caches from older rosdep sources"""
+    for stale in glob.glob(prefix + '*'):
+        # keeping the current cache's lock file as well
+        if not stale.startswith(current):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def load_view_snapshot(os_name, os_version, ros_distro):
+    fingerprint = get_sources_fingerprint()
+    if not fingerprint:
+        return None
+    prefix = _get_cache_prefix('view', os_name, os_version, ros_distro)
+    try:
+        with open(prefix + fingerprint + '.pickle', 'rb') as snapshot:
+            return pickle.load(snapshot)
+    except Exception:
+        # missing, or unreadable: it will be rebuilt.
+        return None
+
+
+def save_view_snapshot(view, os_name, os_version, ros_distro):
+    fingerprint = get_sources_fingerprint()
+    if not fingerprint:
+        return
+    prefix = _get_cache_prefix('view', os_name, os_version, ros_distro)
+    snapshot_name = prefix + fingerprint + '.pickle'
+    # write to a temporary file first, so concurrent readers never
+    # see a partial snapshot.
+    fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(prefix))
+    try:
+        with os.fdopen(fd, 'wb') as snapshot:
+            pickle.dump(view, snapshot, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, snapshot_name)
+    except Exception:
+        os.remove(tmp_name)
+        raise
+    _remove_stale(prefix, snapshot_name)
 
 
 def get_view(os_name, os_version, ros_distro):
     global view_cache
     key = os_name + os_version + ros_distro
     if key not in view_cache:
-        value = get_catkin_view(ros_distro, os_name, os_version, False)
+        value = load_view_snapshot(os_name, os_version, ros_distro)
+        if value is None:
+            value = get_catkin_view(ros_distro, os_name, os_version, False)
+            try:
+                save_view_snapshot(value, os_name, os_version, ros_distro)
+            except OSError:
+                # not being able to cache the view is not fatal.
+                pass
         view_cache[key] = value
     return view_cache[key]
 
 
-def resolve_more_for_os(rosdep_key, view, installer, os_name, os_version):
+def resolve_more_for_os(
+    rosdep_key, view, installer, os_name, os_version, ctx=None
+):
     """
     Resolve rosdep key to dependencies and installer key.
     (This was copied from rosdep2.catkin_support)
 
     :param os_name: OS name, e.g. 'ubuntu'
+    :param ctx: installer context, created if not given
     :returns: resolved key, resolved installer key, and default installer key
 
     :raises: :exc:`rosdep2.ResolutionError`
     """
     d = view.lookup(rosdep_key)
-    ctx = create_default_installer_context()
+    ctx = ctx or create_default_installer_context()
     os_installers = ctx.get_os_installer_keys(os_name)
     default_os_installer = ctx.get_default_os_installer_key(os_name)
     inst_key, rule = d.get_rule_for_platform(os_name, os_version,
@@ -69,6 +171,144 @@ def resolve_more_for_os(rosdep_key, view, installer, os_name, os_version):
     return installer.resolve(rule), inst_key, default_os_installer
 
 
+class RosdepResolver(object):
+    """
+    Resolve rosdep keys for one (os, version, ros distro).
+    The installer context and view are created once, and every result,
+    including unresolved keys, is memoized.
+    With open_store, results are also kept between runs until the rosdep
+    sources change, in which case the view is not even loaded.
+    """
+    def __init__(self, os_name, os_version, ros_distro=None):
+        self.os_name = os_name
+        self.os_version = os_version
+        self.ros_distro = ros_distro or DEFAULT_ROS_DISTRO
+        self.ctx = create_default_installer_context()
+        self.installer = None
+        self.view = None
+        self.cache = {}
+        self.store = None
+        self._store_manager = None
+        self.hits = 0
+        self.stored_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        try:
+            installer_key = self.ctx.get_default_os_installer_key(os_name)
+        except KeyError:
+            # nothing resolves for an unknown os.
+            return
+        self.installer = self.ctx.get_installer(installer_key)
+
+    def open_store(self):
+        """Open the results persisted by previous runs, if any."""
+        fingerprint = get_sources_fingerprint()
+        if self.store is not None or not fingerprint:
+            return
+        # imported here, since superflore.utils imports this module
+        from superflore.CacheManager import CacheManager
+        prefix = _get_cache_prefix(
+            'resolved', self.os_name, self.os_version, self.ros_distro
+        )
+        store_name = prefix + fingerprint + '.sqlite'
+        _remove_stale(prefix, store_name)
+        self._store_manager = CacheManager(store_name)
+        self.store = self._store_manager.__enter__()
+
+    def close_store(self):
+        """Save the results for the next run."""
+        if self._store_manager is not None:
+            with self._lock:
+                self._store_manager.__exit__(None, None, None)
+            self._store_manager = None
+            self.store = None
+
+    def _resolve(self, key):
+        if self.store is not None and key in self.store:
+            self.stored_hits += 1
+            return self.store[key]
+        self.misses += 1
+        ret = self._lookup(key)
+        if self.store is not None:
+            self.store[key] = ret
+        return ret
+
+    def _lookup(self, key):
+        if self.installer is None:
+            return None
+        if self.view is None:
+            self.view = get_view(
+                self.os_name, self.os_version, self.ros_distro
+            )
+        try:
+            return resolve_more_for_os(
+                key, self.view, self.installer,
+                self.os_name, self.os_version, self.ctx
+            )
+        except (KeyError, ResolutionError):
+            return None
+
+    def resolve(self, key):
+        """
+        :returns: resolved key, resolved installer key,
+                  and default installer key
+        :raises: :exc:`UnresolvedDependency`
+        """
+        with self._lock:
+            if key in self.cache:
+                self.hits += 1
+                ret = self.cache[key]
+            else:
+                ret = self._resolve(key)
+                self.cache[key] = ret
+        if ret is None:
+            raise UnresolvedDependency(
+                "could not resolve package {} for os {}."
+                .format(key, self.os_name)
+            )
+        return ret
+
+    def resolve_many(self, keys):
+        """
+        Resolve a batch of keys.
+
+        :returns: a dict of the resolved keys to their resolutions,
+                  and a list of the keys that could not be resolved.
+        """
+        resolved = {}
+        unresolved = []
+        for key in keys:
+            try:
+                resolved[key] = self.resolve(key)
+            except UnresolvedDependency:
+                unresolved.append(key)
+        return resolved, unresolved
+
+
+def get_resolver(os_name, os_version, ros_distro=None):
+    ros_distro = ros_distro or DEFAULT_ROS_DISTRO
+    key = (os_name, os_version, ros_distro)
+    with _resolvers_lock:
+        if key not in resolvers:
+            if not resolvers:
+                atexit.register(close_resolver_stores)
+            resolver = RosdepResolver(os_name, os_version, ros_distro)
+            try:
+                resolver.open_store()
+            except (
+                OSError, EOFError, pickle.UnpicklingError, sqlite3.Error
+            ):
+                # not being able to cache the results is not fatal.
+                pass
+            resolvers[key] = resolver
+        return resolvers[key]
+
+
+def close_resolver_stores():
+    for resolver in resolvers.values():
+        resolver.close_store()
+
+
 def resolve_rosdep_key(
     key,
     os_name,
@@ -76,22 +316,4 @@ def resolve_rosdep_key(
     ros_distro=None,
     ignored=None
 ):
-    ignored = ignored or []
-    ctx = create_default_installer_context()
-    try:
-        installer_key = ctx.get_default_os_installer_key(os_name)
-    except KeyError:
-        raise UnresolvedDependency(
-            "could not resolve package {} for os {}."
-            .format(key, os_name)
-        )
-    installer = ctx.get_installer(installer_key)
-    ros_distro = ros_distro or DEFAULT_ROS_DISTRO
-    view = get_view(os_name, os_version, ros_distro)
-    try:
-        return resolve_more_for_os(key, view, installer, os_name, os_version)
-    except (KeyError, ResolutionError):
-        raise UnresolvedDependency(
-            "could not resolve package {} for os {}."
-            .format(key, os_name)
-        )
+    return get_resolver(os_name, os_version, ros_distro).resolve(key)
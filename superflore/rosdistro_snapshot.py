@@ -0,0 +1,207 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from contextlib import contextmanager
+import glob
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import requests
+from rosdistro import get_cached_distribution
+from rosdistro import get_index_url
+from rosdistro.distribution_cache import DistributionCache
+from rosdistro.index import Index
+from superflore.cache_dir import get_cache_dir
+from superflore.DigestService import hash_file
+import yaml
+
+# the C loader is several times faster, when libyaml is available
+_yaml_loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+_indices = dict()
+_distros = dict()
+# url -> (path, sha256) of the local copy
+_downloads = dict()
+_lock = threading.RLock()
+
+
+def get_index(url=None):
+    """
+    Return the rosdistro index at url (by default the one rosdistro is
+    configured with), fetching and parsing it only once per run.
+    """
+    url = url or get_index_url()
+    with _lock:
+        if url not in _indices:
+            data = load_snapshot(url, 'index')
+            _indices[url] = Index(
+                data, os.path.dirname(url), url_query=urlparse(url).query
+            )
+        return _indices[url]
+
+
+def get_distro(distro_name):
+    """
+    Return the distribution of the distro, read from its distribution
+    cache, fetching and parsing that only once per run.
+    """
+    with _lock:
+        if distro_name not in _distros:
+            index = get_index()
+            if distro_name not in index.distributions:
+                raise RuntimeError(
+                    "Unknown distribution: '%s'. Valid distribution names "
+                    "are: %s" % (
+                        distro_name, ', '.join(sorted(index.distributions))
+                    )
+                )
+            url = index.distributions[distro_name].get('distribution_cache')
+            if not url:
+                raise RuntimeError(
+                    "Distribution has no cache: '%s'" % distro_name
+                )
+            cache = DistributionCache(
+                distro_name, load_snapshot(url, distro_name + '-cache')
+            )
+            _distros[distro_name] = get_cached_distribution(
+                index, distro_name, cache=cache
+            )
+        return _distros[distro_name]
+
+
+def download(url):
+    """
+    Return the path of the local copy of the file at url, and its
+    sha256. The copy is kept in the cache directory, and only
+    downloaded again if the server reports a change (by its ETag or
+    Last-Modified), at most once per run. Local files are used in place.
+    """
+    with _lock:
+        if url not in _downloads:
+            _downloads[url] = _download(url)
+        return _downloads[url]
+
+
+def _download(url):
+    parsed = urlparse(url)
+    if parsed.scheme == 'file':
+        path = url2pathname(parsed.path)
+        return path, hash_file(path, ['sha256'])[1]['sha256']
+    path = os.path.join(
+        get_cache_dir('rosdistro'), '%s-%s' % (
+            hashlib.sha256(url.encode()).hexdigest()[:16],
+            os.path.basename(parsed.path)
+        )
+    )
+    meta_file = path + '.json'
+    try:
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = dict()
+    current = None
+    if os.path.isfile(path):
+        current = hash_file(path, ['sha256'])[1]['sha256']
+    headers = dict()
+    # as long as the copy is what was downloaded
+    if current and meta.get('sha256') == current:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+    with requests.get(
+        url, headers=headers, stream=True, timeout=(10, 60)
+    ) as r:
+        if r.status_code == 304:
+            return path, current
+        r.raise_for_status()
+        sha256 = hashlib.sha256()
+        with _atomic_write(path) as f:
+            for chunk in r.iter_content(1 << 16):
+                sha256.update(chunk)
+                f.write(chunk)
+        meta = {
+            'etag': r.headers.get('ETag'),
+            'last_modified': r.headers.get('Last-Modified'),
+            'sha256': sha256.hexdigest(),
+        }
+    with _atomic_write(meta_file, 'w') as f:
+        json.dump(meta, f)
+    return path, meta['sha256']
+
+
+@contextmanager
+def _atomic_write(filename, mode='wb'):
+    """
+    Write to a temporary file first, replacing filename with it once it
+    is complete, so concurrent readers never see a partial file.
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=os.path.dirname(filename))
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.replace(tmp_name, filename)
+    except BaseException:
+        os.remove(tmp_name)
+        raise
+
+
+def load_snapshot(url, name):
+    """
+    Fetch the YAML file at url (which may be gzipped) and return its
+    data. The parsed data is pickled in the cache directory, keyed by
+    the digest of the file, so an unchanged file is not parsed again.
+    """
+    path, digest = download(url)
+    prefix = os.path.join(
+        get_cache_dir('rosdistro'),
+        '%s-%s-' % (name, hashlib.sha256(url.encode()).hexdigest()[:16])
+    )
+    snapshot_name = prefix + digest + '.pickle'
+    try:
+        with open(snapshot_name, 'rb') as snapshot:
+            return pickle.load(snapshot)
+    except Exception:
+        # missing, or unreadable: it will be rebuilt.
+        pass
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if url.endswith('.gz'):
+        raw = gzip.decompress(raw)
+    data = yaml.load(raw, Loader=_yaml_loader)
+    try:
+        save_snapshot(data, prefix, snapshot_name)
+    except OSError:
+        # not being able to cache the data is not fatal.
+        pass
+    return data
+
+
+def save_snapshot(data, prefix, snapshot_name):
+    with _atomic_write(snapshot_name) as snapshot:
+        pickle.dump(data, snapshot, pickle.HIGHEST_PROTOCOL)
+    # the snapshots of older versions of the file
+    for stale in glob.glob(prefix + '*.pickle'):
+        if stale != snapshot_name:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
@@ -13,6 +13,8 @@
 # limitations under the License.
 
 import errno
+from functools import lru_cache
+import hashlib
 import os
 import random
 import re
@@ -20,6 +22,7 @@ import string
 import sys
 import time
 
+from superflore.DistroIndex import get_distro_index
 from superflore.exceptions import UnknownLicense
 from superflore.exceptions import UnknownPlatform
 from superflore.rosdep_support import resolve_rosdep_key
@@ -114,13 +117,44 @@ def make_dir(dirname):
             raise e
 
 
+def split_shards(items, shards):
+    """Split the items round-robin into at most the number of shards."""
+    shards = max(1, min(shards, len(items)))
+    return [items[i::shards] for i in range(shards) if items[i::shards]]
+
+
+def file_has_text(filename, text):
+    """
+    Check if the file already holds exactly the given text, comparing
+    sizes first and then content hashes.
+    """
+    data = text.encode('utf-8')
+    try:
+        if os.path.getsize(filename) != len(data):
+            return False
+        file_hash = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                file_hash.update(chunk)
+    except OSError:
+        return False
+    return file_hash.digest() == hashlib.sha256(data).digest()
+
+
+def write_if_changed(filename, text):
+    """
+    Write the text to the file, unless it already holds that text.
+    Returns True if the file was written.
+    """
+    if file_has_text(filename, text):
+        return False
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return True
+
+
 def get_pkg_version(distro, pkg_name, is_oe=False):
-    pkg = distro.release_packages[pkg_name]
-    repo = distro.repositories[pkg.repository_name].release_repository
-    maj_min_patch, deb_inc = repo.version.split('-')
-    if deb_inc != '0':
-        return '{0}-{1}{2}'.format(maj_min_patch, '' if is_oe else 'r', deb_inc)
-    return maj_min_patch
+    return get_distro_index(distro).get_version(pkg_name, is_oe)
 
 
 def rand_ascii_str(length=10):
@@ -130,13 +164,14 @@ def rand_ascii_str(length=10):
     return ''.join(random.choice(string.ascii_letters) for x in range(length))
 
 
+@lru_cache(maxsize=None)
+def _get_escape_table(illegal_chars):
+    return str.maketrans({c: '\\' + c for c in illegal_chars})
+
+
 def sanitize_string(string, illegal_chars):
-    ret = str()
-    for c in string:
-        if c in illegal_chars:
-            ret += '\\'
-        ret += c
-    return ret
+    """Escape each of the illegal characters with a backslash."""
+    return string.translate(_get_escape_table(illegal_chars))
 
 
 def trim_string(string, length=80):
@@ -146,67 +181,67 @@ def trim_string(string, length=80):
     return string[:length - len(end_string)] + end_string
 
 
-def get_license(l):
-    bsd_re = '^(BSD)((.)*([124]))?'
-    gpl_re = '((([^L])*(GPL)([^0-9]*))|'\
-        '(GNU(.)*GENERAL(.)*PUBLIC(.)*LICENSE([^0-9])*))([0-9])?'
-    lgpl_re = '(((LGPL)([^0-9]*))|'\
-        '(GNU(.)*Lesser(.)*Public(.)*License([^0-9])*))([0-9]?\\.[0-9])?'
-    apache_re = '^(Apache)((.)*(1\\.0|1\\.1|2\\.0|2))?'
-    cc_re = '^(Creative(.)?Commons)((.)*)'
-    cc_nc_nd_re = '^((Creative(.)?Commons)|CC)((.)*)' +\
-                  '((Non(.)?Commercial)|NC)((.)*)((No(.)?Derivatives)|ND)'
-    cc_by_nc_sa_re = '^(CC(.)?BY(.)?NC(.)?SA(.)?)'
-    moz_re = '^(Mozilla)((.)*(1\\.1))?'
-    boost_re = '^(Boost)((.)*([1]))?'
-    pub_dom_re = '^(Public(.)?Domain)'
-    mit_re = '^MIT'
-    f = re.IGNORECASE
-
-    if re.search(apache_re, l, f):
-        version = re.search(apache_re, l, f).group(4)
-        if version:
-            return 'Apache-%.1f' % (float(version))
-        return 'Apache-1.0'
-    elif re.search(bsd_re, l, f):
-        version = re.search(bsd_re, l, f).group(4)
-        if version:
-            return 'BSD-{0}'.format(version)
-        return 'BSD'
-    elif re.search(lgpl_re, l, f):
-        version = re.search(lgpl_re, l, f)
-        grp = len(version.groups())
-        version = version.group(grp)
-        if version:
-            return 'LGPL-{0}'.format(version)
-        return 'LGPL-2'
-    elif re.search(gpl_re, l, f):
-        version = re.search(gpl_re, l, f)
-        grp = len(version.groups())
-        version = version.group(grp)
-        if version:
-            return 'GPL-{0}'.format(version)
-        return 'GPL-1'
-    elif re.search(moz_re, l, f):
-        version = re.search(moz_re, l, f).group(4)
+_bsd_re = '^(BSD)((.)*([124]))?'
+_gpl_re = '((([^L])*(GPL)([^0-9]*))|'\
+    '(GNU(.)*GENERAL(.)*PUBLIC(.)*LICENSE([^0-9])*))([0-9])?'
+_lgpl_re = '(((LGPL)([^0-9]*))|'\
+    '(GNU(.)*Lesser(.)*Public(.)*License([^0-9])*))([0-9]?\\.[0-9])?'
+_apache_re = '^(Apache)((.)*(1\\.0|1\\.1|2\\.0|2))?'
+_cc_re = '^(Creative(.)?Commons)((.)*)'
+_cc_nc_nd_re = '^((Creative(.)?Commons)|CC)((.)*)' +\
+               '((Non(.)?Commercial)|NC)((.)*)((No(.)?Derivatives)|ND)'
+_cc_by_nc_sa_re = '^(CC(.)?BY(.)?NC(.)?SA(.)?)'
+_moz_re = '^(Mozilla)((.)*(1\\.1))?'
+_boost_re = '^(Boost)((.)*([1]))?'
+_pub_dom_re = '^(Public(.)?Domain)'
+_mit_re = '^MIT'
+
+# The rules are tried in order, and the first matching one wins.
+# Each rule is a pattern, the group holding the version (None if
+# unversioned, -1 for the last group), a function formatting the
+# license with that version, and the license if no version was found.
+_license_rules = [
+    (
+        re.compile(pattern, re.IGNORECASE),
+        group, fmt, default
+    ) for pattern, group, fmt, default in [
+        (_apache_re, 4, lambda v: 'Apache-%.1f' % float(v), 'Apache-1.0'),
+        (_bsd_re, 4, 'BSD-{0}'.format, 'BSD'),
+        (_lgpl_re, -1, 'LGPL-{0}'.format, 'LGPL-2'),
+        (_gpl_re, -1, 'GPL-{0}'.format, 'GPL-1'),
+        (_moz_re, 4, 'MPL-{0}'.format, 'MPL-2.0'),
+        (_mit_re, None, None, 'MIT'),
+        (_cc_nc_nd_re, None, None, 'CC-BY-NC-ND-4.0'),
+        (_cc_by_nc_sa_re, None, None, 'CC-BY-NC-SA-4.0'),
+        (_cc_re, None, None, 'CC-BY-SA-3.0'),
+        (_boost_re, None, None, 'BSL-1.0'),
+        (_pub_dom_re, None, None, 'public_domain'),
+    ]
+]
+
+
+@lru_cache(maxsize=None)
+def _classify_license(license_str):
+    """Return the license for the string, or None if it is unknown."""
+    for pattern, group, fmt, default in _license_rules:
+        match = pattern.search(license_str)
+        if not match:
+            continue
+        if group is None:
+            return default
+        version = match.group(pattern.groups if group < 0 else group)
         if version:
-            return 'MPL-{0}'.format(version)
-        return 'MPL-2.0'
-    elif re.search(mit_re, l, f):
-        return 'MIT'
-    elif re.search(cc_nc_nd_re, l, f):
-        return 'CC-BY-NC-ND-4.0'
-    elif re.search(cc_by_nc_sa_re, l, f):
-        return 'CC-BY-NC-SA-4.0'
-    elif re.search(cc_re, l, f):
-        return 'CC-BY-SA-3.0'
-    elif re.search(boost_re, l, f):
-        return 'BSL-1.0'
-    elif re.search(pub_dom_re, l, f):
-        return 'public_domain'
-    else:
+            return fmt(version)
+        return default
+    return None
+
+
+def get_license(l):
+    license = _classify_license(l)
+    if license is None:
         err('Could not match license "{0}".'.format(l))
         raise UnknownLicense('bad license')
+    return license
 
 
 def resolve_dep(pkg, os, distro=None):
@@ -219,8 +254,11 @@ def resolve_dep(pkg, os, distro=None):
         raise UnknownPlatform(msg)
 
 
-def gen_delta_msg(total_changes):
-    """Return string of changes for the PR message."""
+def gen_delta_msg(total_changes, total_unchanged=None):
+    """
+    Return string of changes for the PR message, followed by the number
+    of packages left unchanged in each distro, if given.
+    """
     delta = "Changes:\n"
     delta += "========\n"
     for distro in sorted(total_changes):
@@ -231,6 +269,16 @@ def gen_delta_msg(total_changes):
         for d in sorted(total_changes[distro]):
             delta += '* {0}\n'.format(d)
         delta += "\n"
+    if total_unchanged and any(total_unchanged.values()):
+        delta += "Unchanged:\n"
+        delta += "==========\n"
+        for distro in sorted(total_unchanged):
+            if not total_unchanged[distro]:
+                continue
+            delta += '* {0}: {1} packages\n'.format(
+                distro.title(), len(total_unchanged[distro])
+            )
+        delta += "\n"
     return delta
 
 
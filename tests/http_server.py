@@ -0,0 +1,70 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local HTTP servers for the tests, on every supported Python."""
+
+import hashlib
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+import os
+from socketserver import ThreadingMixIn
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """The http.server one, which is only there from Python 3.7 on."""
+    daemon_threads = True
+
+
+def serve_directory(handler, directory):
+    """
+    Return a subclass of handler (a SimpleHTTPRequestHandler) serving
+    the files in directory rather than in the working directory.
+    """
+    class DirectoryHandler(handler):
+        def translate_path(self, path):
+            path = super().translate_path(path)
+            return os.path.join(directory, os.path.relpath(path, os.getcwd()))
+    return DirectoryHandler
+
+
+class ETagHandler(BaseHTTPRequestHandler):
+    """
+    Serves the files (path -> content), with ETags, honouring
+    If-None-Match if etags is set. Records the path and If-None-Match
+    of each request.
+    """
+    files = dict()
+    etags = True
+    requests = list()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if_none_match = self.headers.get('If-None-Match')
+        ETagHandler.requests.append((self.path, if_none_match))
+        data = ETagHandler.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        etag = '"%s"' % hashlib.md5(data).hexdigest()
+        if ETagHandler.etags and if_none_match == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
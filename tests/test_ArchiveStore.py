@@ -0,0 +1,182 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+from http.server import SimpleHTTPRequestHandler
+import multiprocessing
+import os
+import threading
+from unittest import mock
+
+from superflore.ArchiveStore import ArchiveStore
+from superflore.TempfileManager import TempfileManager
+from tests.http_server import serve_directory
+from tests.http_server import ThreadingHTTPServer
+import unittest
+
+
+def fetch_in_process(store_dir, url):
+    with ArchiveStore(store_dir) as store:
+        return store.fetch(url), store.misses
+
+
+class CountingHandler(SimpleHTTPRequestHandler):
+    requests = list()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        CountingHandler.requests.append(self.path)
+        super().do_GET()
+
+
+class TestArchiveStore(unittest.TestCase):
+    def setUp(self):
+        CountingHandler.requests = list()
+        self.tmp = TempfileManager(None)
+        tmp = self.tmp.__enter__()
+        # keep the download leases out of the real cache directory
+        self.env = mock.patch.dict(
+            os.environ, {'SUPERFLORE_CACHE_DIR': os.path.join(tmp, 'cache')}
+        )
+        self.env.start()
+        self.upstream = os.path.join(tmp, 'upstream')
+        self.store_dir = os.path.join(tmp, 'archives')
+        os.makedirs(self.upstream)
+        # the same release, as shipped by two distros, and another one
+        for name, data in [
+            ('melodic.tar.gz', b'a' * 1000),
+            ('noetic.tar.gz', b'a' * 1000),
+            ('other.tar.gz', b'b' * 1000),
+        ]:
+            with open(os.path.join(self.upstream, name), 'wb') as f:
+                f.write(data)
+        self.server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), serve_directory(CountingHandler, self.upstream)
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.env.stop()
+        self.tmp.__exit__()
+
+    def test_deduplicate(self):
+        """Test that identical archives are stored once"""
+        with ArchiveStore(self.store_dir) as store:
+            melodic = store.fetch(self.url + 'melodic.tar.gz')
+            noetic = store.fetch(self.url + 'noetic.tar.gz')
+            self.assertEqual(melodic, noetic)
+            self.assertEqual(
+                os.path.basename(melodic),
+                hashlib.sha256(b'a' * 1000).hexdigest()
+            )
+            self.assertEqual(store.fetch(self.url + 'melodic.tar.gz'), melodic)
+            self.assertEqual(len(CountingHandler.requests), 2)
+            self.assertEqual(store.hits, 1)
+            self.assertEqual(store.duplicates, 1)
+            self.assertEqual(store.bytes_saved, 2000)
+            self.assertEqual(store.size, 1000)
+        # the index is kept between runs
+        with ArchiveStore(self.store_dir) as store:
+            self.assertEqual(store.fetch(self.url + 'noetic.tar.gz'), melodic)
+            self.assertEqual(len(CountingHandler.requests), 2)
+
+    def test_evict(self):
+        """Test evicting the least recently used archives"""
+        caches = {'md5': dict()}
+        with ArchiveStore(self.store_dir, max_size=1500) as store:
+            melodic = store.get(self.url + 'melodic.tar.gz', caches)
+            other = store.get(self.url + 'other.tar.gz', caches)
+            self.assertEqual(store.evictions, 1)
+            self.assertFalse(os.path.exists(melodic))
+            self.assertTrue(os.path.exists(other))
+            self.assertEqual(
+                caches['md5'][melodic], hashlib.md5(b'a' * 1000).hexdigest()
+            )
+            # the digests of evicted archives are still known
+            store.get(self.url + 'melodic.tar.gz', caches)
+            self.assertEqual(len(CountingHandler.requests), 2)
+            # but fetching them downloads them again
+            self.assertEqual(store.fetch(self.url + 'melodic.tar.gz'), melodic)
+            self.assertEqual(len(CountingHandler.requests), 3)
+            self.assertFalse(os.path.exists(other))
+            self.assertEqual(store.size, 1000)
+
+    def test_processes(self):
+        """Test that processes sharing a store download once"""
+        url = self.url + 'melodic.tar.gz'
+        with multiprocessing.get_context('spawn').Pool(4) as pool:
+            results = pool.starmap(
+                fetch_in_process, [(self.store_dir, url)] * 4
+            )
+        self.assertEqual(len(set(path for path, _ in results)), 1)
+        self.assertEqual(sum(misses for _, misses in results), 1)
+        self.assertEqual(CountingHandler.requests, ['/melodic.tar.gz'])
+
+    def test_migrate(self):
+        """Test taking over the archives stored by older versions"""
+        os.makedirs(self.store_dir)
+        caches = {'md5': dict(), 'sha256': dict()}
+        for name, data in [
+            ('foo-1.0.0-melodic.tar.gz', b'a' * 1000),
+            ('bar-2.0.0-noetic.tar.gz', b'b' * 1000),
+        ]:
+            old_path = self.store_dir + '/' + name
+            with open(old_path, 'wb') as f:
+                f.write(data)
+            caches['md5'][old_path] = hashlib.md5(data).hexdigest()
+        # an archive removed by hand, whose digests are still cached
+        old_path = self.store_dir + '/baz-3.0.0-melodic.tar.gz'
+        caches['md5'][old_path] = 'md5'
+        caches['sha256'][old_path] = 'sha256'
+        melodic = {
+            'foo-1.0.0-melodic.tar.gz': self.url + 'melodic.tar.gz',
+            'baz-3.0.0-melodic.tar.gz': self.url + 'baz.tar.gz',
+        }
+        with ArchiveStore(self.store_dir, max_size=1500) as store:
+            store.migrate(caches, lambda: melodic)
+            self.assertEqual(
+                sorted(os.listdir(self.store_dir)),
+                ['archive_index.sqlite', 'incoming', 'objects']
+            )
+            # the archives count towards max_size
+            self.assertEqual(store.evictions, 1)
+            self.assertEqual(store.size, 1000)
+            foo = store.get_path(hashlib.sha256(b'a' * 1000).hexdigest())
+            self.assertEqual(store.get(self.url + 'melodic.tar.gz'), foo)
+            self.assertEqual(store.get(self.url + 'baz.tar.gz', caches), (
+                store.get_path('sha256')
+            ))
+            self.assertEqual(CountingHandler.requests, [])
+            self.assertEqual(
+                caches['md5'][foo], hashlib.md5(b'a' * 1000).hexdigest()
+            )
+            self.assertEqual(caches['md5'][store.get_path('sha256')], 'md5')
+            for cache in caches.values():
+                self.assertTrue(all('/objects/' in key for key in cache))
+        # the archives of other distros wait for their urls
+        bar = store.get_path(hashlib.sha256(b'b' * 1000).hexdigest())
+        with ArchiveStore(self.store_dir) as store:
+            store.migrate(caches, lambda: {
+                'bar-2.0.0-noetic.tar.gz': self.url + 'other.tar.gz',
+            })
+            self.assertEqual(store.get(self.url + 'other.tar.gz', caches), bar)
+            self.assertEqual(CountingHandler.requests, [])
+            self.assertNotIn(ArchiveStore.legacy_key, store.urls)
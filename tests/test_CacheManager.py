@@ -12,19 +12,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import multiprocessing
 import os
+import pickle
 
 from superflore.CacheManager import CacheManager
+from superflore.CacheManager import SqliteCache
 from superflore.TempfileManager import TempfileManager
 import unittest
 
 
+def fill_cache(cache_file, name):
+    with CacheManager(cache_file) as cache:
+        for i in range(100):
+            cache['%s-%d' % (name, i)] = i
+
+
 class TestCacheManager(unittest.TestCase):
     def test_CacheFile(self):
         """Test the CacheManager"""
         with TempfileManager(None) as tmp:
             os.chmod(tmp, 17407)
-            cache_file = '%s/my_cache.pickle' % tmp
+            cache_file = '%s/my_cache.sqlite' % tmp
             with CacheManager(cache_file) as cache:
                 cache['a'] = 'A'
                 cache['b'] = 'B'
@@ -34,3 +43,81 @@ class TestCacheManager(unittest.TestCase):
                 self.assertEqual(cache['b'], 'B')
                 self.assertEqual(cache['c'], 'C')
             self.assertTrue(os.path.exists(cache_file))
+
+    def test_legacy_pickle(self):
+        """Test converting a pickled cache"""
+        with TempfileManager(None) as tmp:
+            cache_file = '%s/md5_cache.sqlite' % tmp
+            legacy_file = '%s/md5_cache.pickle' % tmp
+            with open(legacy_file, 'wb') as f:
+                pickle.dump({'a': 'A', ('b', 1): ['B']}, f)
+            with CacheManager(cache_file, legacy_file) as cache:
+                self.assertEqual(cache['a'], 'A')
+                self.assertEqual(cache[('b', 1)], ['B'])
+                self.assertEqual(len(cache), 2)
+                cache['c'] = 'C'
+            self.assertFalse(os.path.exists(legacy_file))
+            with CacheManager(cache_file, legacy_file) as cache:
+                self.assertEqual(
+                    dict(cache), {'a': 'A', ('b', 1): ['B'], 'c': 'C'}
+                )
+
+    def test_truncated(self):
+        """Test opening a cache left empty or truncated by a crash"""
+        with TempfileManager(None) as tmp:
+            cache_file = '%s/my_cache.sqlite' % tmp
+            for junk in [b'', pickle.dumps({'a': 'A'})[:5]]:
+                with open(cache_file, 'wb') as f:
+                    f.write(junk)
+                with CacheManager(cache_file) as cache:
+                    self.assertEqual(len(cache), 0)
+                    cache['a'] = 'A'
+                with CacheManager(cache_file) as cache:
+                    self.assertEqual(cache['a'], 'A')
+                os.remove(cache_file)
+
+    def test_batches(self):
+        """Test that complete batches survive a crash"""
+        with TempfileManager(None) as tmp:
+            cache_file = '%s/my_cache.sqlite' % tmp
+            cache = SqliteCache(cache_file, batch_size=2)
+            cache['a'] = 'A'
+            cache['b'] = 'B'
+            cache['c'] = 'C'
+            # the first batch is written, the last one is still pending
+            other = SqliteCache(cache_file)
+            self.assertEqual(other['a'], 'A')
+            self.assertEqual(other['b'], 'B')
+            self.assertNotIn('c', other)
+            self.assertEqual(cache['c'], 'C')
+            cache.close()
+            self.assertEqual(len(other), 3)
+            del other['a']
+            self.assertNotIn('a', other)
+            other.close()
+
+    def test_flush_interval(self):
+        """Test that an incomplete batch is written after a while"""
+        with TempfileManager(None) as tmp:
+            cache_file = '%s/my_cache.sqlite' % tmp
+            cache = SqliteCache(cache_file, flush_interval=0.1)
+            cache['a'] = 'A'
+            timer = cache.timer
+            other = SqliteCache(cache_file)
+            timer.join(10)
+            self.assertEqual(other['a'], 'A')
+            self.assertIsNone(cache.timer)
+            cache.close()
+            other.close()
+
+    def test_processes(self):
+        """Test that processes sharing a cache keep each other's entries"""
+        with TempfileManager(None) as tmp:
+            cache_file = '%s/my_cache.sqlite' % tmp
+            with multiprocessing.get_context('spawn').Pool(4) as pool:
+                pool.starmap(
+                    fill_cache, [(cache_file, name) for name in 'abcd']
+                )
+            with CacheManager(cache_file) as cache:
+                self.assertEqual(len(cache), 400)
+                self.assertEqual(cache['c-42'], 42)
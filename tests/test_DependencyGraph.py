@@ -0,0 +1,70 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from superflore.DependencyGraph import DependencyGraph
+from superflore.DependencyGraph import get_dependency_graph
+import unittest
+
+
+class FakeDistro(object):
+    """Stand-in for a rosdistro distribution"""
+    def __init__(self):
+        self.name = 'lunar'
+        self.release_packages = {'my_package': None}
+        self.fetched = list()
+
+    def get_release_package_xml(self, pkg_name):
+        self.fetched.append(pkg_name)
+        with open('tests/PackageXml/test.xml', 'r') as test_file:
+            return test_file.read()
+
+
+class TestDependencyGraph(unittest.TestCase):
+    def test_depends(self):
+        """Test the dependencies of each type"""
+        graph = DependencyGraph(FakeDistro())
+        self.assertEqual(
+            graph.get_depends('my_package', 'buildtool'), {'catkin'}
+        )
+        self.assertEqual(
+            graph.get_depends('my_package', 'build'),
+            {'genmsg', 'roscpp', 'libgstreamer0.10-dev'}
+        )
+        self.assertEqual(
+            graph.get_depends('my_package', 'build_export'),
+            {'roscpp', 'libgstreamer0.10-dev'}
+        )
+        self.assertEqual(
+            graph.get_depends('my_package', 'exec'),
+            {'roscpp', 'libgstreamer0.10-0'}
+        )
+        self.assertEqual(graph.get_depends('my_package', 'test'), {'gtest'})
+        self.assertEqual(graph.get_depends('my_package', 'doc'), {'doxygen'})
+
+    def test_parsed_once(self):
+        """Test that the package.xml is only fetched once"""
+        distro = FakeDistro()
+        graph = get_dependency_graph(distro)
+        self.assertIs(graph, get_dependency_graph(distro))
+        for depend_type in ['buildtool', 'build', 'exec', 'run', 'test']:
+            graph.get_depends('my_package', depend_type)
+        self.assertEqual(distro.fetched, ['my_package'])
+        graph.build()
+        self.assertEqual(distro.fetched, ['my_package'])
+
+    def test_unknown_package(self):
+        """Test looking up a package that is not in the distro"""
+        graph = DependencyGraph(FakeDistro())
+        with self.assertRaises(KeyError):
+            graph.get_depends('not_a_package', 'build')
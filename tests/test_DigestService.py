@@ -0,0 +1,90 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+import threading
+from unittest import mock
+
+from superflore.DigestService import DigestService
+from superflore.DigestService import hash_file
+from superflore.DigestService import new_hash
+from superflore.TempfileManager import TempfileManager
+import unittest
+
+
+class TestDigestService(unittest.TestCase):
+    def write_archive(self, tmp, data):
+        path = os.path.join(tmp, 'archive.tar.gz')
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_hash_file(self):
+        """Test computing several digests in one pass"""
+        data = os.urandom(3 * 1024 * 1024 + 17)
+        with TempfileManager(None) as tmp:
+            path = self.write_archive(tmp, data)
+            size, digests = hash_file(path, ['md5', 'sha256', 'blake2b'])
+        self.assertEqual(size, len(data))
+        blake2b = new_hash('blake2b')
+        blake2b.update(data)
+        self.assertEqual(digests, {
+            'md5': hashlib.md5(data).hexdigest(),
+            'sha256': hashlib.sha256(data).hexdigest(),
+            'blake2b': blake2b.hexdigest(),
+        })
+
+    def test_shared_result(self):
+        """Test that an archive being hashed is only hashed once"""
+        service = DigestService(2)
+        hashing = threading.Event()
+
+        def slow_hash_file(*args):
+            hashing.wait(10)
+            return hash_file(*args)
+        with TempfileManager(None) as tmp:
+            path = self.write_archive(tmp, b'archive')
+            with mock.patch(
+                'superflore.DigestService.hash_file',
+                side_effect=slow_hash_file
+            ) as hashed:
+                first = service.submit(path, ['sha256', 'md5'])
+                self.assertIs(first, service.submit(path, ['md5', 'sha256']))
+                hashing.set()
+                self.assertEqual(first.result()[0], len(b'archive'))
+                self.assertEqual(hashed.call_count, 1)
+                # a changed archive is hashed again
+                self.write_archive(tmp, b'another archive')
+                size, _ = service.digest(path, ['md5', 'sha256'])
+                self.assertEqual(size, len(b'another archive'))
+                self.assertEqual(hashed.call_count, 2)
+        # the futures are forgotten once resolved
+        service.pool.shutdown()
+        self.assertEqual(service.futures, dict())
+
+    def test_update_caches(self):
+        """Test filling the md5 and sha256 caches"""
+        service = DigestService(1)
+        md5_cache = dict()
+        sha256_cache = dict()
+        with TempfileManager(None) as tmp:
+            path = self.write_archive(tmp, b'archive')
+            service.update_caches(
+                path, {'md5': md5_cache, 'sha256': sha256_cache}
+            )
+        self.assertEqual(md5_cache, {path: hashlib.md5(b'archive').hexdigest()})
+        self.assertEqual(
+            sha256_cache, {path: hashlib.sha256(b'archive').hexdigest()}
+        )
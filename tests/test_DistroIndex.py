@@ -0,0 +1,80 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import SimpleNamespace
+
+from superflore.DistroIndex import DistroIndex
+from superflore.DistroIndex import get_distro_index
+from superflore.utils import get_pkg_version
+import unittest
+
+
+def get_distro():
+    """Get a stand-in for a rosdistro distribution"""
+    def repo(version):
+        return SimpleNamespace(
+            release_repository=SimpleNamespace(version=version)
+        )
+    return SimpleNamespace(
+        name='lunar',
+        release_packages={
+            'p2os_driver': SimpleNamespace(repository_name='p2os'),
+            'p2os_msgs': SimpleNamespace(repository_name='p2os'),
+            'catkin': SimpleNamespace(repository_name='catkin'),
+            'unreleased': SimpleNamespace(repository_name='broken'),
+        },
+        repositories={
+            'p2os': repo('2.1.0-3'),
+            'catkin': repo('0.7.11-0'),
+            'broken': repo(None),
+        },
+    )
+
+
+class TestDistroIndex(unittest.TestCase):
+    def test_package_names(self):
+        """Test the released package names"""
+        index = DistroIndex(get_distro())
+        self.assertEqual(
+            index.package_names,
+            frozenset(['p2os_driver', 'p2os_msgs', 'catkin'])
+        )
+        self.assertEqual(index.unreleased_package_names, {'unreleased'})
+        self.assertIn('catkin', index)
+        self.assertNotIn('unreleased', index)
+
+    def test_versions(self):
+        """Test the Gentoo and OE versions"""
+        index = DistroIndex(get_distro())
+        self.assertEqual(index.get_version('p2os_msgs'), '2.1.0-r3')
+        self.assertEqual(index.get_version('p2os_msgs', True), '2.1.0-3')
+        self.assertEqual(index.get_version('catkin'), '0.7.11')
+        self.assertEqual(index.get_version('catkin', True), '0.7.11')
+        with self.assertRaises(KeyError):
+            index.get_version('not_a_package')
+
+    def test_repositories(self):
+        """Test the package to repository mapping"""
+        index = DistroIndex(get_distro())
+        self.assertEqual(index.get_repository_name('p2os_driver'), 'p2os')
+        self.assertEqual(index.get_repository_name('unreleased'), 'broken')
+
+    def test_get_distro_index(self):
+        """Test that the index is only built once per distro"""
+        distro = get_distro()
+        index = get_distro_index(distro)
+        self.assertIs(index, get_distro_index(distro))
+        self.assertEqual(get_pkg_version(distro, 'p2os_driver'), '2.1.0-r3')
+        # a new distro object gets a new index
+        self.assertIsNot(index, get_distro_index(get_distro()))
@@ -0,0 +1,164 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from http.server import BaseHTTPRequestHandler
+import os
+import re
+import tempfile
+import threading
+from unittest import mock
+
+from superflore.DownloadManager import DownloadManager
+from superflore.exceptions import DownloadFailed
+from superflore.TempfileManager import TempfileManager
+from tests.http_server import ThreadingHTTPServer
+import unittest
+
+archive = bytes(range(256)) * 1024
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """
+    Serves the archive at /archive.tar.gz, honouring Range requests.
+    /flaky.tar.gz drops the connection halfway through the first
+    download of the whole archive. /busy.tar.gz answers 503 until
+    busy runs out.
+    """
+    requests = list()
+    dropped = False
+    busy = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        ArchiveHandler.requests.append((self.path, range_header))
+        if self.path == '/busy.tar.gz' and ArchiveHandler.busy:
+            ArchiveHandler.busy -= 1
+            self.send_error(503)
+            return
+        if self.path not in (
+            '/archive.tar.gz', '/flaky.tar.gz', '/busy.tar.gz'
+        ):
+            self.send_error(404)
+            return
+        start = 0
+        if range_header:
+            start = int(re.match(r'bytes=(\d+)-', range_header).group(1))
+            self.send_response(206)
+            self.send_header(
+                'Content-Range',
+                'bytes %d-%d/%d' % (start, len(archive) - 1, len(archive))
+            )
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(archive) - start))
+        self.end_headers()
+        if self.path == '/flaky.tar.gz' and not ArchiveHandler.dropped:
+            ArchiveHandler.dropped = True
+            self.wfile.write(archive[:len(archive) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(archive[start:])
+
+
+class TestDownloadManager(unittest.TestCase):
+    def setUp(self):
+        # keep the download leases out of the real cache directory
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(
+            os.environ, {'SUPERFLORE_CACHE_DIR': self.cache_dir.name}
+        )
+        self.env.start()
+        ArchiveHandler.requests = list()
+        ArchiveHandler.dropped = False
+        ArchiveHandler.busy = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ArchiveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.env.stop()
+        self.cache_dir.cleanup()
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_download(self):
+        """Test downloading an archive once"""
+        manager = DownloadManager(2)
+        with TempfileManager(None) as tmp:
+            path = os.path.join(tmp, 'archive.tar.gz')
+            url = self.url + '/archive.tar.gz'
+            self.assertEqual(manager.download(url, path), path)
+            self.assertEqual(self.read(path), archive)
+            self.assertEqual(manager.download(url, path), path)
+            self.assertEqual(len(ArchiveHandler.requests), 1)
+            self.assertEqual(os.listdir(tmp), ['archive.tar.gz'])
+
+    def test_prefetch(self):
+        """Test downloading several archives concurrently"""
+        manager = DownloadManager(4)
+        with TempfileManager(None) as tmp:
+            paths = [os.path.join(tmp, '%d.tar.gz' % i) for i in range(8)]
+            manager.prefetch(
+                (self.url + '/archive.tar.gz', path) for path in paths
+            )
+            for path in paths:
+                manager.download(self.url + '/archive.tar.gz', path)
+                self.assertEqual(self.read(path), archive)
+            self.assertEqual(manager.downloaded, 8)
+
+    def test_resume(self):
+        """Test resuming an interrupted download"""
+        manager = DownloadManager(1)
+        with TempfileManager(None) as tmp:
+            path = os.path.join(tmp, 'flaky.tar.gz')
+            manager.download(self.url + '/flaky.tar.gz', path)
+            self.assertEqual(self.read(path), archive)
+            self.assertEqual(manager.resumed, 1)
+            self.assertEqual(
+                ArchiveHandler.requests[-1],
+                ('/flaky.tar.gz', 'bytes=%d-' % (len(archive) // 2))
+            )
+
+    def test_missing(self):
+        """Test that failed downloads leave nothing in the cache"""
+        manager = DownloadManager(1, retries=0)
+        with TempfileManager(None) as tmp:
+            path = os.path.join(tmp, 'missing.tar.gz')
+            with self.assertRaises(DownloadFailed):
+                manager.download(self.url + '/missing.tar.gz', path)
+            self.assertFalse(os.path.exists(path))
+
+    def test_retry(self):
+        """Test that server errors are retried, retries times in all"""
+        manager = DownloadManager(1, retries=2, backoff=0)
+        with TempfileManager(None) as tmp:
+            path = os.path.join(tmp, 'busy.tar.gz')
+            ArchiveHandler.busy = 2
+            manager.download(self.url + '/busy.tar.gz', path)
+            self.assertEqual(self.read(path), archive)
+            self.assertEqual(len(ArchiveHandler.requests), 3)
+            os.remove(path)
+            ArchiveHandler.busy = 10
+            with self.assertRaises(DownloadFailed):
+                manager.download(self.url + '/busy.tar.gz', path)
+            self.assertEqual(len(ArchiveHandler.requests), 6)
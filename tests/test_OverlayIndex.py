@@ -0,0 +1,87 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from superflore.generators.ebuild.gen_packages import get_ebuild_version
+from superflore.OverlayIndex import OverlayIndex
+from superflore.TempfileManager import TempfileManager
+import unittest
+
+
+def touch(*path):
+    os.makedirs(os.path.join(*path[:-1]), exist_ok=True)
+    with open(os.path.join(*path), 'w'):
+        pass
+
+
+class TestOverlayIndex(unittest.TestCase):
+    def test_ebuilds(self):
+        """Test finding existing ebuilds, patches and Manifests"""
+        with TempfileManager(None) as tmp:
+            pkg_dir = os.path.join(tmp, 'ros-lunar', 'rosbag')
+            touch(pkg_dir, 'rosbag-1.13.6.ebuild')
+            touch(pkg_dir, 'Manifest')
+            touch(pkg_dir, 'files', 'fix.patch')
+            touch(tmp, 'ros-lunar', 'rosbag_storage', 'rosbag_storage-1.ebuild')
+            touch(tmp, 'dev-util', 'cmake', 'cmake-3.ebuild')
+            index = OverlayIndex(tmp, ['ros-'])
+            existing = index.find(pkg_dir, 'rosbag-', '.ebuild')
+            self.assertEqual(
+                existing, [os.path.join(pkg_dir, 'rosbag-1.13.6.ebuild')]
+            )
+            self.assertEqual(
+                get_ebuild_version('rosbag', existing[0]), '1.13.6'
+            )
+            self.assertTrue(index.isfile(os.path.join(pkg_dir, 'Manifest')))
+            self.assertTrue(index.isdir(os.path.join(pkg_dir, 'files')))
+            self.assertEqual(
+                index.find(os.path.join(pkg_dir, 'files'), suffix='.patch'),
+                [os.path.join(pkg_dir, 'files', 'fix.patch')]
+            )
+            # only the directories with the prefixes are indexed
+            self.assertFalse(index.isdir(os.path.join(tmp, 'dev-util')))
+
+    def test_recipes(self):
+        """Test that recipes of packages sharing a prefix are kept apart"""
+        with TempfileManager(None) as tmp:
+            recipe_dir = os.path.join(tmp, 'generated-recipes-lunar', 'ros')
+            touch(recipe_dir, 'rosbag_1.13.6.bb')
+            touch(recipe_dir, 'rosbag-storage_1.13.6.bb')
+            index = OverlayIndex(tmp, ['generated-recipes-'], depth=2)
+            self.assertEqual(
+                index.find(recipe_dir, 'rosbag_', '.bb'),
+                [os.path.join(recipe_dir, 'rosbag_1.13.6.bb')]
+            )
+
+    def test_updates(self):
+        """Test keeping the index up to date"""
+        with TempfileManager(None) as tmp:
+            index = OverlayIndex(tmp, ['ros-'])
+            ebuild = os.path.join(tmp, 'ros-lunar', 'foo', 'foo-1.ebuild')
+            self.assertFalse(index.isfile(ebuild))
+            index.add_file(ebuild)
+            self.assertTrue(index.isfile(ebuild))
+            self.assertTrue(index.isdir(os.path.join(tmp, 'ros-lunar')))
+            index.remove_file(ebuild)
+            self.assertFalse(index.isfile(ebuild))
+            self.assertEqual(
+                index.find(os.path.join(tmp, 'ros-lunar', 'foo')), []
+            )
+
+    def test_missing_repo(self):
+        """Test indexing a directory that does not exist yet"""
+        with TempfileManager(None) as tmp:
+            index = OverlayIndex(os.path.join(tmp, 'missing'), ['ros-'])
+            self.assertEqual(index.dirs, {})
@@ -0,0 +1,117 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import SimpleNamespace
+from unittest import mock
+
+from superflore.exceptions import NoPkgXml
+from superflore.PackageXmlStore import get_package_xml_store
+from superflore.PackageXmlStore import PackageXmlStore
+import unittest
+
+
+class FakeDistro(object):
+    """
+    Stand-in for a rosdistro distribution, whose cache only holds
+    the package.xml of cached_package.
+    """
+    def __init__(self):
+        self.name = 'lunar'
+        self.release_packages = {
+            name: SimpleNamespace(repository_name='repo')
+            for name in ['cached_package', 'other_package', 'broken_package']
+        }
+        self.repositories = {
+            'repo': SimpleNamespace(release_repository='release_repo')
+        }
+        self.cached = list()
+
+    def get_release_package_xml(self, pkg_name):
+        self.cached.append(pkg_name)
+        if pkg_name == 'cached_package':
+            return '<package>cached</package>'
+        return None
+
+
+class FakeRosPackage(object):
+    fetched = list()
+
+    def __init__(self, pkg_name, repo):
+        self.pkg_name = pkg_name
+
+    def get_package_xml(self, dist_name):
+        FakeRosPackage.fetched.append(self.pkg_name)
+        if self.pkg_name == 'broken_package':
+            raise RuntimeError('no such tag')
+        return b'<package>fetched</package>'
+
+
+@mock.patch('superflore.PackageXmlStore.RosPackage', FakeRosPackage)
+class TestPackageXmlStore(unittest.TestCase):
+    def setUp(self):
+        FakeRosPackage.fetched = list()
+
+    def test_bulk_load(self):
+        """Test that the cached package.xml files are loaded at once"""
+        distro = FakeDistro()
+        store = PackageXmlStore(distro)
+        self.assertEqual(len(distro.cached), 3)
+        self.assertEqual(
+            store.get('cached_package'), '<package>cached</package>'
+        )
+        self.assertEqual(len(distro.cached), 3)
+        self.assertEqual(FakeRosPackage.fetched, [])
+
+    def test_fallback(self):
+        """Test that missing package.xml files are fetched once"""
+        store = PackageXmlStore(FakeDistro())
+        for _ in range(2):
+            self.assertEqual(
+                store.get('other_package'), '<package>fetched</package>'
+            )
+            with self.assertRaises(NoPkgXml):
+                store.get('broken_package')
+        self.assertEqual(
+            FakeRosPackage.fetched, ['other_package', 'broken_package']
+        )
+        self.assertEqual(store.fetched, 2)
+
+    def test_shared(self):
+        """Test that the store of a distro is loaded only once"""
+        distro = FakeDistro()
+        store = get_package_xml_store(distro)
+        self.assertIs(store, get_package_xml_store(distro))
+        self.assertIsNot(store, get_package_xml_store(FakeDistro()))
+
+    def test_raw(self):
+        """Test that the released package.xml files are fetched once"""
+        store = PackageXmlStore(FakeDistro())
+        for _ in range(2):
+            self.assertEqual(
+                store.get_raw('cached_package'), '<package>fetched</package>'
+            )
+        self.assertEqual(
+            store.get('cached_package'), '<package>cached</package>'
+        )
+        self.assertEqual(
+            store.get('other_package'), '<package>fetched</package>'
+        )
+        self.assertEqual(
+            store.get_raw('other_package'), '<package>fetched</package>'
+        )
+        self.assertEqual(
+            FakeRosPackage.fetched, ['cached_package', 'other_package']
+        )
+        with self.assertRaises(NoPkgXml):
+            store.get_raw('broken_package')
@@ -15,6 +15,7 @@
 from time import gmtime, strftime
 import re
 
+from superflore.generators.ebuild.ebuild import DependencySet
 from superflore.generators.ebuild.ebuild import Ebuild
 from superflore.generators.ebuild.ebuild import ebuild_keyword
 from superflore.exceptions import UnresolvedDependency
@@ -91,6 +92,32 @@ class TestEbuildOutput(unittest.TestCase):
         self.assertFalse('cmake' in ebuild.rdepends)
         self.assertFalse('cmake' in ebuild.depends)
 
+    def test_duplicate_depends(self):
+        """Test that dependencies added twice are listed once"""
+        ebuild = self.get_ebuild()
+        ebuild.add_build_depend('p2os_msgs')
+        ebuild.add_build_depend('p2os_msgs')
+        ebuild.add_run_depend('p2os_driver')
+        ebuild.add_run_depend('p2os_driver')
+        self.assertEqual(len(ebuild.depends), 1)
+        self.assertEqual(len(ebuild.rdepends), 1)
+        got_text = ebuild.get_ebuild_text('Open Source Robotics Foundation', 'BSD')
+        self.assertEqual(got_text.count('ros-lunar/p2os_msgs'), 1)
+        self.assertEqual(got_text.count('ros-lunar/p2os_driver'), 1)
+
+    def test_dependency_set(self):
+        """Test the ordered, deduplicated dependency set"""
+        deps = DependencySet(['b', 'a', 'b'])
+        self.assertEqual(list(deps), ['b', 'a'])
+        self.assertEqual(deps.sorted(), ('a', 'b'))
+        self.assertIs(deps.sorted(), deps.sorted())
+        deps.add('a')
+        self.assertEqual(deps.sorted(), ('a', 'b'))
+        deps.add('c')
+        self.assertEqual(deps.sorted(), ('a', 'b', 'c'))
+        self.assertIn('c', deps)
+        self.assertNotIn('d', deps)
+
     def test_build_depend_internal(self):
         """Test build depends when internal/external"""
         ebuild = self.get_ebuild()
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import re
+from types import SimpleNamespace
 
 from superflore.exceptions import UnknownBuildType
 from superflore.exceptions import UnknownLicense
@@ -51,6 +52,12 @@ def _create_if_p2os(overlay, pkg, distro, preserve_existing, collector):
     return True, True
 
 
+def _unchanged_if_p2os(overlay, pkg, distro, preserve_existing, collector):
+    """Report the p2os installers as unchanged"""
+    collector.append(pkg)
+    return SimpleNamespace(unchanged='p2os' in pkg), pkg
+
+
 def _raise_exceptions(overlay, pkg, distro, preserve_existing, collector):
     """Raise exceptions"""
     collector.append(pkg)
@@ -76,6 +83,33 @@ class TestGenerateInstallers(unittest.TestCase):
         # make sure all packages got indexed
         self.assertEqual(sorted(acc), sorted(inst))
 
+    def test_parallel_generation(self):
+        """Test Generate Installers with a pool of jobs"""
+        serial = generate_installers(
+            'lunar', None, _raise_exceptions, False, list()
+        )
+        acc = list()
+        parallel = generate_installers(
+            'lunar', None, _raise_exceptions, False, acc, jobs=4
+        )
+        # every package should have been visited
+        self.assertEqual(len(acc), len(set(acc)))
+        # results (and their order) should match the serial run
+        self.assertEqual(serial, parallel)
+
+    def test_unchanged(self):
+        """Test that unchanged installers are not reported as changes"""
+        acc = list()
+        inst, broken, changes = generate_installers(
+            'lunar', None, _unchanged_if_p2os, False, acc
+        )
+        self.assertEqual(broken, {})
+        self.assertEqual(
+            sorted(inst), sorted(p for p in acc if 'p2os' not in p)
+        )
+        for c in changes:
+            self.assertNotIn('p2os', c)
+
     def test_unresolved(self):
         """Test for an unresolved dependency"""
         acc = list()
@@ -0,0 +1,155 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+from unittest import mock
+
+from superflore.generators.bitbake.layer_index import LayerIndexCache
+from superflore.generators.bitbake.layer_index import LocalLayerIndex
+from superflore.generators.bitbake.oe_query import OpenEmbeddedLayersDB
+from superflore.TempfileManager import TempfileManager
+import unittest
+
+
+class FakeLayerIndex(object):
+    """Answers queries for libxml2, and fails for 'offline'."""
+    def __init__(self):
+        self.queries = list()
+
+    def query_recipe(self, oe_query, recipe):
+        self.queries.append(recipe)
+        if recipe == 'libxml2':
+            oe_query.name = 'libxml2'
+            oe_query.layer = 'openembedded-core'
+            oe_query.version = '2.9.8'
+            oe_query._exists = True
+        elif recipe == 'offline':
+            oe_query._failed = True
+
+
+# what the layer index serves, trimmed down
+export = {
+    'branches': [{'id': 1, 'name': 'master'}, {'id': 2, 'name': 'thud'}],
+    'layerItems': [
+        {'id': 10, 'name': 'openembedded-core'},
+        {'id': 11, 'name': 'meta-oe'},
+        {'id': 12, 'name': 'meta-unknown'},
+    ],
+    'layerBranches': [
+        {'id': 100, 'layer': 10, 'branch': 1},
+        {'id': 101, 'layer': 11, 'branch': 1},
+        {'id': 102, 'layer': 12, 'branch': 1},
+        {'id': 103, 'layer': 10, 'branch': 2},
+    ],
+    'recipes': [
+        {'pn': 'libxml2', 'pv': '2.9.8', 'layerbranch': 103},
+        {'pn': 'libxml2', 'pv': '2.9.9', 'layerbranch': 101},
+        {'pn': 'libxml2', 'pv': '2.9.10', 'layerbranch': 100},
+        {'pn': 'bullet', 'pv': '2.87', 'layerbranch': 101},
+        {'pn': 'unknown', 'pv': '1.0', 'layerbranch': 102},
+    ],
+}
+
+
+class TestLayerIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = FakeLayerIndex()
+        self.patch = mock.patch.object(
+            OpenEmbeddedLayersDB, 'query_recipe', autospec=True,
+            side_effect=self.index.query_recipe
+        )
+        self.patch.start()
+        self.tmp = TempfileManager(None)
+        self.cache_dir = self.tmp.__enter__()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmp.__exit__()
+
+    def test_query(self):
+        """Test that query results are kept between runs"""
+        with LayerIndexCache(self.cache_dir) as layer_index:
+            found = layer_index.query('libxml2')
+            self.assertTrue(found.exists())
+            self.assertFalse(layer_index.query('missing').exists())
+        with LayerIndexCache(self.cache_dir) as layer_index:
+            found = layer_index.query('libxml2')
+            self.assertTrue(found.exists())
+            self.assertEqual(found.layer, 'openembedded-core')
+            self.assertEqual(found.version, '2.9.8')
+            self.assertFalse(layer_index.query('missing').exists())
+            self.assertEqual(layer_index.hits, 2)
+        self.assertEqual(self.index.queries, ['libxml2', 'missing'])
+
+    def test_failed(self):
+        """Test that queries which failed are not cached"""
+        with LayerIndexCache(self.cache_dir) as layer_index:
+            self.assertFalse(layer_index.query('offline').exists())
+            self.assertFalse(layer_index.query('offline').exists())
+        self.assertEqual(self.index.queries, ['offline', 'offline'])
+
+    def test_ttl(self):
+        """Test that expired results are queried again"""
+        with LayerIndexCache(self.cache_dir, ttl=60) as layer_index:
+            layer_index.query('libxml2')
+            now = time.time()
+            with mock.patch('time.time', return_value=now + 30):
+                layer_index.query('libxml2')
+            self.assertEqual(len(self.index.queries), 1)
+            with mock.patch('time.time', return_value=now + 90):
+                self.assertTrue(layer_index.query('libxml2').exists())
+            self.assertEqual(len(self.index.queries), 2)
+
+    def test_refresh(self):
+        """Test refreshing and clearing the cached results"""
+        with LayerIndexCache(self.cache_dir) as layer_index:
+            layer_index.query('libxml2')
+            layer_index.query('missing')
+            self.assertEqual(layer_index.refresh(max_age=60), 0)
+            self.assertEqual(layer_index.refresh(), 2)
+            self.assertEqual(
+                self.index.queries,
+                ['libxml2', 'missing', 'libxml2', 'missing']
+            )
+            layer_index.clear()
+            self.assertEqual(layer_index.refresh(), 0)
+            layer_index.query('libxml2')
+            self.assertEqual(len(self.index.queries), 5)
+
+    def test_ingest(self):
+        """Test looking recipes up in an ingested export"""
+        local = LocalLayerIndex(self.cache_dir)
+        self.assertFalse(local.load())
+        self.assertEqual(local.ingest(export), 4)
+        self.assertTrue(local.load())
+        self.assertEqual(local.lookup('libxml2')['version'], '2.9.10')
+        self.assertEqual(local.lookup('bullet')['layer'], 'meta-oe')
+        # only the recipes of the valid layers are found
+        self.assertIsNone(local.lookup('unknown'))
+        self.assertIsNone(local.lookup('missing'))
+
+    def test_offline(self):
+        """Test that ingested recipes are not queried"""
+        LocalLayerIndex(self.cache_dir).ingest(export)
+        with LayerIndexCache(self.cache_dir, online=False) as layer_index:
+            found = layer_index.query('bullet')
+            self.assertTrue(found.exists())
+            self.assertEqual(found.name, 'bullet')
+            self.assertEqual(found.version, '2.87')
+            self.assertFalse(layer_index.query('libxml3').exists())
+            self.assertEqual(layer_index.local_hits, 1)
+        with LayerIndexCache(self.cache_dir) as layer_index:
+            self.assertTrue(layer_index.query('bullet').exists())
+            self.assertFalse(layer_index.query('libxml3').exists())
+        self.assertEqual(self.index.queries, ['libxml3'])
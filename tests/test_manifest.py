@@ -0,0 +1,156 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+from http.server import SimpleHTTPRequestHandler
+import os
+import shutil
+import threading
+from unittest import mock
+
+from superflore.DigestService import new_hash
+from superflore.generators.ebuild.manifest import get_ebuild_vars
+from superflore.generators.ebuild.manifest import parse_src_uri
+from superflore.generators.ebuild.manifest import write_manifest
+from superflore.generators.ebuild.manifest import write_manifests
+from superflore.TempfileManager import TempfileManager
+from tests.http_server import serve_directory
+from tests.http_server import ThreadingHTTPServer
+import unittest
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class TestManifest(unittest.TestCase):
+    def make_package(self, tmp, url):
+        """Make a package directory with an ebuild fetching url"""
+        pkg_dir = os.path.join(tmp, 'ros-lunar', 'foo')
+        os.makedirs(pkg_dir)
+        with open('tests/ebuild/simple_expected.ebuild', 'r') as f:
+            ebuild_text = f.read()
+        ebuild_text = ebuild_text.replace(
+            'https://www.website.com/download/${PN}/archive/${PN}'
+            '/release/lunar/0.0.0.tar.gz', url
+        )
+        with open(os.path.join(pkg_dir, 'foo-0.0.0-r1.ebuild'), 'w') as f:
+            f.write(ebuild_text)
+        return pkg_dir
+
+    def test_parse_src_uri(self):
+        """Test getting the distfiles from the ebuild"""
+        ebuild_vars = get_ebuild_vars('foo', 'ros-lunar/foo/foo-1.2.3-r1.ebuild')
+        self.assertEqual(ebuild_vars['PV'], '1.2.3')
+        with open('tests/ebuild/simple_expected.ebuild', 'r') as f:
+            uris = parse_src_uri(f.read(), ebuild_vars)
+        self.assertEqual(uris, [(
+            'https://www.website.com/download/foo/archive/foo/release/'
+            'lunar/0.0.0.tar.gz',
+            'foo-lunar-release-1.2.3.tar.gz'
+        )])
+
+    def test_write_manifest(self):
+        """Test the DIST entries of a Manifest"""
+        with TempfileManager(None) as tmp:
+            pkg_dir = self.make_package(tmp, 'https://example.com/foo.tar.gz')
+            distfile_dir = os.path.join(tmp, 'distfiles')
+            os.makedirs(distfile_dir)
+            # the distfile is already there, so nothing is downloaded
+            distfile = os.path.join(
+                distfile_dir, 'foo-lunar-release-0.0.0.tar.gz'
+            )
+            with open(distfile, 'wb') as f:
+                f.write(b'not really a tarball')
+            self.assertTrue(write_manifest(pkg_dir, distfile_dir))
+            with open(os.path.join(pkg_dir, 'Manifest'), 'r') as f:
+                manifest = f.read()
+            blake2b = new_hash('blake2b')
+            blake2b.update(b'not really a tarball')
+            self.assertEqual(
+                manifest,
+                'DIST foo-lunar-release-0.0.0.tar.gz 20 BLAKE2B {0}'
+                ' SHA512 {1}\n'.format(
+                    blake2b.hexdigest(),
+                    hashlib.sha512(b'not really a tarball').hexdigest()
+                )
+            )
+            # writing it again changes nothing
+            self.assertFalse(write_manifest(pkg_dir, distfile_dir))
+
+    def test_evict_distfiles(self):
+        """Test keeping the distfiles within a maximum size"""
+        with TempfileManager(None) as tmp:
+            pkg_dir = self.make_package(tmp, 'https://example.com/foo.tar.gz')
+            distfile_dir = os.path.join(tmp, 'distfiles')
+            os.makedirs(distfile_dir)
+            for name, data, mtime in [
+                ('foo-lunar-release-0.0.0.tar.gz', b'not really a tarball', 0),
+                ('old.tar.gz', b'o' * 100, 1000),
+                ('older.tar.gz', b'o' * 100, 500),
+            ]:
+                distfile = os.path.join(distfile_dir, name)
+                with open(distfile, 'wb') as f:
+                    f.write(data)
+                os.utime(distfile, (mtime, mtime))
+            self.assertEqual(
+                write_manifests([pkg_dir], distfile_dir, max_size=150), []
+            )
+            self.assertEqual(
+                sorted(os.listdir(distfile_dir)),
+                ['foo-lunar-release-0.0.0.tar.gz', 'old.tar.gz']
+            )
+            # the distfiles of the packages are kept in any case
+            write_manifests([pkg_dir], distfile_dir, max_size=0)
+            self.assertEqual(
+                os.listdir(distfile_dir), ['foo-lunar-release-0.0.0.tar.gz']
+            )
+
+    def test_write_manifests(self):
+        """Test fetching the distfiles and reporting failures"""
+        with TempfileManager(None) as tmp:
+            upstream = os.path.join(tmp, 'upstream')
+            os.makedirs(upstream)
+            shutil.copy(
+                'tests/ebuild/simple_expected.ebuild',
+                os.path.join(upstream, 'foo.tar.gz')
+            )
+            server = ThreadingHTTPServer(
+                ('127.0.0.1', 0), serve_directory(QuietHandler, upstream)
+            )
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            url = 'http://127.0.0.1:%d' % server.server_address[1]
+            env = {'SUPERFLORE_CACHE_DIR': os.path.join(tmp, 'cache')}
+            try:
+                pkg_dir = self.make_package(tmp, url + '/foo.tar.gz')
+                distfile_dir = os.path.join(tmp, 'distfiles')
+                missing_dir = os.path.join(tmp, 'ros-lunar', 'bar')
+                os.makedirs(missing_dir)
+                with open(os.path.join(missing_dir, 'bar-1.ebuild'), 'w') as f:
+                    f.write('SRC_URI="%s/missing.tar.gz"\n' % url)
+                with mock.patch.dict(os.environ, env):
+                    failed = write_manifests(
+                        [pkg_dir, missing_dir], distfile_dir, 2
+                    )
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+            self.assertEqual(failed, [missing_dir])
+            self.assertTrue(os.path.isfile(os.path.join(pkg_dir, 'Manifest')))
+            self.assertEqual(
+                os.listdir(distfile_dir), ['foo-lunar-release-0.0.0.tar.gz']
+            )
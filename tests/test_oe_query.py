@@ -0,0 +1,81 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from unittest import mock
+
+from superflore.generators.bitbake.oe_query import OpenEmbeddedLayersDB
+import unittest
+
+
+class FakeLayers(object):
+    """
+    Answers the queries of a layer after a delay, finding the recipe in
+    the layers of hits. The layer index is down for the layers of down.
+    """
+    def __init__(self, hits, delays=None, down=()):
+        self.hits = hits
+        self.delays = delays or dict()
+        self.down = down
+        self.queried = list()
+        self.lock = threading.Lock()
+
+    def query_url(self, oe_query, query_url):
+        layer = query_url.rsplit('%3A', 1)[1]
+        with self.lock:
+            self.queried.append(layer)
+        time.sleep(self.delays.get(layer, 0))
+        if layer in self.down:
+            oe_query._failed = True
+        elif layer in self.hits:
+            oe_query.name = 'libxml2'
+            oe_query.layer = layer
+            oe_query._exists = True
+
+
+class TestOpenEmbeddedLayersDB(unittest.TestCase):
+    def query(self, layers):
+        with mock.patch.object(
+            OpenEmbeddedLayersDB, '_query_url', autospec=True,
+            side_effect=layers.query_url
+        ):
+            oe_query = OpenEmbeddedLayersDB()
+            oe_query.query_recipe('libxml2')
+        return oe_query
+
+    def test_priority(self):
+        """Test that the highest priority layer wins, even if slower"""
+        layers = FakeLayers(
+            ['meta-oe', 'meta-python'], delays={'meta-oe': 0.2}
+        )
+        oe_query = self.query(layers)
+        self.assertTrue(oe_query.exists())
+        self.assertEqual(oe_query.layer, 'meta-oe')
+
+    def test_cancel(self):
+        """Test that lower priority queries are cancelled on a hit"""
+        delays = dict.fromkeys(OpenEmbeddedLayersDB()._prio_valid_layers, 0.2)
+        layers = FakeLayers(['openembedded-core'], delays=delays)
+        oe_query = self.query(layers)
+        self.assertEqual(oe_query.layer, 'openembedded-core')
+        self.assertNotIn('meta-virtualization', layers.queried)
+
+    def test_not_found(self):
+        """Test that every layer is queried for a missing recipe"""
+        layers = FakeLayers([], down=['meta-qt5'])
+        oe_query = self.query(layers)
+        self.assertFalse(oe_query.exists())
+        self.assertTrue(oe_query.failed())
+        self.assertEqual(len(layers.queried), 11)
@@ -0,0 +1,101 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import time
+
+from superflore.pipeline import Done
+from superflore.pipeline import Pipeline
+from superflore.pipeline import run_stages
+from superflore.pipeline import Stage
+import unittest
+
+
+def _fetch(item):
+    # simulate a network round trip of varying length
+    time.sleep(random.random() / 100)
+    if item == 'skip':
+        return Done((None, []))
+    return [item]
+
+
+def _render(value):
+    if value[0] == 'bad':
+        raise KeyError('bad')
+    return value + ['rendered']
+
+
+def _interrupt(value):
+    if value[0] == 'interrupt':
+        raise KeyboardInterrupt()
+    return value
+
+
+def _write(value):
+    return tuple(value + ['written'])
+
+
+stages = [
+    Stage('fetch', _fetch, io_bound=True),
+    Stage('render', _render),
+    Stage('write', _write),
+]
+
+
+class TestPipeline(unittest.TestCase):
+    def test_run_stages(self):
+        """Test running the stages serially"""
+        self.assertEqual(
+            run_stages(stages, 'a'), ('a', 'rendered', 'written')
+        )
+        self.assertEqual(run_stages(stages, 'skip'), (None, []))
+        with self.assertRaises(KeyError):
+            run_stages(stages, 'bad')
+
+    def test_workers(self):
+        """Test the number of workers per stage"""
+        self.assertEqual(stages[0].get_workers(8), 8)
+        self.assertEqual(stages[1].get_workers(8), 1)
+        self.assertEqual(stages[0].get_workers(0), 1)
+
+    def test_pipeline_order(self):
+        """Test that the pipeline results match the serial results"""
+        items = ['pkg_%d' % i for i in range(50)] + ['skip', 'bad', 'z']
+        futures = Pipeline(stages, jobs=8, queue_size=2).start(items)
+        self.assertEqual(len(futures), len(items))
+        for item, future in zip(items, futures):
+            if item == 'bad':
+                with self.assertRaises(KeyError):
+                    future.result()
+            else:
+                self.assertEqual(future.result(), run_stages(stages, item))
+
+    def test_empty_pipeline(self):
+        """Test a pipeline without any items"""
+        self.assertEqual(Pipeline(stages, jobs=4).start([]), [])
+
+    def test_pipeline_interrupted(self):
+        """Test that every item fails once a stage is interrupted"""
+        items = ['a', 'interrupt'] + ['pkg_%d' % i for i in range(20)]
+        futures = Pipeline(
+            stages[:2] + [Stage('interrupt', _interrupt)] + stages[2:],
+            jobs=4, queue_size=2
+        ).start(items)
+        with self.assertRaises(KeyboardInterrupt):
+            futures[1].result(timeout=10)
+        for future in futures:
+            try:
+                future.result(timeout=10)
+            except KeyboardInterrupt:
+                pass
@@ -0,0 +1,189 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from unittest import mock
+
+from rosdep2.lookup import RosdepView
+from superflore.exceptions import UnresolvedDependency
+from superflore.rosdep_support import get_resolver
+from superflore.rosdep_support import get_view
+from superflore.rosdep_support import resolvers
+from superflore.rosdep_support import RosdepResolver
+from superflore.rosdep_support import view_cache
+from superflore.TempfileManager import TempfileManager
+import unittest
+
+
+class FakeDefinition(object):
+    def __init__(self, packages):
+        self.packages = packages
+
+    def get_rule_for_platform(self, os_name, os_version, installers, default):
+        return default, self.packages
+
+
+class FakeView(object):
+    """Stand-in for a rosdep view with a single key"""
+    def __init__(self):
+        self.lookups = list()
+
+    def lookup(self, key):
+        self.lookups.append(key)
+        if key == 'cmake':
+            return FakeDefinition(['dev-util/cmake'])
+        raise KeyError(key)
+
+
+class TestRosdepResolver(unittest.TestCase):
+    def get_resolver(self):
+        resolver = RosdepResolver('gentoo', '2.4.0')
+        resolver.view = FakeView()
+        return resolver
+
+    def test_resolve(self):
+        """Test resolving and memoizing a key"""
+        resolver = self.get_resolver()
+        expected = (['dev-util/cmake'], 'portage', 'portage')
+        self.assertEqual(resolver.resolve('cmake'), expected)
+        self.assertEqual(resolver.resolve('cmake'), expected)
+        self.assertEqual(resolver.view.lookups, ['cmake'])
+        self.assertEqual(resolver.hits, 1)
+        self.assertEqual(resolver.misses, 1)
+
+    def test_unresolved(self):
+        """Test that unresolved keys are memoized too"""
+        resolver = self.get_resolver()
+        for _ in range(3):
+            with self.assertRaises(UnresolvedDependency):
+                resolver.resolve('fake_package')
+        self.assertEqual(resolver.view.lookups, ['fake_package'])
+        self.assertEqual(resolver.hits, 2)
+        self.assertEqual(resolver.misses, 1)
+
+    def test_resolve_many(self):
+        """Test resolving a batch of keys"""
+        resolver = self.get_resolver()
+        resolved, unresolved = resolver.resolve_many(
+            ['cmake', 'fake_package', 'cmake']
+        )
+        self.assertEqual(list(resolved.keys()), ['cmake'])
+        self.assertEqual(unresolved, ['fake_package'])
+        self.assertEqual(resolver.hits, 1)
+
+    def test_unknown_os(self):
+        """Test that nothing resolves for an unknown OS"""
+        resolver = RosdepResolver('Windoughs8', '')
+        with self.assertRaises(UnresolvedDependency):
+            resolver.resolve('cmake')
+        self.assertIsNone(resolver.view)
+
+    def test_store(self):
+        """Test keeping the results between runs"""
+        with TempfileManager(None) as tmp:
+            with mock.patch.dict(
+                os.environ, {'SUPERFLORE_CACHE_DIR': tmp}
+            ), mock.patch(
+                'superflore.rosdep_support.get_sources_fingerprint',
+                return_value='abc'
+            ):
+                resolver = self.get_resolver()
+                resolver.open_store()
+                resolver.resolve('cmake')
+                resolver.resolve_many(['fake_package'])
+                resolver.close_store()
+                # the next run doesn't need the view at all
+                resolver = RosdepResolver('gentoo', '2.4.0')
+                resolver.open_store()
+                self.assertEqual(
+                    resolver.resolve('cmake'),
+                    (['dev-util/cmake'], 'portage', 'portage')
+                )
+                with self.assertRaises(UnresolvedDependency):
+                    resolver.resolve('fake_package')
+                self.assertIsNone(resolver.view)
+                self.assertEqual(resolver.stored_hits, 2)
+                self.assertEqual(resolver.misses, 0)
+                resolver.close_store()
+
+    def test_get_resolver(self):
+        """Test that a resolver is created once per os and distro"""
+        with TempfileManager(None) as tmp, mock.patch.dict(
+            os.environ, {'SUPERFLORE_CACHE_DIR': tmp}
+        ), mock.patch.dict(resolvers, clear=True), mock.patch(
+            'superflore.rosdep_support.atexit.register'
+        ):
+            resolver = get_resolver('gentoo', '2.4.0')
+            self.assertIs(resolver, get_resolver('gentoo', '2.4.0', 'indigo'))
+            self.assertIsNot(
+                resolver, get_resolver('gentoo', '2.4.0', 'lunar')
+            )
+            for resolver in resolvers.values():
+                resolver.close_store()
+
+
+class TestViewSnapshot(unittest.TestCase):
+    def get_view(self, fingerprint):
+        """Get the view, with the rosdep sources hashing to fingerprint"""
+        view_cache.clear()
+        view = RosdepView('test')
+        view.rosdep_defs['cmake'] = FakeDefinition(['dev-util/cmake'])
+        with mock.patch(
+            'superflore.rosdep_support.get_sources_fingerprint',
+            return_value=fingerprint
+        ), mock.patch(
+            'superflore.rosdep_support.get_catkin_view', return_value=view
+        ) as catkin_view:
+            ret = get_view('gentoo', '2.4.0', 'lunar')
+        return ret, catkin_view.call_count
+
+    def test_snapshot(self):
+        """Test saving and loading the view snapshot"""
+        with TempfileManager(None) as tmp, mock.patch.dict(
+            os.environ, {'SUPERFLORE_CACHE_DIR': tmp}
+        ):
+            try:
+                view, built = self.get_view('abc')
+                self.assertEqual(built, 1)
+                snapshots = os.listdir('%s/rosdep' % tmp)
+                self.assertEqual(
+                    snapshots, ['view-gentoo-2.4.0-lunar-abc.pickle']
+                )
+                # the next run loads the snapshot instead
+                view, built = self.get_view('abc')
+                self.assertEqual(built, 0)
+                self.assertEqual(
+                    view.lookup('cmake').packages, ['dev-util/cmake']
+                )
+                # the sources changed, so the view is rebuilt
+                view, built = self.get_view('def')
+                self.assertEqual(built, 1)
+                snapshots = os.listdir('%s/rosdep' % tmp)
+                self.assertEqual(
+                    snapshots, ['view-gentoo-2.4.0-lunar-def.pickle']
+                )
+            finally:
+                view_cache.clear()
+
+    def test_no_sources(self):
+        """Test that no snapshot is made without rosdep sources"""
+        with TempfileManager(None) as tmp, mock.patch.dict(
+            os.environ, {'SUPERFLORE_CACHE_DIR': tmp}
+        ):
+            try:
+                self.assertEqual(self.get_view(None)[1], 1)
+                self.assertEqual(self.get_view(None)[1], 1)
+                self.assertEqual(os.listdir(tmp), [])
+            finally:
+                view_cache.clear()
@@ -0,0 +1,212 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import hashlib
+import os
+import threading
+from unittest import mock
+
+from superflore import rosdistro_snapshot
+from superflore.rosdistro_snapshot import download
+from superflore.rosdistro_snapshot import get_distro
+from superflore.rosdistro_snapshot import get_index
+from superflore.TempfileManager import TempfileManager
+from tests.http_server import ETagHandler
+from tests.http_server import ThreadingHTTPServer
+import unittest
+import yaml
+
+distribution_file = {
+    'type': 'distribution',
+    'version': 2,
+    'release_platforms': {'ubuntu': ['bionic']},
+    'repositories': {
+        'my_repo': {
+            'release': {
+                'packages': ['my_package'],
+                'url': 'https://github.com/ros-gbp/my_repo-release.git',
+                'version': '1.2.3-0',
+                'tags': {'release': 'release/lunar/{package}/{version}'},
+            },
+        },
+    },
+}
+
+
+class TestRosdistroSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp = TempfileManager(None)
+        tmp = self.tmp_dir = self.tmp.__enter__()
+        cache_url = 'file://' + os.path.join(tmp, 'lunar-cache.yaml.gz')
+        self.index_url = 'file://' + os.path.join(tmp, 'index-v4.yaml')
+        self.write('index-v4.yaml', yaml.dump({
+            'type': 'index',
+            'version': 4,
+            'distributions': {
+                'lunar': {
+                    'distribution': ['lunar/distribution.yaml'],
+                    'distribution_cache': cache_url,
+                },
+            },
+        }).encode())
+        self.write('lunar-cache.yaml.gz', gzip.compress(yaml.dump({
+            'type': 'cache',
+            'version': 2,
+            'name': 'lunar',
+            'distribution_file': [distribution_file],
+            'release_package_xmls': {'my_package': '<package/>'},
+        }).encode()))
+        self.patches = [
+            mock.patch.dict(os.environ, {
+                'ROSDISTRO_INDEX_URL': self.index_url,
+                'SUPERFLORE_CACHE_DIR': os.path.join(tmp, 'cache'),
+            }),
+            mock.patch.dict(rosdistro_snapshot._indices, clear=True),
+            mock.patch.dict(rosdistro_snapshot._distros, clear=True),
+            mock.patch.dict(rosdistro_snapshot._downloads, clear=True),
+            mock.patch(
+                'superflore.rosdistro_snapshot._download',
+                wraps=rosdistro_snapshot._download
+            ),
+        ]
+        self.download = [patch.start() for patch in self.patches][-1]
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.tmp.__exit__()
+
+    def write(self, name, data):
+        with open(os.path.join(self.tmp_dir, name), 'wb') as f:
+            f.write(data)
+
+    def forget(self):
+        rosdistro_snapshot._indices.clear()
+        rosdistro_snapshot._distros.clear()
+        rosdistro_snapshot._downloads.clear()
+
+    def test_memoized(self):
+        """Test that the index and distro are fetched once per run"""
+        distro = get_distro('lunar')
+        self.assertIs(get_distro('lunar'), distro)
+        self.assertIs(get_index(), get_index(self.index_url))
+        self.assertEqual(self.download.call_count, 2)
+        self.assertEqual(list(distro.release_packages), ['my_package'])
+        self.assertIn(
+            '<package/>', distro.get_release_package_xml('my_package')
+        )
+        with self.assertRaises(RuntimeError):
+            get_distro('not_a_distro')
+
+    def test_snapshot(self):
+        """Test that unchanged files are not parsed again"""
+        get_distro('lunar')
+        self.forget()
+        with mock.patch('yaml.load') as load:
+            distro = get_distro('lunar')
+        self.assertFalse(load.called)
+        self.assertEqual(list(distro.release_packages), ['my_package'])
+        # but changed ones are
+        data = dict(distribution_file)
+        data['repositories'] = dict(data['repositories'])
+        data['repositories']['other_repo'] = {
+            'release': {
+                'packages': ['other_package'],
+                'url': 'https://github.com/ros-gbp/other_repo-release.git',
+                'version': '0.1.0-1',
+                'tags': {'release': 'release/lunar/{package}/{version}'},
+            },
+        }
+        self.write('lunar-cache.yaml.gz', gzip.compress(yaml.dump({
+            'type': 'cache',
+            'version': 2,
+            'name': 'lunar',
+            'distribution_file': [data],
+            'release_package_xmls': {},
+        }).encode()))
+        self.forget()
+        self.assertEqual(
+            sorted(get_distro('lunar').release_packages),
+            ['my_package', 'other_package']
+        )
+        # with the snapshot of the old file removed
+        snapshots = os.listdir(
+            os.path.join(self.tmp_dir, 'cache', 'rosdistro')
+        )
+        self.assertEqual(len(snapshots), 2)
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        ETagHandler.files = {'/index-v4.yaml': b'type: index\n'}
+        ETagHandler.etags = True
+        ETagHandler.requests = list()
+        self.tmp = TempfileManager(None)
+        tmp = self.tmp.__enter__()
+        self.patches = [
+            mock.patch.dict(os.environ, {
+                'SUPERFLORE_CACHE_DIR': os.path.join(tmp, 'cache')
+            }),
+            mock.patch.dict(rosdistro_snapshot._downloads, clear=True),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ETagHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/index-v4.yaml' % (
+            self.server.server_address[1]
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.tmp.__exit__()
+
+    def download(self):
+        """Download the index, as a new run would"""
+        rosdistro_snapshot._downloads.clear()
+        path, digest = download(self.url)
+        with open(path, 'rb') as f:
+            return f.read(), digest
+
+    def test_conditional(self):
+        """Test that an unchanged file is not downloaded again"""
+        self.assertEqual(
+            self.download(),
+            (b'type: index\n', hashlib.sha256(b'type: index\n').hexdigest())
+        )
+        path, _ = download(self.url)
+        self.assertEqual(len(ETagHandler.requests), 1)
+        mtime = os.stat(path).st_mtime_ns
+        self.assertEqual(self.download()[0], b'type: index\n')
+        self.assertEqual(os.stat(path).st_mtime_ns, mtime)
+        self.assertIsNone(ETagHandler.requests[0][1])
+        self.assertIsNotNone(ETagHandler.requests[1][1])
+        # a new file is downloaded
+        ETagHandler.files['/index-v4.yaml'] = b'type: index\nversion: 4\n'
+        self.assertEqual(self.download()[0], b'type: index\nversion: 4\n')
+
+    def test_local_changes(self):
+        """Test that a modified local copy is downloaded again"""
+        self.download()
+        path, _ = download(self.url)
+        with open(path, 'wb') as f:
+            f.write(b'edited')
+        self.assertEqual(self.download()[0], b'type: index\n')
+        self.assertIsNone(ETagHandler.requests[1][1])
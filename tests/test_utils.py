@@ -20,6 +20,7 @@ from superflore.exceptions import UnknownLicense
 from superflore.exceptions import UnknownPlatform
 from superflore.TempfileManager import TempfileManager
 from superflore.utils import clean_up
+from superflore.utils import file_has_text
 from superflore.utils import gen_delta_msg
 from superflore.utils import get_license
 from superflore.utils import gen_missing_deps_msg
@@ -28,8 +29,10 @@ from superflore.utils import make_dir
 from superflore.utils import rand_ascii_str
 from superflore.utils import resolve_dep
 from superflore.utils import sanitize_string
+from superflore.utils import split_shards
 from superflore.utils import trim_string
 from superflore.utils import url_to_repo_org
+from superflore.utils import write_if_changed
 
 import unittest
 
@@ -122,6 +125,38 @@ class TestUtils(unittest.TestCase):
         with self.assertRaises(UnknownLicense):
             ret = get_license('TODO')
 
+    def test_get_license_memoized(self):
+        """Test that repeated license lookups give the same result"""
+        for _ in range(2):
+            self.assertEqual(get_license('Apache 2.0'), 'Apache-2.0')
+            self.assertEqual(get_license('GNU GPLv3'), 'GPL-3')
+            with self.assertRaises(UnknownLicense):
+                get_license('TODO')
+
+    def test_write_if_changed(self):
+        """Test only writing files whose content changed"""
+        with TempfileManager(None) as tmp:
+            name = os.path.join(tmp, 'test.ebuild')
+            self.assertFalse(file_has_text(name, 'text'))
+            self.assertTrue(write_if_changed(name, 'text'))
+            self.assertTrue(file_has_text(name, 'text'))
+            mtime = os.stat(name).st_mtime_ns
+            self.assertFalse(write_if_changed(name, 'text'))
+            self.assertEqual(os.stat(name).st_mtime_ns, mtime)
+            self.assertFalse(file_has_text(name, 'texT'))
+            self.assertTrue(write_if_changed(name, 'texT'))
+            with open(name, 'r') as f:
+                self.assertEqual(f.read(), 'texT')
+
+    def test_split_shards(self):
+        """Test splitting work into shards"""
+        self.assertEqual(
+            split_shards(list(range(7)), 3), [[0, 3, 6], [1, 4], [2, 5]]
+        )
+        self.assertEqual(split_shards([1, 2], 4), [[1], [2]])
+        self.assertEqual(split_shards([1, 2], 0), [[1, 2]])
+        self.assertEqual(split_shards([], 4), [])
+
     def test_delta_msg(self):
         """Test the delta message generated for the PR"""
         self.set_lang_env()
@@ -140,6 +175,13 @@ class TestUtils(unittest.TestCase):
                  '* foo\n\n'
         got = gen_delta_msg(total_changes)
         self.assertEqual(expect, got)
+        # packages left unchanged are counted separately
+        total_unchanged = {'hydro': ['qux', 'quux'], 'C': []}
+        expect += 'Unchanged:\n'\
+                  '==========\n'\
+                  '* Hydro: 2 packages\n\n'
+        got = gen_delta_msg(total_changes, total_unchanged)
+        self.assertEqual(expect, got)
 
     def test_missing_deps_msg(self):
         """Test the missing dependencies list"""
@@ -0,0 +1,200 @@
+# Copyright 2019 Open Source Robotics Foundation, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import hashlib
+import io
+import os
+import tarfile
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+from superflore import rosdistro_snapshot
+from superflore.generators.bitbake.yocto_recipe import yoctoRecipe
+from superflore.PackageXmlStore import get_package_xml_store
+from superflore.TempfileManager import TempfileManager
+from tests.http_server import ETagHandler
+from tests.http_server import ThreadingHTTPServer
+import unittest
+
+released_package_xml = '''<?xml version="1.0"?>
+<!-- dropped from the distribution cache -->
+<package format="2">
+  <name>my_package</name>
+  <version>1.2.3</version>
+  <description>My package</description>
+  <license>BSD</license>
+  <maintainer email="me@example.com">Me</maintainer>
+</package>
+'''
+license_md5 = hashlib.md5(b'  <license>BSD</license>\n').hexdigest()
+# as rosdistro sanitizes it in the distribution cache
+cached_package_xml = (
+    '<?xml version="1.0" encoding="utf-8"?><package format="2">'
+    '<name>my_package</name><version>1.2.3</version>'
+    '<description>My package</description><license>BSD</license>'
+    '<maintainer email="me@example.com">Me</maintainer></package>'
+)
+src_uri = (
+    'https://github.com/ros-gbp/my_repo-release/archive/'
+    'release/lunar/my_package/1.2.3-0.tar.gz'
+)
+
+
+class TestDistroCache(unittest.TestCase):
+    def setUp(self):
+        self.content = b'type: cache\n' * 10000
+        ETagHandler.files = {'/lunar-cache.yaml.gz': gzip.compress(
+            self.content
+        )}
+        ETagHandler.requests = list()
+        self.tmp = TempfileManager(None)
+        tmp = self.tmp.__enter__()
+        self.patches = [
+            mock.patch.dict(os.environ, {
+                'SUPERFLORE_CACHE_DIR': os.path.join(tmp, 'cache')
+            }),
+            mock.patch.dict(rosdistro_snapshot._downloads, clear=True),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.path = os.path.join(tmp, 'lunar-cache.yaml')
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ETagHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/lunar-cache.yaml.gz' % (
+            self.server.server_address[1]
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.tmp.__exit__()
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_download(self):
+        """Test that the cache is decompressed, and only written if new"""
+        self.assertTrue(yoctoRecipe.download_distro_cache(self.url, self.path))
+        self.assertEqual(self.read(), self.content)
+        mtime = os.stat(self.path).st_mtime_ns
+        self.assertFalse(
+            yoctoRecipe.download_distro_cache(self.url, self.path)
+        )
+        self.assertEqual(os.stat(self.path).st_mtime_ns, mtime)
+        # without leaving the partial file behind
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(self.path))),
+            ['cache', 'lunar-cache.yaml']
+        )
+
+    def test_shared_download(self):
+        """Test that the download the distro was read from is reused"""
+        rosdistro_snapshot.download(self.url)
+        yoctoRecipe.download_distro_cache(self.url, self.path)
+        self.assertEqual(self.read(), self.content)
+        self.assertEqual(len(ETagHandler.requests), 1)
+
+    def test_local_changes(self):
+        """Test that a modified copy is written again"""
+        yoctoRecipe.download_distro_cache(self.url, self.path)
+        with open(self.path, 'wb') as f:
+            f.write(b'edited')
+        self.assertTrue(yoctoRecipe.download_distro_cache(self.url, self.path))
+        self.assertEqual(self.read(), self.content)
+
+
+class FakeArchiveStore(object):
+    """Hands out the archive at path, filling the digest caches."""
+    def __init__(self, path):
+        self.path = path
+
+    def get(self, url, caches):
+        caches['md5'][self.path] = 'md5'
+        caches['sha256'][self.path] = 'sha256'
+        return self.path
+
+
+class FakeRosPackage(object):
+    def __init__(self, pkg_name, repo):
+        pass
+
+    def get_package_xml(self, dist_name):
+        return released_package_xml.encode()
+
+
+@mock.patch('superflore.PackageXmlStore.RosPackage', FakeRosPackage)
+class TestRecipeText(unittest.TestCase):
+    def setUp(self):
+        self.tmp = TempfileManager(None)
+        self.tmp_dir = self.tmp.__enter__()
+        self.distro = SimpleNamespace(
+            name='lunar',
+            release_packages={
+                'my_package': SimpleNamespace(repository_name='my_repo'),
+            },
+            repositories={
+                'my_repo': SimpleNamespace(
+                    release_repository=SimpleNamespace(version='1.2.3-0')
+                ),
+            },
+            get_release_package_xml=lambda pkg_name: cached_package_xml,
+        )
+
+    def tearDown(self):
+        self.tmp.__exit__()
+
+    def get_recipe_text(self, archive):
+        recipe = yoctoRecipe(
+            'my_repo', 1, 'my_package',
+            get_package_xml_store(self.distro).get('my_package'),
+            self.distro, src_uri, FakeArchiveStore(archive), dict(), dict(),
+            []
+        )
+        return recipe.get_recipe_text('Open Source Robotics Foundation', 'BSD')
+
+    def write_archive(self):
+        archive = os.path.join(self.tmp_dir, 'archive')
+        data = released_package_xml.encode()
+        with tarfile.open(archive, 'w:gz') as tar:
+            info = tarfile.TarInfo(
+                'my_repo-release-release-lunar-my_package-1.2.3-0/package.xml'
+            )
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        return archive
+
+    def assertLicenseLine(self, text):
+        self.assertIn(
+            'LIC_FILES_CHKSUM = "file://package.xml;beginline=7;endline=7;'
+            'md5=%s"' % license_md5, text
+        )
+
+    def test_from_archive(self):
+        """Test the license line of the package.xml in the archive"""
+        text = self.get_recipe_text(self.write_archive())
+        self.assertLicenseLine(text)
+        self.assertIn('DESCRIPTION = "My package"', text)
+        self.assertIn('LICENSE = "BSD"', text)
+
+    def test_from_release_repository(self):
+        """Test the license line of the released package.xml"""
+        text = self.get_recipe_text(os.path.join(self.tmp_dir, 'missing'))
+        self.assertLicenseLine(text)